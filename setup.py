@@ -21,6 +21,13 @@ setup(
         "langchain>=0.0.113",
         "click>=8.1"
     ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "parquet": ["pyarrow"],
+        "jobs": ["pyyaml"],
+        "local": ["transformers", "torch"],
+        "llama": ["llama-cpp-python"],
+    },
     entry_points={
         "console_scripts": [
             "datasetGPT=datasetGPT:datasetGPT"
@@ -1,4 +1,63 @@
-from .cli import datasetGPT
-from .conversations import *
-from .texts import *
-from .outputs import *
+import importlib
+
+from typing import Any
+
+LAZY_ATTRIBUTES = {
+    "datasetGPT": ".cli",
+    "DatasetGenerator": ".base",
+    "ConversationsGenerator": ".conversations",
+    "ConversationsGeneratorConfig": ".conversations",
+    "Conversation": ".conversations",
+    "TextsGenerator": ".texts",
+    "TextsGeneratorConfig": ".texts",
+    "OPTIONS_CONFIG_KEYS": ".texts",
+    "GENERATOR_CONFIG_KEYS": ".texts",
+    "DatasetWriter": ".outputs",
+    "OUTPUT_FORMATS": ".outputs",
+    "COMPRESSION_EXTENSIONS": ".outputs",
+    "COMPRESSION_MAGIC_NUMBERS": ".outputs",
+    "open_reader": ".outputs",
+    "detect_output_options": ".outputs",
+    # Names the package used to re-export through star imports of its modules.
+    "ChatPromptTemplate": "langchain.prompts",
+    "HumanMessagePromptTemplate": "langchain.prompts",
+    "MessagesPlaceholder": "langchain.prompts",
+    "SystemMessagePromptTemplate": "langchain.prompts",
+    "PromptTemplate": "langchain.prompts",
+    "ConversationChain": "langchain.chains",
+    "LLMChain": "langchain.chains",
+    "ChatOpenAI": "langchain.chat_models",
+    "ConversationBufferMemory": "langchain.memory",
+    "SystemMessage": "langchain.schema",
+    "BaseLLM": "langchain.llms",
+    "json": ".outputs",
+    "os": ".outputs",
+    "uuid4": "uuid",
+    "dataclass": "dataclasses",
+    "field": "dataclasses",
+    "Any": "typing",
+    "Dict": "typing",
+    "List": "typing",
+    "Tuple": "typing",
+    "Union": "typing",
+}
+"""Public names by the module defining them, relative to the package when starting with a dot.
+Modules are imported on first access, so that commands only pay for the dependencies they use,
+most notably langchain."""
+
+__all__ = list(LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    """Import the module of a public name on first access."""
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> Any:
+    """List the public names, including the ones not imported yet."""
+    return sorted([*globals(), *__all__])
@@ -0,0 +1,292 @@
+import threading
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Optional
+
+from .ratelimit import RateLimiter
+from .router import Endpoint, Router, RoutedLLM, parse_endpoint
+
+if TYPE_CHECKING:
+    from langchain.llms import BaseLLM
+
+MULTI_COMPLETION_BACKENDS = ["openai", "mock", "local"]
+"""Backends able to generate several completions of a prompt with one request."""
+
+
+@dataclass
+class Generation:
+    text: str
+    """Text of a completion."""
+
+
+@dataclass
+class GenerationResult:
+    generations: List[List[Generation]]
+    """Completions of each prompt."""
+    llm_output: Dict[str, Any]
+    """Token usage in the format of the OpenAI API."""
+
+
+class BackendRegistry:
+    """Cache of LLM clients shared by all dataset items of a process."""
+
+    pool_size: int
+    """Maximum number of keep-alive HTTP connections kept open per host."""
+    clients: Dict[Hashable, Any]
+    """Initialized clients by their parameters."""
+    rate_limiters: Dict[str, RateLimiter]
+    """Rate limiters by "backend|model" string."""
+    routers: Dict[str, Router]
+    """Routers by the logical backend name they serve."""
+
+    def __init__(self, pool_size: int = 64) -> None:
+        """Initialize BackendRegistry."""
+        self.pool_size = pool_size
+        self.clients = {}
+        self.rate_limiters = {}
+        self.routers = {}
+        self.session = None
+        # Reentrant, because creating a local LLM also gets its shared model from the registry.
+        self.lock = threading.RLock()
+
+    def get_or_create(self, key: Hashable, factory) -> Any:
+        """Get a cached client or create it once."""
+        client = self.clients.get(key)
+        if client is not None:
+            return client
+
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = factory()
+                self.clients[key] = client
+
+        return client
+
+    def get_rate_limiter(
+        self,
+        backend_str: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
+    ) -> RateLimiter:
+        """Get the rate limiter shared by all requests to a backend. Limits are set when it is first requested."""
+        with self.lock:
+            rate_limiter = self.rate_limiters.get(backend_str)
+            if rate_limiter is None:
+                rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+                self.rate_limiters[backend_str] = rate_limiter
+
+        return rate_limiter
+
+    def add_router(
+        self,
+        name: str,
+        specs: List[str],
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None
+    ) -> Router:
+        """Serve a logical backend name with a pool of endpoints. Generators declaring the same pool share its router."""
+        endpoints = [parse_endpoint(spec) for spec in specs]
+        with self.lock:
+            router = self.routers.get(name)
+            if router is not None and router.endpoints != endpoints:
+                raise ValueError(f"The backend {name} is already served by other endpoints.")
+            if router is None:
+                router = Router(name, endpoints, requests_per_minute, tokens_per_minute)
+                self.routers[name] = router
+
+        return router
+
+    def supports_multiple_completions(self, backend_str: str) -> bool:
+        """Check whether every endpoint of a backend can generate several completions of a prompt with one request."""
+        router = self.routers.get(backend_str)
+        if router is not None:
+            return all(endpoint.backend in MULTI_COMPLETION_BACKENDS for endpoint in router.endpoints)
+
+        return backend_str.split("|")[0].lower() in MULTI_COMPLETION_BACKENDS
+
+    def validate_chat_model(self, model: str) -> None:
+        """Check that a chat model is an OpenAI model name, a "mock|<profile>" model or a logical backend."""
+        if model in self.routers or "|" not in model:
+            return
+
+        backend, _, profile = model.partition("|")
+        if backend.lower() != "mock":
+            raise ValueError(f"Unsupported chat model: {model}. Use an OpenAI chat model name, "
+                             "\"mock|<profile>\" or the name of a backend defined with --endpoint.")
+
+        from .mock import parse_mock_profile
+        parse_mock_profile(profile)
+
+    def get_priced_backend(self, backend_str: str) -> str:
+        """Get the "backend|model" string pricing the requests to a backend, using the first endpoint of a router."""
+        router = self.routers.get(backend_str)
+        return backend_str if router is None else router.endpoints[0].backend_str
+
+    def share_http_session(self) -> None:
+        """Make the openai package reuse one pool of keep-alive HTTP connections from all threads."""
+        if self.session is not None:
+            return
+
+        try:
+            import openai
+            import requests
+        except ImportError:
+            return
+
+        if not hasattr(openai, "requestssession"):
+            return
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                pool_maxsize=self.pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        openai.requestssession = session
+        self.session = session
+
+    def get_llm(self, backend_str: str, temperature: float, max_length: int, n: int = 1) -> "BaseLLM":
+        """Get a completion LLM for a "backend|model" string and generation parameters.
+
+        `n` is the number of completions generated for each prompt and is only supported by MULTI_COMPLETION_BACKENDS.
+        Logical backends served by a router send each request to one of their endpoints.
+        """
+        router = self.routers.get(backend_str)
+        if router is not None:
+            key = ("routed_llm", backend_str, temperature, max_length, n)
+            return self.get_or_create(key, lambda: RoutedLLM(router, self, temperature, max_length, n))
+
+        backend, model = backend_str.split("|")
+        key = ("llm", backend.lower(), model, temperature, max_length, n)
+
+        return self.get_or_create(key, lambda: self.create_llm(backend.lower(), model, temperature, max_length, n))
+
+    def get_endpoint_llm(self, endpoint: Endpoint, temperature: float, max_length: int, n: int = 1) -> "BaseLLM":
+        """Get the completion LLM of an endpoint of a router."""
+        key = ("llm", endpoint, temperature, max_length, n)
+        return self.get_or_create(key, lambda: self.create_llm(endpoint.backend,
+                                                               endpoint.model,
+                                                               temperature,
+                                                               max_length,
+                                                               n,
+                                                               endpoint.api_key,
+                                                               endpoint.api_base))
+
+    def create_llm(
+        self,
+        backend: str,
+        model: str,
+        temperature: float,
+        max_length: int,
+        n: int = 1,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None
+    ) -> "BaseLLM":
+        """Initialize a specific LLM. Backend packages, including langchain, are imported on first use.
+
+        The API key and base URL of an endpoint only apply to the openai backend.
+        """
+        if n > 1 and backend not in MULTI_COMPLETION_BACKENDS:
+            raise ValueError(f"The {backend} backend cannot generate multiple completions per request.")
+
+        if backend == "openai":
+            from langchain.llms import OpenAI
+            self.share_http_session()
+            endpoint_params = {}
+            if api_key is not None:
+                endpoint_params["openai_api_key"] = api_key
+            if api_base is not None:
+                endpoint_params["openai_api_base"] = api_base
+            # Retries are handled by the generators, which also adapt their concurrency to throttling.
+            llm = OpenAI(model_name=model,
+                         temperature=temperature,
+                         max_tokens=max_length,
+                         n=n,
+                         best_of=n,
+                         max_retries=0,
+                         **endpoint_params)
+        elif backend == "mock":
+            from .mock import MockLLM, parse_mock_profile
+            llm = MockLLM(profile=parse_mock_profile(model),
+                          max_tokens=max_length,
+                          n=n)
+        elif backend == "local":
+            from .local import LocalLLM
+            llm = LocalLLM(model=self.get_local_model(model),
+                           temperature=temperature,
+                           max_tokens=max_length,
+                           n=n)
+        elif backend == "cohere":
+            from langchain.llms import Cohere
+            llm = Cohere(model=model,
+                         temperature=temperature,
+                         max_tokens=max_length)
+        elif backend == "petals":
+            from langchain.llms import Petals
+            llm = Petals(model_name=model,
+                         temperature=temperature,
+                         max_new_tokens=max_length)
+        else:
+            raise ValueError("Cannot use the specified backend.")
+
+        return llm
+
+    def get_local_model(self, path: str) -> Any:
+        """Get a local model, loading it once per process."""
+        from .local import load_local_model
+        return self.get_or_create(("local_model", path), lambda: load_local_model(path))
+
+    def get_local_models(self) -> List[Any]:
+        """Get the local models loaded so far."""
+        return [client for key, client in self.clients.items() if key[0] == "local_model"]
+
+    def get_chat_model(
+        self,
+        model: str,
+        temperature: float,
+        openai_api_key: Optional[str] = None,
+        streaming: bool = False,
+        openai_api_base: Optional[str] = None
+    ):
+        """Get a chat model with the given generation parameters.
+
+        OpenAI models are given by name. Offline mock models use the "mock|<profile>" notation, and logical
+        backends served by a router send each request to one of their endpoints.
+        Streaming models send each token to the callbacks of a request as soon as it is generated.
+        """
+        router = self.routers.get(model)
+        if router is not None:
+            from .routedchat import RoutedChatModel
+            key = ("routed_chat", model, temperature, openai_api_key, streaming)
+            return self.get_or_create(key, lambda: RoutedChatModel(router=router,
+                                                                   backends=self,
+                                                                   temperature=temperature,
+                                                                   openai_api_key=openai_api_key,
+                                                                   streaming=streaming))
+
+        key = ("chat", model, temperature, openai_api_key, streaming, openai_api_base)
+
+        def create_chat_model():
+            if model.startswith("mock|"):
+                from .mock import parse_mock_profile
+                from .mockchat import MockChatModel
+                return MockChatModel(profile=parse_mock_profile(model.split("|", 1)[1]), streaming=streaming)
+
+            from langchain.chat_models import ChatOpenAI
+            self.share_http_session()
+            endpoint_params = {}
+            if openai_api_base is not None:
+                endpoint_params["openai_api_base"] = openai_api_base
+            return ChatOpenAI(temperature=temperature,
+                              openai_api_key=openai_api_key,
+                              model=model,
+                              streaming=streaming,
+                              max_retries=0,
+                              **endpoint_params)
+
+        return self.get_or_create(key, create_chat_model)
+
+
+backend_registry = BackendRegistry()
+"""Registry shared by the generators of the current process."""
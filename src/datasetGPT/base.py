@@ -1,10 +1,46 @@
+import json
+import time
+import asyncio
+import hashlib
+import contextvars
 import itertools
-from typing import List, Any, Dict, Tuple, Generator, Iterator, Protocol
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Dict, Tuple, Generator, Iterator, AsyncIterator, Callable, Optional, Protocol, Sequence, Set, Union
+
+from .cache import ResponseCache
+from .backends import BackendRegistry, backend_registry
+from .costs import Budget, UsageEstimate, get_cost, split_usage
+from .sampling import sample_options
+from .router import served_endpoint
+from .ratelimit import AIMDController, PrioritySlotPool, RetryPolicy, is_retryable, is_throttling
+from .telemetry import Instrumentation, ItemMetrics, LLMCallMetrics
+from .tokens import count_tokens
 
 OPTIONS_CONFIG_KEYS = ["temperature"]
 GENERATOR_CONFIG_KEYS =  ["temperatures"]
 
 
+def count_completion_tokens(result: Any) -> int:
+    """Count the completion tokens of a backend response, preferring the usage reported by the backend."""
+    if isinstance(result, str):
+        return count_tokens(result)
+
+    token_usage = (getattr(result, "llm_output", None) or {}).get("token_usage") or {}
+    if "completion_tokens" in token_usage:
+        return token_usage["completion_tokens"]
+
+    return sum(count_tokens(generation.text)
+               for generations in getattr(result, "generations", [])
+               for generation in generations)
+
+
+def count_prompt_tokens(result: Any, prompt_tokens: int) -> int:
+    """Get the prompt tokens reported by the backend, falling back to the local count."""
+    token_usage = (getattr(result, "llm_output", None) or {}).get("token_usage") or {}
+    return token_usage.get("prompt_tokens", prompt_tokens)
+
+
 class DatasetGeneratorConfig(Protocol):
     """Base generator configuration protocol."""
     openai_api_key: str
@@ -13,6 +49,103 @@ class DatasetGeneratorConfig(Protocol):
     """Number of texts to generate for each options combination."""
     options: List[Tuple[str, str]]
     """Additional options defined in the text prompt with curly brackets."""
+    cache_path: Optional[str]
+    """Path of a persistent response cache. Responses are not cached if unset."""
+    cache_max_size: int
+    """Maximum size of the response cache in bytes."""
+    requests_per_minute: Optional[float]
+    """Maximum number of requests per minute sent to each backend."""
+    tokens_per_minute: Optional[float]
+    """Maximum number of prompt and completion tokens per minute sent to each backend."""
+    max_retries: int
+    """Maximum number of times a request failing with a transient error is retried."""
+    adaptive_concurrency: bool
+    """Whether to reduce the number of concurrent items when backends throttle requests."""
+    max_cost: Optional[float]
+    """Cost in USD after which no new items are started."""
+    max_tokens: Optional[int]
+    """Number of prompt and completion tokens after which no new items are started."""
+    sampling: str
+    """Selection of the options combinations: "grid", "random", "stratified" or "cover"."""
+    sample_size: Optional[int]
+    """Number of options combinations drawn by the sampling strategies, or the maximum for "cover"."""
+    cover_k: int
+    """Number of times each option value appears with the "cover" sampling strategy."""
+    seed: int
+    """Seed of the sampling strategies."""
+    endpoints: List[Tuple[str, str]]
+    """Interchangeable endpoints serving a logical backend name, as (name, "backend|model|key=value") pairs."""
+
+
+class OptionsCombinations(Sequence):
+    """Lazy cartesian product of option values addressed by index.
+
+    Combinations are ordered like `itertools.product` over the keys in `order`, so its last key varies fastest.
+    A combination is decoded from its index as a mixed-radix number instead of being stored.
+    """
+
+    keys: List[str]
+    """Names of the options."""
+    values: List[Sequence[Any]]
+    """Possible values of each option."""
+    order: List[str]
+    """Names of the options from the slowest to the fastest varying one."""
+    strides: List[int]
+    """Number of combinations between consecutive values of each option."""
+
+    def __init__(self, keys: List[str], values: List[Sequence[Any]], order: Optional[List[str]] = None) -> None:
+        """Initialize OptionsCombinations."""
+        self.keys = keys
+        self.values = values
+        self.order = order or list(keys)
+
+        self.strides = [1] * len(values)
+        stride = 1
+        for key in reversed(self.order):
+            position = keys.index(key)
+            self.strides[position] = stride
+            stride *= len(values[position])
+
+        self.size = stride
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.size))]
+
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("Options combination index out of range.")
+
+        return {key: values[(index // stride) % len(values)]
+                for key, values, stride in zip(self.keys, self.values, self.strides)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        if self.order == self.keys:
+            for combination in itertools.product(*self.values):
+                yield dict(zip(self.keys, combination))
+            return
+
+        ordered_values = [self.values[self.keys.index(key)] for key in self.order]
+        for combination in itertools.product(*ordered_values):
+            ordered_combination = dict(zip(self.order, combination))
+            yield {key: ordered_combination[key] for key in self.keys}
+
+    def fingerprint(self) -> str:
+        """Get a hash identifying the options, their values and their order."""
+        serialized = json.dumps([self.keys, [list(values) for values in self.values], self.order], default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def shard(self, shard_index: int, num_shards: int) -> range:
+        """Get a contiguous range of combination indices assigned to a shard."""
+        if num_shards < 1 or not 0 <= shard_index < num_shards:
+            raise ValueError(f"Invalid shard {shard_index}/{num_shards}.")
+
+        return range(self.size * shard_index // num_shards,
+                     self.size * (shard_index + 1) // num_shards)
 
 
 class DatasetGenerator:
@@ -20,14 +153,67 @@ class DatasetGenerator:
 
     config: DatasetGeneratorConfig
     """Generator configuration."""
-    options_configs: List[Dict[str, Any]]
+    options_configs: OptionsCombinations
     """Possible combinations of the provided options."""
+    indices: Sequence[int]
+    """Indices of the options combinations to produce, in order. All combinations unless a shard is selected."""
     generator_index: int = 0
-    """Index of the next item to be returned by the generator."""
+    """Position in `indices` of the next item to be returned by the generator."""
+    completed_indices: Set[int]
+    """Indices of options combinations to skip because their items already exist."""
+    attempts: Dict[int, int]
+    """Number of times the item of an options combination was requested again, for example to replace a duplicate."""
+    executor: Optional[ThreadPoolExecutor] = None
+    """Thread pool running blocking LLM calls during asynchronous generation."""
+    cache: Optional[ResponseCache] = None
+    """Persistent cache of LLM responses."""
+    backends: BackendRegistry
+    """Registry providing shared LLM clients and rate limiters."""
+    retry_policy: RetryPolicy
+    """Backoff schedule of failed requests."""
+    concurrency_controller: Optional[AIMDController] = None
+    """Controller adapting the number of items in flight during asynchronous generation."""
+    instrumentation: Instrumentation
+    """Recorder of per-item timings, token usage and errors."""
+    slot_pool: Optional[PrioritySlotPool] = None
+    """Slots for items in flight shared with other generators running in the same event loop."""
+    priority: int = 0
+    """Priority of the generator when it competes for shared slots. Higher values go first."""
+    budget: Optional[Budget] = None
+    """Token and cost limits. New items are not started once they are reached."""
 
-    def __init__(self, config: DatasetGeneratorConfig) -> None:
+    def __init__(self, config: DatasetGeneratorConfig, backends: BackendRegistry = backend_registry) -> None:
         self.config = config
+        self.backends = backends
+        self.retry_policy = RetryPolicy(config.max_retries)
+        self.instrumentation = Instrumentation()
+        self.completed_indices = set()
+        self.attempts = {}
+        self.requeued = deque()
+        self.initialize_routers()
         self.initialize_options_configs()
+        self.indices = sample_options(self.options_configs,
+                                      config.sampling,
+                                      config.sample_size,
+                                      config.cover_k,
+                                      config.seed)
+
+        if config.cache_path:
+            self.cache = ResponseCache(config.cache_path, config.cache_max_size)
+        if config.max_cost is not None or config.max_tokens is not None:
+            self.budget = Budget(config.max_cost, config.max_tokens)
+
+    def initialize_routers(self) -> None:
+        """Serve each logical backend name with its pool of endpoints. Their quotas default to the generator limits."""
+        specs: Dict[str, List[str]] = {}
+        for name, spec in self.config.endpoints:
+            specs.setdefault(name, []).append(spec)
+
+        for name, endpoint_specs in specs.items():
+            self.backends.add_router(name,
+                                     endpoint_specs,
+                                     self.config.requests_per_minute,
+                                     self.config.tokens_per_minute)
 
     def initialize_options_configs(
         self,
@@ -48,15 +234,261 @@ class DatasetGenerator:
                 if option[1] not in options_values[index]:
                     options_values[index].append(option[1])
 
-        self.options_configs = list(map(lambda x: dict(zip(options_keys, x)),
-                                        itertools.product(*options_values)))
+        self.options_configs = OptionsCombinations(options_keys,
+                                                   options_values,
+                                                   self.get_options_order(options_keys))
 
-    def generate_item(self) -> Dict[str, Any]:
-        """Produce a data item."""
+    def get_options_order(self, options_keys: List[str]) -> List[str]:
+        """Order options from the slowest to the fastest varying one when iterating over combinations."""
+        return options_keys
+
+    def select_shard(self, shard_index: int, num_shards: int) -> None:
+        """Only produce the options combinations assigned to one of `num_shards` independent workers.
+
+        Shards take contiguous parts of the selected combinations, so sampled runs are split evenly too.
+        """
+        shard = self.options_configs.shard(shard_index, num_shards)
+        if not isinstance(self.indices, range):
+            shard = self.indices[len(self.indices) * shard_index // num_shards:
+                                 len(self.indices) * (shard_index + 1) // num_shards]
+        self.indices = shard
+        self.generator_index = 0
+
+    def call_backend(
+        self,
+        backend_str: str,
+        prompt_tokens: int,
+        max_completion_tokens: int,
+        func: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any
+    ) -> Any:
+        """Send a request to a backend within its rate limits, retrying transient errors with backoff.
+
+        Requests to a logical backend are limited by the quota of the endpoint its router picks, and are priced
+        and recorded as requests to that endpoint.
+        """
+        rate_limiter = None
+        if backend_str not in self.backends.routers:
+            rate_limiter = self.backends.get_rate_limiter(backend_str,
+                                                          self.config.requests_per_minute,
+                                                          self.config.tokens_per_minute)
+        start = time.perf_counter()
+
+        for attempt in itertools.count():
+            if rate_limiter is not None:
+                rate_limiter.acquire(prompt_tokens + max_completion_tokens)
+            served_endpoint.set(None)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                if not is_retryable(error) or attempt >= self.retry_policy.max_retries:
+                    raise
+                if is_throttling(error) and self.concurrency_controller is not None:
+                    self.concurrency_controller.on_throttle()
+
+                time.sleep(self.retry_policy.get_delay(attempt))
+            else:
+                if self.concurrency_controller is not None:
+                    self.concurrency_controller.on_success()
+
+                endpoint = served_endpoint.get()
+                if endpoint is not None:
+                    backend_str = endpoint.backend_str
+
+                used_prompt_tokens = count_prompt_tokens(result, prompt_tokens)
+                completion_tokens = count_completion_tokens(result)
+                if self.budget is not None:
+                    cost = self.budget.charge(backend_str, used_prompt_tokens, completion_tokens)
+                else:
+                    cost = get_cost(backend_str, used_prompt_tokens, completion_tokens)
+
+                self.instrumentation.record_llm_call(LLMCallMetrics(backend=backend_str,
+                                                                    seconds=time.perf_counter() - start,
+                                                                    prompt_tokens=used_prompt_tokens,
+                                                                    completion_tokens=completion_tokens,
+                                                                    retries=attempt,
+                                                                    cost=cost))
+                return result
+
+    def generate_item_from_config(self, options_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Produce a data item for a given options combination."""
         return {}
 
+    def estimate_item_usage(self, options_config: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+        """Estimate the backend, prompt tokens and maximum completion tokens of each request of an item."""
+        return []
+
+    def get_backends(self) -> List[str]:
+        """Get the backends receiving the requests of the generator, which key their rate limiters."""
+        return []
+
+    def estimate_usage(self, sample_size: int = 1000) -> UsageEstimate:
+        """Estimate the usage of the remaining items before any request is sent.
+
+        Large sweeps are estimated from a sample of evenly spaced combinations. Completions are assumed to reach
+        their maximum length, so the completion tokens and the cost are upper bounds.
+        """
+        remaining = max(0, len(self.indices) - len(self.completed_indices))
+        step = max(1, len(self.indices) // sample_size)
+        # The indices of a large sweep are never listed: only the sampled positions are looked up.
+        sample = [self.indices[position] for position in range(0, len(self.indices), step)]
+        sample = [index for index in sample if index not in self.completed_indices]
+
+        estimate = UsageEstimate(items=remaining)
+        for index in sample:
+            for backend_str, prompt_tokens, completion_tokens in self.estimate_item_usage(self.options_configs[index]):
+                estimate.add(self.backends.get_priced_backend(backend_str), prompt_tokens, completion_tokens)
+
+        if sample:
+            estimate.scale(remaining / len(sample))
+
+        return estimate
+
+    def add_usage(self, items: List[Dict[str, Any]], metrics: ItemMetrics) -> None:
+        """Save the usage of the requests that produced a batch of items with the items, divided evenly."""
+        for item, usage in zip(items, split_usage(metrics.usage, len(items))):
+            item["usage"] = usage
+
+    def finish_items(self, items: List[Dict[str, Any]], metrics: ItemMetrics) -> None:
+        """Drop the attempt number, which only keys the cache of repeated requests, and save the usage of items."""
+        for item in items:
+            item.pop("attempt", None)
+
+        self.add_usage(items, metrics)
+
+    def get_options_config(self, index: int) -> Dict[str, Any]:
+        """Get an options combination, numbering repeated requests so that they are not answered from the cache."""
+        options_config = self.options_configs[index]
+        if index in self.attempts:
+            options_config["attempt"] = self.attempts[index]
+
+        return options_config
+
+    def requeue(self, index: int) -> None:
+        """Produce the item of an options combination once more, ahead of the remaining combinations."""
+        self.attempts[index] = self.attempts.get(index, 0) + 1
+        self.requeued.append(index)
+
+    def next_index(self) -> Optional[int]:
+        """Advance to the next options combination that has not been completed."""
+        if self.requeued:
+            return self.requeued.popleft()
+
+        while self.generator_index < len(self.indices):
+            index = self.indices[self.generator_index]
+            self.generator_index += 1
+
+            if index not in self.completed_indices:
+                return index
+
+        return None
+
+    def generate_item(self) -> Dict[str, Any]:
+        """Produce the next data item."""
+        if self.budget is not None and self.budget.exhausted:
+            raise StopIteration()
+
+        index = self.next_index()
+        if index is None:
+            raise StopIteration()
+
+        with self.instrumentation.measure([index]) as metrics:
+            item = self.generate_item_from_config(self.get_options_config(index))
+            self.finish_items([item], metrics)
+            return item
+
+    async def run_in_executor(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking call in the generator's thread pool."""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, context.run, func, *args)
+
+    async def agenerate_item_from_config(self, options_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Asynchronously produce a data item for a given options combination."""
+        return await self.run_in_executor(self.generate_item_from_config, options_config)
+
+    async def agenerate_indexed_item(self, index: int) -> Tuple[int, Dict[str, Any]]:
+        """Asynchronously produce the data item of a given options combination index."""
+        item = await self.agenerate_item_from_config(self.get_options_config(index))
+        return index, item
+
+    def next_batch(self) -> List[int]:
+        """Take the indices of the next options combinations to produce with a single request."""
+        index = self.next_index()
+        return [] if index is None else [index]
+
+    def generate_batch_from_configs(self, options_configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Produce the data items of options combinations batched together."""
+        return [self.generate_item_from_config(options_config) for options_config in options_configs]
+
+    async def agenerate_batch(self, indices: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Asynchronously produce the data items of a batch of options combination indices."""
+        with self.instrumentation.measure(indices) as metrics:
+            if len(indices) == 1:
+                indexed_items = [await self.agenerate_indexed_item(indices[0])]
+            else:
+                options_configs = [self.get_options_config(index) for index in indices]
+                items = await self.run_in_executor(self.generate_batch_from_configs, options_configs)
+                indexed_items = list(zip(indices, items))
+
+            self.finish_items([item for _, item in indexed_items], metrics)
+            return indexed_items
+
+    async def agenerate_items(self, concurrency: int = 1) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Produce the remaining data items with up to `concurrency` requests in flight.
+
+        Items are yielded as soon as they are completed, paired with the index of their options combination.
+        """
+        if concurrency < 1:
+            raise ValueError("Concurrency must be a positive integer.")
+
+        pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        if self.config.adaptive_concurrency:
+            self.concurrency_controller = AIMDController(concurrency)
+
+        try:
+            while True:
+                limit = concurrency
+                if self.concurrency_controller is not None:
+                    limit = self.concurrency_controller.concurrency
+
+                # Combinations may be requeued while items are consumed, so the generator is polled on every round.
+                while len(pending) < limit:
+                    if self.budget is not None and self.budget.exhausted:
+                        break
+
+                    batch = self.next_batch()
+                    if not batch:
+                        break
+
+                    if self.slot_pool is not None:
+                        await self.slot_pool.acquire(self.priority)
+                    task = asyncio.ensure_future(self.agenerate_batch(batch))
+                    if self.slot_pool is not None:
+                        task.add_done_callback(lambda _: self.slot_pool.release())
+                    pending.add(task)
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for indexed_item in task.result():
+                        yield indexed_item
+        finally:
+            for task in pending:
+                task.cancel()
+            self.executor.shutdown(wait=True)
+            self.executor = None
+            self.concurrency_controller = None
+
     def __next__(self) -> Generator[Dict[str, Any], None, None]:
         return self.generate_item()
 
     def __iter__(self) -> Iterator:
         return self
+
+    def __aiter__(self) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        return self.agenerate_items()
@@ -0,0 +1,217 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import tempfile
+import resource
+import subprocess
+
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List
+
+from .backends import BackendRegistry
+from .base import DatasetGenerator
+from .outputs import DatasetWriter
+
+STARTUP_COMMANDS = {
+    "help": ["--help"],
+    "texts": ["texts", "--prompt", "Hello.", "--backend", "mock|instant", "--no-progress", "--path", "{path}"],
+}
+"""Commands whose startup time is measured, from process creation to exit."""
+
+
+@dataclass
+class BenchmarkResult:
+    generator: str
+    """Benchmarked generator, "texts" or "conversations"."""
+    concurrency: int
+    """Maximum number of requests in flight."""
+    output_format: str
+    """Output format of the dataset writer."""
+    single_file: bool
+    """Whether the dataset was written to a single file."""
+    items: int
+    """Number of produced items."""
+    seconds: float
+    """Wall time of the whole run."""
+    items_per_second: float
+    """Produced items per second of wall time."""
+    latency_p50: float
+    """Median time in seconds between dispatching an item and receiving it."""
+    latency_p95: float
+    """95th percentile of the item latency in seconds."""
+    latency_p99: float
+    """99th percentile of the item latency in seconds."""
+    write_seconds: float
+    """Time spent saving items, including finalizing the output."""
+    write_items_per_second: float
+    """Items saved per second of writing time."""
+    write_megabytes_per_second: float
+    """Megabytes written per second of writing time."""
+    peak_rss_megabytes: float
+    """Peak resident set size of the process so far."""
+
+
+def get_percentile(values: List[float], percentile: float) -> float:
+    """Get a percentile of a list of values by the nearest-rank method."""
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def get_peak_rss_megabytes() -> float:
+    """Get the peak resident set size of the current process."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes while macOS reports bytes.
+    return peak_rss / (1 << 20) if sys.platform == "darwin" else peak_rss / (1 << 10)
+
+
+def get_output_size(path: str) -> int:
+    """Get the total size in bytes of an output file or directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path)
+               for name in names)
+
+
+def create_generator(generator: str, profile: str, items: int, max_length: int, turns: int) -> DatasetGenerator:
+    """Create a generator using a mock backend and its own client registry."""
+    backends = BackendRegistry()
+
+    if generator == "texts":
+        from .texts import TextsGenerator, TextsGeneratorConfig
+        config = TextsGeneratorConfig(prompt="Write a short story about {topic}.",
+                                      backends=[f"mock|{profile}"],
+                                      max_lengths=[max_length],
+                                      temperatures=[0.7],
+                                      options=[("topic", f"topic {i}") for i in range(items)])
+        return TextsGenerator(config, backends)
+
+    from .conversations import ConversationsGenerator, ConversationsGeneratorConfig
+    config = ConversationsGeneratorConfig(openai_api_key="",
+                                          agent1="You're a shop assistant in a {store} store.",
+                                          agent2="You're a customer in a {store} store.",
+                                          num_samples=items,
+                                          lengths=[turns],
+                                          temperatures=[0.7],
+                                          options=[("store", "pet")],
+                                          model=f"mock|{profile}",
+                                          model_agent_one=None,
+                                          model_agent_two=None)
+    return ConversationsGenerator(config, backends)
+
+
+def run_benchmark(
+    generator: str,
+    profile: str,
+    items: int,
+    concurrency: int,
+    output_format: str,
+    single_file: bool,
+    max_length: int = 64,
+    turns: int = 3
+) -> BenchmarkResult:
+    """Generate a dataset with a mock backend and measure the throughput of generation and writing."""
+    dataset_generator = create_generator(generator, profile, items, max_length, turns)
+    agenerate_batch = dataset_generator.agenerate_batch
+    latencies = []
+
+    async def timed_agenerate_batch(indices: List[int]) -> List[Any]:
+        start = time.perf_counter()
+        indexed_items = await agenerate_batch(indices)
+        latencies.extend([time.perf_counter() - start] * len(indexed_items))
+        return indexed_items
+
+    dataset_generator.agenerate_batch = timed_agenerate_batch
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"dataset.{output_format}" if single_file else "dataset")
+        dataset_writer = DatasetWriter(path, single_file, output_format)
+        write_seconds = 0.0
+        count = 0
+
+        async def run() -> None:
+            nonlocal write_seconds, count
+            async for index, item in dataset_generator.agenerate_items(concurrency):
+                start = time.perf_counter()
+                dataset_writer.save_intermediate_result(item, index)
+                write_seconds += time.perf_counter() - start
+                count += 1
+
+        start = time.perf_counter()
+        asyncio.run(run())
+
+        close_start = time.perf_counter()
+        dataset_writer.close()
+        write_seconds += time.perf_counter() - close_start
+        seconds = time.perf_counter() - start
+
+        output_size = get_output_size(dataset_writer.path)
+
+    return BenchmarkResult(generator=generator,
+                           concurrency=concurrency,
+                           output_format=output_format,
+                           single_file=single_file,
+                           items=count,
+                           seconds=seconds,
+                           items_per_second=count / seconds if seconds else 0.0,
+                           latency_p50=get_percentile(latencies, 50),
+                           latency_p95=get_percentile(latencies, 95),
+                           latency_p99=get_percentile(latencies, 99),
+                           write_seconds=write_seconds,
+                           write_items_per_second=count / write_seconds if write_seconds else 0.0,
+                           write_megabytes_per_second=output_size / (1 << 20) / write_seconds if write_seconds else 0.0,
+                           peak_rss_megabytes=get_peak_rss_megabytes())
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """Render benchmark results as a text table."""
+    header = ["generator", "conc", "format", "items", "items/s", "p50 s", "p95 s", "p99 s", "write items/s", "write MB/s", "peak RSS MB"]
+    rows = [[result.generator,
+             str(result.concurrency),
+             result.output_format + (" (single)" if result.single_file and result.output_format == "json" else ""),
+             str(result.items),
+             f"{result.items_per_second:.1f}",
+             f"{result.latency_p50:.3f}",
+             f"{result.latency_p95:.3f}",
+             f"{result.latency_p99:.3f}",
+             f"{result.write_items_per_second:.0f}",
+             f"{result.write_megabytes_per_second:.2f}",
+             f"{result.peak_rss_megabytes:.1f}"] for result in results]
+
+    widths = [max(len(row[column]) for row in [header, *rows]) for column in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in [header, *rows])
+
+
+def measure_startup(repeats: int = 3) -> Dict[str, float]:
+    """Measure the wall time of short datasetGPT commands in fresh interpreters, keeping the fastest run of each.
+
+    Startup time is dominated by imports, so it regresses when a command starts loading a heavy dependency,
+    such as langchain, that it does not need.
+    """
+    startup_seconds = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, arguments in STARTUP_COMMANDS.items():
+            timings = []
+            for repeat in range(repeats):
+                path = os.path.join(directory, f"{name}-{repeat}.json")
+                command = [sys.executable, "-m", "datasetGPT", *(argument.format(path=path) for argument in arguments)]
+
+                start = time.perf_counter()
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - start)
+
+            startup_seconds[name] = min(timings)
+
+    return startup_seconds
+
+
+def results_to_dicts(results: List[BenchmarkResult]) -> List[Dict[str, Any]]:
+    """Convert benchmark results to JSON serializable dictionaries."""
+    return [asdict(result) for result in results]
@@ -0,0 +1,88 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from typing import Any, Optional
+
+
+class ResponseCache:
+    """Persistent cache of LLM responses stored in a SQLite database."""
+
+    path: str
+    """Path of the SQLite database file."""
+    max_size: int
+    """Maximum total size of the cached responses in bytes. Least recently used entries are evicted first."""
+    size: int
+    """Current total size of the cached responses in bytes."""
+    hits: int = 0
+    """Number of lookups answered from the cache."""
+    misses: int = 0
+    """Number of lookups not found in the cache."""
+
+    def __init__(self, path: str, max_size: int = 1 << 30) -> None:
+        """Initialize ResponseCache."""
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                "key TEXT PRIMARY KEY, "
+                                "response TEXT NOT NULL, "
+                                "size INTEGER NOT NULL, "
+                                "accessed REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Derive a content-addressed key from the parts of a request."""
+        serialized = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response."""
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, response: str) -> None:
+        """Store a response and evict old entries if the cache grows too large."""
+        size = len(response.encode("utf-8"))
+
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO responses (key, response, size, accessed) VALUES (?, ?, ?, ?)",
+                                    (key, response, size, time.time()))
+            self.size += size - (previous[0] if previous else 0)
+
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits its maximum size."""
+        while self.size > self.max_size:
+            rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                break
+
+            for key, size in rows:
+                if self.size <= self.max_size:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.size -= size
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self.lock:
+            self.connection.close()
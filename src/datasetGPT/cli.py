@@ -1,9 +1,19 @@
+import os
+import sys
+import json
+import asyncio
 import click
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
-from .conversations import ConversationsGeneratorConfig, ConversationsGenerator
-from .texts import TextsGeneratorConfig, TextsGenerator
-from .outputs import DatasetWriter
+# The generators are imported by their commands, so that other commands do not load langchain.
+from .base import DatasetGenerator
+from .costs import UsageEstimate
+from .outputs import DatasetWriter, OUTPUT_FORMATS, COMPRESSION_EXTENSIONS, detect_output_options
+from .shards import parse_shard, launch_workers, merge_outputs, get_shard_path
+from .dedup import Deduplicator
+from .runner import agenerate_dataset, prepare_dataset
+from .telemetry import Instrumentation, ProgressReporter
+from .sampling import SAMPLING_STRATEGIES
 
 
 @click.group()
@@ -47,6 +57,243 @@ click_temperatures = click.option("--temperature",
                                   default=[0.5],
                                   help="Possible temperature values for the backend language model.")
 
+click_output_format = click.option("--format",
+                                   "output_format",
+                                   type=click.Choice(OUTPUT_FORMATS),
+                                   default="json",
+                                   help="Output format. \"jsonl\" streams items to a single file one line at a time. \"parquet\" and \"arrow\" (IPC) write columnar files in row groups and require pyarrow.")
+
+click_compression = click.option("--compression",
+                                 "compression",
+                                 type=click.Choice(list(COMPRESSION_EXTENSIONS)),
+                                 default="none",
+                                 help="Compression of a jsonl output or codec of a parquet or arrow output (arrow supports zstd only).")
+
+click_cache = click.option("--cache",
+                           "cache_path",
+                           type=click.Path(dir_okay=False),
+                           help="SQLite file used to cache LLM responses across runs.")
+
+click_cache_max_size = click.option("--cache-max-size",
+                                    "cache_max_size",
+                                    type=click.IntRange(min=1),
+                                    default=1024,
+                                    help="Maximum size of the response cache in megabytes.")
+
+click_resume = click.option("--resume",
+                            "resume",
+                            type=bool,
+                            is_flag=True,
+                            help="Continue a previous run saved to --path and only generate its missing items.")
+
+click_overwrite = click.option("--overwrite",
+                               "overwrite",
+                               type=bool,
+                               is_flag=True,
+                               help="Replace the output of a previous run saved to --path. Without --resume or --overwrite, an existing output is never written over.")
+
+click_background_writes = click.option("--background-writes/--foreground-writes",
+                                       "background_writes",
+                                       default=True,
+                                       help="Write items from a dedicated thread that batches them, so that a slow output path does not stall generation. Queued items are still written when a run is interrupted.")
+
+click_requests_per_minute = click.option("--requests-per-minute",
+                                         "requests_per_minute",
+                                         type=click.FloatRange(min=0, min_open=True),
+                                         help="Maximum number of requests per minute sent to each backend.")
+
+click_tokens_per_minute = click.option("--tokens-per-minute",
+                                       "tokens_per_minute",
+                                       type=click.FloatRange(min=0, min_open=True),
+                                       help="Maximum number of prompt and completion tokens per minute sent to each backend.")
+
+click_max_retries = click.option("--max-retries",
+                                 "max_retries",
+                                 type=click.IntRange(min=0),
+                                 default=6,
+                                 help="Maximum number of retries of a request failing with a rate limit or server error.")
+
+click_adaptive_concurrency = click.option("--adaptive-concurrency/--fixed-concurrency",
+                                          "adaptive_concurrency",
+                                          default=True,
+                                          help="Whether to lower the concurrency when backends throttle requests and raise it back up to --concurrency afterwards.")
+
+click_concurrency = click.option("--concurrency",
+                                 "-c",
+                                 "concurrency",
+                                 type=click.IntRange(min=1),
+                                 default=1,
+                                 help="Number of dataset items to generate concurrently.")
+
+click_metrics = click.option("--metrics",
+                             "metrics_path",
+                             type=click.Path(dir_okay=False),
+                             help="JSONL file receiving timing, token usage, retries and errors of every item.")
+
+click_prometheus = click.option("--prometheus",
+                                "prometheus_path",
+                                type=click.Path(dir_okay=False),
+                                help="File periodically rewritten with aggregated run metrics in the Prometheus text format.")
+
+click_metrics_port = click.option("--metrics-port",
+                                  "metrics_port",
+                                  type=click.IntRange(min=1, max=65535),
+                                  help="Serve aggregated run metrics in the Prometheus text format on this local port.")
+
+click_max_cost = click.option("--max-cost",
+                              "max_cost",
+                              type=click.FloatRange(min=0, min_open=True),
+                              help="Stop starting new items once the requests have cost this many USD. Items in flight are completed.")
+
+click_max_tokens = click.option("--max-tokens",
+                                "max_tokens",
+                                type=click.IntRange(min=1),
+                                help="Stop starting new items once this many prompt and completion tokens have been used. Items in flight are completed.")
+
+click_estimate = click.option("--estimate",
+                              "estimate",
+                              type=bool,
+                              is_flag=True,
+                              help="Print the estimated token usage and cost of the run and exit without sending requests.")
+
+click_progress = click.option("--progress/--no-progress",
+                              "progress",
+                              default=sys.stderr.isatty(),
+                              help="Show a live progress line with throughput and ETA. Enabled by default in terminals.")
+
+
+def parse_shard_option(context: click.Context, parameter: click.Parameter, value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Convert a --shard value to a shard index and a number of shards."""
+    if value is None:
+        return None
+
+    try:
+        return parse_shard(value)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+
+
+click_shard = click.option("--shard",
+                           "shard",
+                           type=str,
+                           callback=parse_shard_option,
+                           help="Only generate the i-th of N equal parts of the options combinations, given as \"i/N\" with i counting from 0. Merge the outputs of all shards with the merge command.")
+
+
+click_sampling = click.option("--sampling",
+                              "sampling",
+                              type=click.Choice(SAMPLING_STRATEGIES),
+                              default="grid",
+                              help="Options combinations to generate: all of them (grid), --sample-size drawn uniformly at random (random) or by Latin hypercube sampling, which spreads the values of every option evenly (stratified), or just enough for every option value to appear --cover-k times (cover). The samples of a selected combination are always generated together.")
+
+click_sample_size = click.option("--sample-size",
+                                 "sample_size",
+                                 type=click.IntRange(min=1),
+                                 help="Number of options combinations drawn by --sampling random or stratified, or the maximum for cover.")
+
+click_cover_k = click.option("--cover-k",
+                             "cover_k",
+                             type=click.IntRange(min=1),
+                             default=1,
+                             help="Number of times every option value appears with --sampling cover.")
+
+click_seed = click.option("--seed",
+                          "seed",
+                          type=int,
+                          default=0,
+                          help="Seed of the sampling, so that a run selects the same combinations when it is repeated or resumed.")
+
+
+click_endpoints = click.option("--endpoint",
+                               "endpoints",
+                               type=(str, str),
+                               multiple=True,
+                               help="Serve a backend or model name with a pool of interchangeable endpoints, given as `--endpoint NAME \"backend|model|key=value\"` and repeated for each endpoint. Parameters: api_key, api_base (OpenAI-compatible servers), rpm and tpm. Each request goes to the endpoint with the shortest expected wait, and failing endpoints are skipped for a while.")
+
+
+def format_usage_estimate(estimate: UsageEstimate) -> str:
+    """Describe the estimated usage of a run."""
+    description = (f"Estimated usage of {estimate.items} items: {estimate.prompt_tokens:,.0f} prompt tokens, "
+                   f"at most {estimate.completion_tokens:,.0f} completion tokens and ${estimate.cost:,.2f}.")
+    if estimate.unpriced_backends:
+        description += f" Unknown prices of {', '.join(estimate.unpriced_backends)} are not included."
+
+    return description
+
+
+def generate_dataset(
+    generator: DatasetGenerator,
+    dataset_writer: DatasetWriter,
+    concurrency: int = 1,
+    progress: bool = False,
+    deduplicator: Optional[Deduplicator] = None,
+    top_up: int = 0,
+    dedup_report_path: Optional[str] = None
+) -> None:
+    """Run a generator with the given concurrency and save every produced item."""
+    remaining = prepare_dataset(generator, dataset_writer)
+
+    estimate = generator.estimate_usage()
+    click.echo(format_usage_estimate(estimate), err=True)
+    budget = generator.budget
+    if budget is not None and budget.max_cost is not None and estimate.cost > budget.max_cost:
+        click.echo("The estimated cost exceeds --max-cost, so the run may stop before all items are generated.", err=True)
+
+    instrumentation = generator.instrumentation
+    progress_reporter = None
+    if progress:
+        progress_reporter = ProgressReporter(remaining)
+
+    try:
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency, progress_reporter, deduplicator, top_up))
+    finally:
+        try:
+            # Queued items are written, and their writes recorded, before the metrics are closed.
+            dataset_writer.stop_writer()
+        finally:
+            if progress_reporter is not None:
+                progress_reporter.close()
+            instrumentation.close()
+
+    click.echo(f"Usage: {instrumentation.prompt_tokens:,} prompt tokens, {instrumentation.completion_tokens:,} completion tokens, "
+               f"${instrumentation.cost:,.2f}.", err=True)
+    if budget is not None and budget.exhausted:
+        click.echo("The budget was reached and no further items were started. "
+                   "Rerun the same command with --resume and a higher limit to generate the remaining items.", err=True)
+
+    for local_model in generator.backends.get_local_models():
+        batch_size = local_model.prompts / local_model.batches if local_model.batches else 0.0
+        click.echo(f"Local model {local_model.path}: {local_model.completion_tokens:,} tokens generated at "
+                   f"{local_model.tokens_per_second:.1f} tokens/s in {local_model.batches} batches of "
+                   f"{batch_size:.1f} prompts on average.", err=True)
+
+    for router in generator.backends.routers.values():
+        for report in router.get_report():
+            latency = "no successful request" if report["latency"] is None else f"{report['latency']:.2f}s average latency"
+            click.echo(f"Endpoint {report['endpoint']} of {router.name}: {report['requests']} requests, "
+                       f"{report['errors']} errors, {latency}{'' if report['available'] else ', currently skipped'}.", err=True)
+
+    if generator.cache is not None:
+        click.echo(f"Response cache: {generator.cache.hits} hits, {generator.cache.misses} misses.", err=True)
+
+    if deduplicator is not None:
+        total = deduplicator.get_total_stats()
+        click.echo(f"Deduplication: dropped {total.exact_duplicates} exact and {total.near_duplicates} near duplicates "
+                   f"out of {total.generated} items ({100 * total.drop_rate:.1f}%).", err=True)
+
+        if dedup_report_path is not None:
+            with open(dedup_report_path, "w") as report_file:
+                json.dump(deduplicator.get_report(), report_file, indent=4)
+
+
+def create_instrumentation(metrics_path: str, prometheus_path: str, metrics_port: int) -> Instrumentation:
+    """Set up the metrics outputs requested on the command line."""
+    instrumentation = Instrumentation(metrics_path, prometheus_path)
+    if metrics_port is not None:
+        instrumentation.serve(metrics_port)
+
+    return instrumentation
+
 
 @click.command()
 @click.option("--openai-api-key",
@@ -102,27 +349,79 @@ click_temperatures = click.option("--temperature",
 @click.option("--model",
               "-m",
               "model",
-              type=click.Choice(["gpt-3.5-turbo", "gpt-4"]),
+              type=str,
               multiple=False,
               default="gpt-3.5-turbo",
-              help="OpenAI Chat model to use. GPT-4 is only supported if given API key has access to GPT4. Defaults to GPT-3.5-Turbo.")
+              help="Chat model to use: an OpenAI chat model such as gpt-4, a \"mock|<profile>\" model or a backend defined with --endpoint. Defaults to GPT-3.5-Turbo.")
 @click.option("--model-agent1",
               "-m1",
               "model_agent_one",
-              type=click.Choice(["gpt-3.5-turbo", "gpt-4"]),
+              type=str,
               multiple=False,
-              help="OpenAI Chat model to use for agent1. GPT-4 is only supported if given API key has access to GPT4. Defaults to GPT-3.5-Turbo. If set, --model-agent2 must also be provided, otherwise --model value will be used.")
+              help="Chat model to use for agent1, given like --model. If set, --model-agent2 must also be provided, otherwise --model value will be used.")
 @click.option("--model-agent2",
               "-m2",
               "model_agent_two",
-              type=click.Choice(["gpt-3.5-turbo", "gpt-4"]),
+              type=str,
               multiple=False,
-              help="OpenAI Chat model to use for agent2. GPT-4 is only supported if given API key has access to GPT4. Defaults to GPT-3.5-Turbo If set, --model-agent1 must also be provided, otherwise --model value will be used.")
+              help="Chat model to use for agent2, given like --model. If set, --model-agent1 must also be provided, otherwise --model value will be used.")
+@click.option("--memory",
+              "memory",
+              type=click.Choice(["buffer", "window", "summary"]),
+              default="buffer",
+              help="Part of the history sent to the agents on each turn: everything (buffer), the most recent exchanges (window) or a running summary followed by the most recent exchanges (summary).")
+@click.option("--memory-window",
+              "memory_window",
+              type=click.IntRange(min=1),
+              default=5,
+              help="Number of most recent exchanges sent verbatim with the window and summary memory.")
+@click.option("--memory-max-tokens",
+              "memory_max_tokens",
+              type=click.IntRange(min=0),
+              help="Maximum number of history tokens sent to the agents on each turn. The oldest messages are dropped first.")
+@click.option("--stream/--no-stream",
+              "streaming",
+              default=False,
+              help="Stream responses token by token. With end_phrase interruption, a response is cut off as soon as the end phrase appears.")
+@click.option("--system-layout",
+              "system_layout",
+              type=click.Choice(["inline", "prefix"]),
+              default="inline",
+              help="Fill the options into the agent descriptions (inline), or keep the descriptions identical across requests and list the option values after them (prefix), so that providers and local models can reuse a cached prompt prefix.")
+@click.option("--prefix-report",
+              "prefix_report_path",
+              type=click.Path(dir_okay=False),
+              help="Path of a JSON report with the reuse statistics of each system message prefix.")
 @click_temperatures
 @click_num_samples
 @click_options
 @click_path
 @click_single_file
+@click_output_format
+@click_compression
+@click_cache
+@click_cache_max_size
+@click_resume
+@click_overwrite
+@click_background_writes
+@click_requests_per_minute
+@click_tokens_per_minute
+@click_max_retries
+@click_adaptive_concurrency
+@click_max_cost
+@click_max_tokens
+@click_estimate
+@click_metrics
+@click_prometheus
+@click_metrics_port
+@click_progress
+@click_shard
+@click_sampling
+@click_sample_size
+@click_cover_k
+@click_seed
+@click_endpoints
+@click_concurrency
 def conversations(
     openai_api_key: str,
     agent1: str,
@@ -139,10 +438,41 @@ def conversations(
     single_file: bool,
     model: str,
     model_agent_one: str,
-    model_agent_two: str
+    model_agent_two: str,
+    memory: str,
+    memory_window: int,
+    memory_max_tokens: int,
+    streaming: bool,
+    system_layout: str,
+    prefix_report_path: str,
+    output_format: str,
+    compression: str,
+    cache_path: str,
+    cache_max_size: int,
+    resume: bool,
+    overwrite: bool,
+    background_writes: bool,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_retries: int,
+    adaptive_concurrency: bool,
+    max_cost: float,
+    max_tokens: int,
+    estimate: bool,
+    metrics_path: str,
+    prometheus_path: str,
+    metrics_port: int,
+    progress: bool,
+    shard: Optional[Tuple[int, int]],
+    sampling: str,
+    sample_size: Optional[int],
+    cover_k: int,
+    seed: int,
+    endpoints: List[Tuple[str, str]],
+    concurrency: int
 ) -> None:
     """Produce conversations between two gpt-3.5-turbo agents with given roles."""
-    dataset_writer = DatasetWriter(path, single_file)
+    from .conversations import ConversationsGeneratorConfig, ConversationsGenerator
 
     generator_config = ConversationsGeneratorConfig(openai_api_key=openai_api_key,
                                                     agent1=agent1,
@@ -157,12 +487,59 @@ def conversations(
                                                     options=options,
                                                     model=model,
                                                     model_agent_one=model_agent_one,
-                                                    model_agent_two=model_agent_two)
+                                                    model_agent_two=model_agent_two,
+                                                    memory=memory,
+                                                    memory_window=memory_window,
+                                                    memory_max_tokens=memory_max_tokens,
+                                                    streaming=streaming,
+                                                    system_layout=system_layout,
+                                                    cache_path=cache_path,
+                                                    cache_max_size=cache_max_size << 20,
+                                                    requests_per_minute=requests_per_minute,
+                                                    tokens_per_minute=tokens_per_minute,
+                                                    max_retries=max_retries,
+                                                    adaptive_concurrency=adaptive_concurrency,
+                                                    max_cost=max_cost,
+                                                    max_tokens=max_tokens,
+                                                    sampling=sampling,
+                                                    sample_size=sample_size,
+                                                    cover_k=cover_k,
+                                                    seed=seed,
+                                                    endpoints=endpoints)
 
-    conversations_generator = ConversationsGenerator(generator_config)
+    try:
+        conversations_generator = ConversationsGenerator(generator_config)
+    except ValueError as error:
+        raise click.ClickException(str(error))
 
-    for conversation in conversations_generator:
-        dataset_writer.save_intermediate_result(conversation)
+    if shard is not None:
+        conversations_generator.select_shard(*shard)
+    if estimate:
+        click.echo(format_usage_estimate(conversations_generator.estimate_usage()))
+        return
+
+    try:
+        dataset_writer = DatasetWriter(path,
+                                       single_file,
+                                       output_format,
+                                       compression,
+                                       resume=resume,
+                                       background=background_writes,
+                                       overwrite=overwrite)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    conversations_generator.instrumentation = create_instrumentation(metrics_path, prometheus_path, metrics_port)
+
+    with dataset_writer:
+        generate_dataset(conversations_generator, dataset_writer, concurrency, progress)
+
+    for stats in conversations_generator.prefix_tracker.stats.values():
+        click.echo(f"System prefix \"{stats.text}...\": {stats.requests} requests, {100 * stats.hit_rate:.1f}% "
+                   f"likely cached, {stats.reused_tokens:,} reusable prompt tokens.", err=True)
+
+    if prefix_report_path is not None:
+        with open(prefix_report_path, "w") as report_file:
+            json.dump(conversations_generator.prefix_tracker.get_report(), report_file, indent=4)
 
 
 @click.command()
@@ -186,39 +563,392 @@ def conversations(
               multiple=True,
               default=[100],
               help="Maximum number of tokens to generate for each prompt.")
+@click.option("--dedup/--no-dedup",
+              "dedup",
+              default=False,
+              help="Drop outputs that are exact or near duplicates of previous outputs before saving them.")
+@click.option("--dedup-threshold",
+              "dedup_threshold",
+              type=click.FloatRange(min=0, max=1),
+              default=0.8,
+              help="Estimated Jaccard similarity of word 3-grams above which two outputs are near duplicates. Use 1 to only drop exact duplicates.")
+@click.option("--dedup-max-entries",
+              "dedup_max_entries",
+              type=click.IntRange(min=1),
+              default=100000,
+              help="Maximum number of recent outputs kept in the deduplication index.")
+@click.option("--dedup-top-up",
+              "dedup_top_up",
+              type=click.IntRange(min=0),
+              default=0,
+              help="Number of times a dropped sample is generated again to reach --num-samples unique outputs.")
+@click.option("--dedup-report",
+              "dedup_report_path",
+              type=click.Path(dir_okay=False),
+              help="JSON file receiving the drop rates of every options combination.")
+@click.option("--batch-samples/--no-batch-samples",
+              "batch_samples",
+              default=True,
+              help="Whether to request all samples of a prompt with a single API call on backends that support it (openai, mock and local).")
 @click_temperatures
 @click_num_samples
 @click_options
 @click_path
 @click_single_file
+@click_output_format
+@click_compression
+@click_cache
+@click_cache_max_size
+@click_resume
+@click_overwrite
+@click_background_writes
+@click_requests_per_minute
+@click_tokens_per_minute
+@click_max_retries
+@click_adaptive_concurrency
+@click_max_cost
+@click_max_tokens
+@click_estimate
+@click_metrics
+@click_prometheus
+@click_metrics_port
+@click_progress
+@click_shard
+@click_sampling
+@click_sample_size
+@click_cover_k
+@click_seed
+@click_endpoints
+@click_concurrency
 def texts(
     prompt: str,
     num_samples: int,
     max_lengths: List[int],
     temperatures: List[int],
     backends: List[str],
+    batch_samples: bool,
+    dedup: bool,
+    dedup_threshold: float,
+    dedup_max_entries: int,
+    dedup_top_up: int,
+    dedup_report_path: str,
     options: List[Tuple[str, str]],
     path: str,
-    single_file: bool
+    single_file: bool,
+    output_format: str,
+    compression: str,
+    cache_path: str,
+    cache_max_size: int,
+    resume: bool,
+    overwrite: bool,
+    background_writes: bool,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_retries: int,
+    adaptive_concurrency: bool,
+    max_cost: float,
+    max_tokens: int,
+    estimate: bool,
+    metrics_path: str,
+    prometheus_path: str,
+    metrics_port: int,
+    progress: bool,
+    shard: Optional[Tuple[int, int]],
+    sampling: str,
+    sample_size: Optional[int],
+    cover_k: int,
+    seed: int,
+    endpoints: List[Tuple[str, str]],
+    concurrency: int
 ) -> None:
     """Inference multiple LLMs at scale."""
-    dataset_writer = DatasetWriter(path, single_file)
+    from .texts import TextsGeneratorConfig, TextsGenerator
 
     generator_config = TextsGeneratorConfig(prompt=prompt,
                                             backends=backends,
                                             num_samples=num_samples,
                                             max_lengths=max_lengths,
                                             temperatures=temperatures,
-                                            options=options)
+                                            options=options,
+                                            cache_path=cache_path,
+                                            cache_max_size=cache_max_size << 20,
+                                            requests_per_minute=requests_per_minute,
+                                            tokens_per_minute=tokens_per_minute,
+                                            max_retries=max_retries,
+                                            adaptive_concurrency=adaptive_concurrency,
+                                            max_cost=max_cost,
+                                            max_tokens=max_tokens,
+                                            batch_samples=batch_samples,
+                                            sampling=sampling,
+                                            sample_size=sample_size,
+                                            cover_k=cover_k,
+                                            seed=seed,
+                                            endpoints=endpoints)
+
+    try:
+        texts_generator = TextsGenerator(generator_config)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    if shard is not None:
+        texts_generator.select_shard(*shard)
+    if estimate:
+        click.echo(format_usage_estimate(texts_generator.estimate_usage()))
+        return
+
+    try:
+        dataset_writer = DatasetWriter(path,
+                                       single_file,
+                                       output_format,
+                                       compression,
+                                       resume=resume,
+                                       background=background_writes,
+                                       overwrite=overwrite)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    texts_generator.instrumentation = create_instrumentation(metrics_path, prometheus_path, metrics_port)
+
+    deduplicator = None
+    if dedup:
+        deduplicator = Deduplicator(threshold=dedup_threshold, max_entries=dedup_max_entries)
+
+    with dataset_writer:
+        generate_dataset(texts_generator,
+                         dataset_writer,
+                         concurrency,
+                         progress,
+                         deduplicator,
+                         dedup_top_up,
+                         dedup_report_path)
+
+
+@click.command()
+@click.option("--generator",
+              "-g",
+              "generators",
+              type=click.Choice(["texts", "conversations"]),
+              multiple=True,
+              default=["texts"],
+              help="Generators to benchmark.")
+@click.option("--profile",
+              "-p",
+              "profile",
+              type=str,
+              default="fast",
+              help="Mock backend profile: a name (instant, fast, realistic, slow, flaky) and/or comma separated overrides such as \"latency=0.2,error_rate=0.05\".")
+@click.option("--items",
+              "-n",
+              "items",
+              type=click.IntRange(min=1),
+              default=200,
+              help="Number of items to generate for each run.")
+@click.option("--concurrency",
+              "-c",
+              "concurrency_levels",
+              type=click.IntRange(min=1),
+              multiple=True,
+              default=[1, 8, 32],
+              help="Concurrency levels to benchmark.")
+@click.option("--format",
+              "output_formats",
+              type=click.Choice(OUTPUT_FORMATS),
+              multiple=True,
+              default=["json", "jsonl"],
+              help="Output formats to benchmark.")
+@click_single_file
+@click.option("--output",
+              "-f",
+              "output",
+              type=click.Path(dir_okay=False),
+              help="Save the results as JSON to compare runs.")
+@click.option("--min-items-per-second",
+              "min_items_per_second",
+              type=float,
+              help="Exit with an error if any run is slower than this throughput.")
+@click.option("--startup/--no-startup",
+              "startup",
+              default=False,
+              help="Also measure the startup time of `datasetGPT --help` and of a one-item texts run with a mock backend.")
+@click.option("--max-startup-seconds",
+              "max_startup_seconds",
+              type=float,
+              help="Exit with an error if a measured startup takes longer than this. Implies --startup.")
+def bench(
+    generators: List[str],
+    profile: str,
+    items: int,
+    concurrency_levels: List[int],
+    output_formats: List[str],
+    single_file: bool,
+    output: str,
+    min_items_per_second: float,
+    startup: bool,
+    max_startup_seconds: float
+) -> None:
+    """Measure generation and writing throughput offline with a mock backend."""
+    from .bench import run_benchmark, format_results, measure_startup, results_to_dicts
+
+    startup_seconds = {}
+    if startup or max_startup_seconds is not None:
+        startup_seconds = measure_startup()
+        for name, seconds in startup_seconds.items():
+            click.echo(f"Startup of {name}: {seconds:.3f}s")
+
+    results = []
+    for generator in generators:
+        for output_format in output_formats:
+            for concurrency in concurrency_levels:
+                results.append(run_benchmark(generator, profile, items, concurrency, output_format, single_file))
+
+    click.echo(format_results(results))
+
+    if output:
+        with open(output, "w") as output_file:
+            dump = results_to_dicts(results)
+            if startup_seconds:
+                dump = {"startup_seconds": startup_seconds, "runs": dump}
+            json.dump(dump, output_file, indent=4)
+
+    if min_items_per_second is not None:
+        slow_results = [result for result in results if result.items_per_second < min_items_per_second]
+        if slow_results:
+            raise click.ClickException(f"{len(slow_results)} runs were slower than {min_items_per_second} items/s.")
+
+    if max_startup_seconds is not None:
+        slow_commands = [name for name, seconds in startup_seconds.items() if seconds > max_startup_seconds]
+        if slow_commands:
+            raise click.ClickException(f"Startup of {', '.join(slow_commands)} took longer than {max_startup_seconds}s.")
+
+
+@click.command()
+@click.argument("inputs",
+                type=click.Path(exists=True),
+                nargs=-1,
+                required=True)
+@click_path
+@click_single_file
+@click_output_format
+@click_compression
+@click_overwrite
+def merge(
+    inputs: List[str],
+    path: str,
+    single_file: bool,
+    output_format: str,
+    compression: str,
+    overwrite: bool
+) -> None:
+    """Combine the outputs of shards into one dataset ordered like an unsharded run."""
+    try:
+        dataset_writer = DatasetWriter(path, single_file, output_format, compression, overwrite=overwrite)
+        with dataset_writer:
+            count = merge_outputs(inputs, dataset_writer)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+
+    click.echo(f"Merged {count} items from {len(inputs)} outputs into {dataset_writer.path}.", err=True)
+
+
+@click.command(context_settings={"ignore_unknown_options": True, "allow_interspersed_args": False})
+@click.option("--workers",
+              "-w",
+              "num_workers",
+              type=click.IntRange(min=1),
+              default=os.cpu_count(),
+              help="Number of worker processes, each generating one shard. Defaults to the number of CPUs.")
+@click.option("--api-key",
+              "-k",
+              "api_keys",
+              type=str,
+              multiple=True,
+              help="OpenAI API keys handed out to the workers in turn. Repeat to spread the load over several keys.")
+@click.option("--path",
+              "-f",
+              "path",
+              type=click.Path(),
+              required=True,
+              help="Where to save the merged dataset. Shards are saved next to it with their number inserted before the extension.")
+@click.option("--merge/--no-merge",
+              "merge_shards",
+              default=True,
+              help="Whether to merge the shards once all workers have finished.")
+@click.option("--overwrite",
+              "overwrite",
+              type=bool,
+              is_flag=True,
+              help="Replace a merged dataset saved to --path by a previous launch. Shards are resumed or overwritten with the --resume or --overwrite options of the command.")
+@click.argument("command",
+                type=click.Choice(["texts", "conversations"]))
+@click.argument("arguments",
+                nargs=-1,
+                type=click.UNPROCESSED)
+def launch(
+    num_workers: int,
+    api_keys: List[str],
+    path: str,
+    merge_shards: bool,
+    overwrite: bool,
+    command: str,
+    arguments: List[str]
+) -> None:
+    """Run a texts or conversations command split over several local worker processes.
+
+    Options after the command name are passed on to every worker, for example:
+    datasetGPT launch -w 4 -f dataset.jsonl texts -p "..." --format jsonl
+    """
+    exit_codes = launch_workers(command, list(arguments), path, num_workers, list(api_keys))
+
+    failed_shards = [str(shard_index) for shard_index, exit_code in enumerate(exit_codes) if exit_code != 0]
+    if failed_shards:
+        raise click.ClickException(
+            f"Shards {', '.join(failed_shards)} failed. Rerun the same command with --resume to complete them.")
+
+    if merge_shards:
+        shard_paths = [get_shard_path(path, shard_index, num_workers) for shard_index in range(num_workers)]
+        single_file, output_format, compression = detect_output_options(shard_paths[0])
+        try:
+            dataset_writer = DatasetWriter(path, single_file, output_format, compression, overwrite=overwrite)
+            with dataset_writer:
+                count = merge_outputs(shard_paths, dataset_writer)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+        click.echo(f"Merged {count} items from {num_workers} shards into {dataset_writer.path}.", err=True)
+
+
+@click.command()
+@click.argument("jobs_path",
+                type=click.Path(exists=True, dir_okay=False))
+@click.option("--concurrency",
+              "-c",
+              "concurrency",
+              type=click.IntRange(min=1),
+              help="Number of dataset items generated concurrently across all jobs. Overrides the concurrency of the jobs file.")
+@click_progress
+def run(jobs_path: str, concurrency: int, progress: bool) -> None:
+    """Run the texts and conversations jobs of a YAML or JSON file in one process.
+
+    All jobs share one concurrency budget, the API clients and the rate limits of each backend.
+    Free slots go to the jobs with the highest priority first.
+    """
+    from .jobs import load_jobs, run_jobs
 
-    texts_generator = TextsGenerator(generator_config)
+    try:
+        jobs = load_jobs(jobs_path, concurrency)
+    except ValueError as error:
+        raise click.ClickException(str(error))
 
-    for text_object in texts_generator:
-        dataset_writer.save_intermediate_result(text_object)
+    seconds = run_jobs(jobs, progress)
+    for job in jobs:
+        click.echo(f"{job.name}: {len(job.dataset_writer.manifest.indices)} items in {seconds[job.name]:.1f}s saved to {job.dataset_writer.path}.", err=True)
 
 
 datasetGPT.add_command(texts)
 datasetGPT.add_command(conversations)
+datasetGPT.add_command(run)
+datasetGPT.add_command(bench)
+datasetGPT.add_command(merge)
+datasetGPT.add_command(launch)
 
 
 def main() -> None:
@@ -0,0 +1,138 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+COLUMNAR_FORMATS = ["parquet", "arrow"]
+COLUMNAR_COMPRESSIONS = {"parquet": ["none", "gzip", "zstd"], "arrow": ["none", "zstd"]}
+COLUMNAR_MAGIC_NUMBERS = {"parquet": b"PAR1", "arrow": b"ARROW1"}
+
+
+def import_pyarrow() -> Any:
+    """Import pyarrow, which is only required by the columnar output formats."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet and Arrow outputs require the pyarrow package. Install it with `pip install pyarrow`.")
+
+    return pyarrow
+
+
+def get_utterances_type() -> Any:
+    """Get the Arrow type of the utterances of a conversation."""
+    pa = import_pyarrow()
+    return pa.list_(pa.struct([("agent", pa.string()), ("text", pa.string())]))
+
+
+def get_usage_type() -> Any:
+    """Get the Arrow type of the usage of an item, whose cost is null for models without a known price."""
+    pa = import_pyarrow()
+    return pa.struct([("prompt_tokens", pa.int64()), ("completion_tokens", pa.int64()), ("cost", pa.float64())])
+
+
+def to_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a dataset item to a row of a columnar output."""
+    if "utterances" not in item:
+        return item
+
+    return {**item, "utterances": [{"agent": agent, "text": text} for agent, text in item["utterances"]]}
+
+
+def from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a row of a columnar output back to a dataset item."""
+    if "utterances" not in row:
+        return row
+
+    return {**row, "utterances": [[utterance["agent"], utterance["text"]] for utterance in row["utterances"]]}
+
+
+class ColumnarWriter:
+    """Incremental writer of a Parquet or Arrow IPC file.
+
+    The schema is derived from the first rows. Options whose possible values are known in advance get a type
+    that fits all of them, so a later row group never needs a different one.
+    """
+
+    path: str
+    """Path of the output file."""
+    output_format: str
+    """Either "parquet" or "arrow"."""
+    compression: str
+    """Compression codec of the columns: "none", "gzip" (Parquet only) or "zstd"."""
+    option_values: Dict[str, Sequence[Any]]
+    """Possible values of the options included in each row."""
+
+    def __init__(
+        self,
+        path: str,
+        output_format: str,
+        compression: str = "none",
+        option_values: Optional[Dict[str, Sequence[Any]]] = None
+    ) -> None:
+        """Initialize ColumnarWriter."""
+        self.pa = import_pyarrow()
+        self.path = path
+        self.output_format = output_format
+        self.compression = compression
+        self.option_values = option_values or {}
+        self.schema = None
+        self.writer = None
+
+    def get_schema(self, rows: List[Dict[str, Any]]) -> Any:
+        """Derive the schema of the output from the keys and values of the first rows."""
+        fields = []
+        for key in rows[0]:
+            if key == "utterances":
+                field_type = get_utterances_type()
+            elif key == "usage":
+                field_type = get_usage_type()
+            elif key in self.option_values:
+                field_type = self.pa.infer_type(list(self.option_values[key]))
+            else:
+                field_type = self.pa.infer_type([row.get(key) for row in rows])
+            fields.append((key, field_type))
+
+        return self.pa.schema(fields)
+
+    def open(self, rows: List[Dict[str, Any]]) -> None:
+        """Create the file with a schema fitting the first rows."""
+        self.schema = self.get_schema(rows)
+        if self.output_format == "parquet":
+            self.writer = self.pa.parquet.ParquetWriter(self.path, self.schema, compression=self.compression)
+        else:
+            options = self.pa.ipc.IpcWriteOptions(compression=None if self.compression == "none" else self.compression)
+            self.writer = self.pa.ipc.new_file(self.path, self.schema, options=options)
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> None:
+        """Write rows as one Parquet row group or one Arrow record batch."""
+        if not rows:
+            return
+        if self.writer is None:
+            self.open(rows)
+
+        table = self.pa.Table.from_pylist(rows, schema=self.schema)
+        if self.output_format == "parquet":
+            self.writer.write_table(table, row_group_size=len(rows))
+        else:
+            self.writer.write_table(table, max_chunksize=len(rows))
+
+    def close(self) -> None:
+        """Write the file footer."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def read_columnar(path: str, output_format: str) -> Iterator[Dict[str, Any]]:
+    """Read the items of a Parquet or Arrow IPC file one record batch at a time."""
+    pa = import_pyarrow()
+
+    if output_format == "parquet":
+        batches = pa.parquet.ParquetFile(path, memory_map=True).iter_batches()
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        batches = (reader.get_batch(position) for position in range(reader.num_record_batches))
+
+    for batch in batches:
+        for row in batch.to_pylist():
+            yield from_row(row)
@@ -1,22 +1,28 @@
 from dataclasses import dataclass, field
-from typing import List, Any, Dict, Tuple, Union
+from typing import List, Any, Dict, Tuple, Union, Optional
 
 from langchain.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
-    SystemMessagePromptTemplate,
+    PromptTemplate,
     HumanMessagePromptTemplate
 )
 
 from langchain.chains import ConversationChain
-from langchain.chat_models import ChatOpenAI
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import SystemMessage
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain.schema import BaseMessage, SystemMessage, get_buffer_string
 
 from .base import DatasetGenerator
+from .backends import BackendRegistry, backend_registry
+from .memory import BoundedConversationMemory, MEMORY_STRATEGIES
+from .prefixes import SYSTEM_LAYOUTS, PrefixTracker, get_constant_prefix, get_placeholder_order, get_placeholder_template
+from .streaming import EndPhraseReached, StreamingHandler
+from .tokens import count_tokens
 
 OPTIONS_CONFIG_KEYS = ["length", "temperature", "initial_utterance"]
 GENERATOR_CONFIG_KEYS = ["lengths", "temperatures", "initial_utterances"]
+ESTIMATED_UTTERANCE_TOKENS = 60
+"""Assumed number of tokens of an utterance when estimating the usage of a conversation."""
 
 
 @dataclass
@@ -49,6 +55,44 @@ class ConversationsGeneratorConfig:
     """Model to select for agent1"""
     model_agent_two: str = "gpt-3.5-turbo"
     """Model to select for agent2"""
+    cache_path: Optional[str] = None
+    """Path of a persistent response cache. Responses are not cached if unset."""
+    cache_max_size: int = 1 << 30
+    """Maximum size of the response cache in bytes."""
+    requests_per_minute: Optional[float] = None
+    """Maximum number of requests per minute sent to each backend."""
+    tokens_per_minute: Optional[float] = None
+    """Maximum number of prompt and completion tokens per minute sent to each backend."""
+    max_retries: int = 6
+    """Maximum number of times a request failing with a transient error is retried."""
+    adaptive_concurrency: bool = True
+    """Whether to reduce the number of concurrent items when backends throttle requests."""
+    max_cost: Optional[float] = None
+    """Cost in USD after which no new items are started."""
+    max_tokens: Optional[int] = None
+    """Number of prompt and completion tokens after which no new items are started."""
+    memory: str = "buffer"
+    """Part of the history sent to the agents: "buffer" (everything), "window" (recent exchanges) or "summary" (a summary and recent exchanges)."""
+    memory_window: int = 5
+    """Number of most recent exchanges sent verbatim with the "window" and "summary" memory."""
+    memory_max_tokens: Optional[int] = None
+    """Maximum number of history tokens sent to the agents on each turn."""
+    streaming: bool = False
+    """Whether to stream responses, stopping each one as soon as the end phrase appears."""
+    system_layout: str = "inline"
+    """Layout of the system messages: "inline" fills the options into the agent descriptions, while "prefix" keeps
+    the descriptions constant and lists the option values after them, so that all requests share a cacheable prefix."""
+    sampling: str = "grid"
+    """Selection of the options combinations: all of them ("grid"), "random", Latin hypercube ("stratified")
+    or enough to "cover" every option value `cover_k` times."""
+    sample_size: Optional[int] = None
+    """Number of options combinations drawn by the sampling strategies, or the maximum for "cover"."""
+    cover_k: int = 1
+    """Number of times each option value appears with the "cover" sampling strategy."""
+    seed: int = 0
+    """Seed of the sampling strategies."""
+    endpoints: List[Tuple[str, str]] = field(default_factory=lambda: [])
+    """Interchangeable endpoints serving a logical backend name, as (name, "backend|model|key=value") pairs."""
 
 
 class ConversationsGenerator(DatasetGenerator):
@@ -56,10 +100,38 @@ class ConversationsGenerator(DatasetGenerator):
 
     config: ConversationsGeneratorConfig
     """Configuration for a ConversationsGenerator."""
+    system_templates: Dict[str, PromptTemplate]
+    """System prompts of the agents parsed once per generator."""
+    input_template: HumanMessagePromptTemplate
+    """Template of the input message of each turn shared by all chains."""
+    system_prefixes: Dict[str, str]
+    """Constant beginning of the system message of each agent."""
+    prefix_tracker: PrefixTracker
+    """Statistics of the reuse of the system message prefixes."""
 
-    def __init__(self, config: ConversationsGeneratorConfig) -> None:
+    def __init__(self, config: ConversationsGeneratorConfig, backends: BackendRegistry = backend_registry) -> None:
         """Initialize ConversationsGenerator."""
-        super().__init__(config)
+        if config.memory not in MEMORY_STRATEGIES:
+            raise ValueError(f"Unsupported memory strategy: {config.memory}.")
+        if config.system_layout not in SYSTEM_LAYOUTS:
+            raise ValueError(f"Unsupported system message layout: {config.system_layout}.")
+
+        super().__init__(config, backends)
+        for agent in ["agent1", "agent2"]:
+            self.backends.validate_chat_model(self.get_agent_model(agent))
+
+        self.system_templates = {agent: PromptTemplate.from_template(self.get_system_prompt(agent))
+                                 for agent in ["agent1", "agent2"]}
+        self.input_template = HumanMessagePromptTemplate.from_template("{input}")
+        self.validate_system_prompts()
+
+        self.prefix_tracker = PrefixTracker()
+        if config.system_layout == "prefix":
+            self.system_prefixes = {agent: get_placeholder_template(system_template.template)
+                                    for agent, system_template in self.system_templates.items()}
+        else:
+            self.system_prefixes = {agent: get_constant_prefix(system_template.template)
+                                    for agent, system_template in self.system_templates.items()}
 
     def initialize_options_configs(
         self,
@@ -69,29 +141,81 @@ class ConversationsGenerator(DatasetGenerator):
         """Prepare options combinations."""
         super().initialize_options_configs(options_config_keys, generator_config_keys)
 
-    def initialize_chain(
-        self,
-        agent: str,
-        system_prompt: str,
-        conversation_config: Dict[str, Any]
-    ) -> Tuple[ConversationChain, str]:
-        """Initialize a conversation and return a chain and a formatted system prompt."""
+    def get_options_order(self, options_keys: List[str]) -> List[str]:
+        """With the "prefix" layout, group the conversations by the options in the order they appear in the system
+        prompts, so that consecutive requests share the longest prefixes. Samples of a conversation vary fastest."""
+        if self.config.system_layout != "prefix":
+            return options_keys
+
+        placeholders = get_placeholder_order([self.get_system_prompt("agent1"), self.get_system_prompt("agent2")])
+        prompt_keys = [key for key in placeholders if key in options_keys]
+        other_keys = [key for key in options_keys if key not in prompt_keys and key != "sample_id"]
+        return prompt_keys + other_keys + ["sample_id"]
+
+    def get_system_prompt(self, agent: str) -> str:
+        """Get the unformatted system prompt of an agent."""
+        system_prompt = self.config.agent1 if agent == "agent1" else self.config.agent2
         if self.config.interruption == "end_phrase":
             if self.config.end_agent == agent or self.config.end_agent == "both":
                 system_prompt += f" When the whole conversation is over end with \"{self.config.end_phrase}\"."
 
-        system_template = SystemMessagePromptTemplate.from_template(
-            system_prompt)
+        return system_prompt
+
+    def validate_system_prompts(self) -> None:
+        """Check that the system prompt placeholders match the options before any request is sent."""
+        input_variables = {variable
+                           for system_template in self.system_templates.values()
+                           for variable in system_template.input_variables}
+        option_names = set(self.options_configs.keys) - {"sample_id", *OPTIONS_CONFIG_KEYS}
+
+        missing_options = input_variables - option_names
+        if missing_options:
+            raise ValueError(f"The system prompts use placeholders without options: {', '.join(sorted(missing_options))}.")
+
+        unused_options = option_names - input_variables
+        if unused_options:
+            raise ValueError(f"Options not used in the system prompts: {', '.join(sorted(unused_options))}.")
+
+    def initialize_chain(self, agent: str, conversation_config: Dict[str, Any]) -> Tuple[ConversationChain, str]:
+        """Initialize a conversation and return a chain and a formatted system prompt."""
+        with self.instrumentation.span("prompt_format"):
+            system_message = self.format_system_message(agent, conversation_config)
+
+        with self.instrumentation.span("chain_init"):
+            prompt = ChatPromptTemplate.from_messages([
+                SystemMessage(content=system_message),
+                MessagesPlaceholder(variable_name="history"),
+                self.input_template
+            ])
+
+            memory = BoundedConversationMemory(return_messages=True,
+                                               strategy=self.config.memory,
+                                               window=self.config.memory_window,
+                                               max_tokens=self.config.memory_max_tokens,
+                                               summarize=lambda summary, messages: self.summarize(agent, summary, messages))
+            llm = self.backends.get_chat_model(self.get_agent_model(agent),
+                                               conversation_config["temperature"],
+                                               self.config.openai_api_key,
+                                               self.config.streaming)
+            chain = ConversationChain(memory=memory, prompt=prompt, llm=llm)
+
+        return chain, system_message
+
+    def format_system_message(self, agent: str, conversation_config: Dict[str, Any]) -> str:
+        """Fill the system prompt of an agent with the options of a combination, in the configured layout."""
+        system_template = self.system_templates[agent]
         template_params = {key: conversation_config[key]
                            for key in system_template.input_variables}
-        system_message = system_template.format(**template_params).content
 
-        prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(content=system_message),
-            MessagesPlaceholder(variable_name="history"),
-            HumanMessagePromptTemplate.from_template("{input}")
-        ])
+        if self.config.system_layout == "prefix" and template_params:
+            values = "\n".join(f"{key}: {value}" for key, value in template_params.items())
+            return f"{self.system_prefixes[agent]}\n\n{values}"
 
+        # The placeholders were validated up front, so plain string formatting is enough.
+        return system_template.template.format(**template_params)
+
+    def get_agent_model(self, agent: str) -> str:
+        """Select the model of an agent."""
         # Select model for each agent. Only if specific model for both agents is provided, value will be used.
         model_for_llm = self.config.model
         if(self.config.model_agent_one and self.config.model_agent_one):
@@ -100,12 +224,145 @@ class ConversationsGenerator(DatasetGenerator):
             elif(agent == "agent2"):
                 model_for_llm = self.config.model_agent_two
 
-        memory = ConversationBufferMemory(return_messages=True)
-        llm = ChatOpenAI(temperature=conversation_config["temperature"],
-                         openai_api_key=self.config.openai_api_key, model=model_for_llm)
-        chain = ConversationChain(memory=memory, prompt=prompt, llm=llm)
+        return model_for_llm
 
-        return chain, system_message
+    def get_agent_backend(self, agent: str) -> str:
+        """Get the "backend|model" string of an agent, or the name of the logical backend serving its model."""
+        model = self.get_agent_model(agent)
+        return model if "|" in model or model in self.backends.routers else f"openai|{model}"
+
+    def get_backends(self) -> List[str]:
+        """Get the backends of both agents, which also extend the summaries of their memories."""
+        return sorted({self.get_agent_backend(agent) for agent in ["agent1", "agent2"]})
+
+    def summarize(self, agent: str, summary: str, messages: List[BaseMessage]) -> str:
+        """Extend the summary of an agent's conversation memory with messages that left its window."""
+        prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=get_buffer_string(messages))
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key("summary", self.get_agent_model(agent), prompt)
+            output = self.cache.get(cache_key)
+            if output is not None:
+                return output
+
+        llm = self.backends.get_chat_model(self.get_agent_model(agent), 0, self.config.openai_api_key)
+        output = self.call_backend(self.get_agent_backend(agent),
+                                   count_tokens(prompt),
+                                   0,
+                                   llm.predict,
+                                   prompt)
+
+        if cache_key is not None:
+            self.cache.set(cache_key, output)
+
+        return output
+
+    def call_chain(
+        self,
+        agent: str,
+        chain: ConversationChain,
+        system_message: str,
+        history: List[List[str]],
+        chain_input: str
+    ) -> str:
+        """Send a conversation turn to the agent's backend within its rate limits."""
+        prompt_tokens = count_tokens(system_message) + count_tokens(chain_input)
+        prompt_tokens += sum(count_tokens(content) for _, content in history)
+        self.prefix_tracker.record(self.system_prefixes[agent], self.get_agent_backend(agent))
+
+        if self.config.streaming:
+            return self.call_backend(self.get_agent_backend(agent),
+                                     prompt_tokens,
+                                     0,
+                                     self.stream_chain,
+                                     agent,
+                                     chain,
+                                     chain_input)
+
+        return self.call_backend(self.get_agent_backend(agent),
+                                 prompt_tokens,
+                                 0,
+                                 chain.predict,
+                                 input=chain_input)
+
+    def stream_chain(self, agent: str, chain: ConversationChain, chain_input: str) -> str:
+        """Stream a conversation turn, aborting the response as soon as the agent outputs the end phrase."""
+        end_phrase = None
+        if self.config.interruption == "end_phrase":
+            if self.config.end_agent == agent or self.config.end_agent == "both":
+                end_phrase = self.config.end_phrase
+
+        handler = StreamingHandler(end_phrase)
+        try:
+            output = chain.predict(input=chain_input, callbacks=[handler])
+        except EndPhraseReached as end:
+            # The chain did not finish, so the partial response is added to the memory here.
+            output = end.text
+            chain.memory.save_context({"input": chain_input}, {"response": output})
+        finally:
+            if handler.first_token_seconds is not None:
+                self.instrumentation.record_first_token(self.get_agent_backend(agent), handler.first_token_seconds)
+
+        return output
+
+    def predict(
+        self,
+        agent: str,
+        chain: ConversationChain,
+        system_message: str,
+        conversation_config: Dict[str, Any],
+        chain_input: str
+    ) -> str:
+        """Produce the next utterance of an agent, reusing a cached response for the same conversation state."""
+        history = [[message.type, message.content] for message in chain.memory.buffer]
+        if self.cache is None:
+            return self.call_chain(agent, chain, system_message, history, chain_input)
+
+        attempt = [conversation_config["attempt"]] if "attempt" in conversation_config else []
+        cache_key = self.cache.make_key("conversations",
+                                        self.get_agent_model(agent),
+                                        conversation_config["temperature"],
+                                        conversation_config["sample_id"],
+                                        system_message,
+                                        history,
+                                        chain_input,
+                                        *attempt)
+
+        output = self.cache.get(cache_key)
+        if output is None:
+            output = self.call_chain(agent, chain, system_message, history, chain_input)
+            self.cache.set(cache_key, output)
+        else:
+            chain.memory.save_context({"input": chain_input}, {"response": output})
+
+        return output
+
+    def estimate_item_usage(self, conversation_config: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+        """Estimate the usage of a conversation that runs to its maximum length.
+
+        Utterances are assumed to have ESTIMATED_UTTERANCE_TOKENS tokens, and the history sent on each turn is
+        bounded like the agent's memory. Requests that extend summaries are not included.
+        """
+        system_tokens = {agent: count_tokens(self.format_system_message(agent, conversation_config))
+                         for agent in self.system_templates}
+
+        requests = []
+        for turn in range(2 * conversation_config["length"]):
+            agent = "agent1" if turn % 2 == 0 else "agent2"
+            # An agent's memory holds its previous inputs and responses.
+            history_messages = turn if agent == "agent1" else turn - 1
+            if self.config.memory != "buffer":
+                history_messages = min(history_messages, 2 * self.config.memory_window)
+
+            history_tokens = history_messages * ESTIMATED_UTTERANCE_TOKENS
+            if self.config.memory_max_tokens is not None:
+                history_tokens = min(history_tokens, self.config.memory_max_tokens)
+
+            prompt_tokens = system_tokens[agent] + history_tokens + ESTIMATED_UTTERANCE_TOKENS
+            requests.append((self.get_agent_backend(agent), prompt_tokens, ESTIMATED_UTTERANCE_TOKENS))
+
+        return requests
 
     def end_phrase_interruption(self, agent: str, message: str) -> bool:
         """Check whether to interrupt conversation generation."""
@@ -116,41 +373,79 @@ class ConversationsGenerator(DatasetGenerator):
 
         return False
 
-    def generate_item(self) -> Dict[str, Union[List[List[Any]], float, int]]:
-        """Run two chains to talk with one another and record the chat history."""
-        if self.generator_index >= len(self.options_configs):
-            raise StopIteration()
+    def start_conversation(self, conversation_config: Dict[str, Any]) -> "Conversation":
+        """Initialize the chains of both agents for a new conversation."""
+        chain1, system_prompt1 = self.initialize_chain("agent1", conversation_config)
+        chain2, system_prompt2 = self.initialize_chain("agent2", conversation_config)
+
+        return Conversation(config=conversation_config,
+                            chains={"agent1": chain1, "agent2": chain2},
+                            system_prompts={"agent1": system_prompt1, "agent2": system_prompt2},
+                            next_input=conversation_config["initial_utterance"],
+                            finished=conversation_config["length"] <= 0)
 
-        conversation_config = self.options_configs[self.generator_index]
-        self.generator_index += 1
+    def take_turn(self, conversation: "Conversation") -> None:
+        """Produce the next utterance of a conversation."""
+        agent = conversation.next_agent
+        output = self.predict(agent,
+                              conversation.chains[agent],
+                              conversation.system_prompts[agent],
+                              conversation.config,
+                              conversation.next_input)
+        conversation.utterances.append([agent, output])
 
-        chain1, system_prompt1 = self.initialize_chain("agent1",
-                                                       self.config.agent1,
-                                                       conversation_config)
+        max_utterances = 2 * conversation.config["length"]
+        if self.end_phrase_interruption(agent, output) or len(conversation.utterances) >= max_utterances:
+            conversation.finished = True
 
-        chain2, system_prompt2 = self.initialize_chain("agent2",
-                                                       self.config.agent2,
-                                                       conversation_config)
+        conversation.next_agent = "agent2" if agent == "agent1" else "agent1"
+        conversation.next_input = output
 
-        utterances = []
+    def finish_conversation(self, conversation: "Conversation") -> Dict[str, Union[List[List[Any]], float, int]]:
+        """Build the data item of a conversation."""
+        return {**conversation.config,
+                "agent1": conversation.system_prompts["agent1"],
+                "agent2": conversation.system_prompts["agent2"],
+                "utterances": conversation.utterances,
+                "memory": {"strategy": self.config.memory,
+                           "window": self.config.memory_window,
+                           "max_tokens": self.config.memory_max_tokens}}
 
-        chain1_inp = conversation_config["initial_utterance"]
-        for _ in range(conversation_config["length"]):
-            chain1_out = chain1.predict(input=chain1_inp)
-            utterances.append(["agent1", chain1_out])
+    def generate_item_from_config(self, conversation_config: Dict[str, Any]) -> Dict[str, Union[List[List[Any]], float, int]]:
+        """Run two chains to talk with one another and record the chat history."""
+        conversation = self.start_conversation(conversation_config)
+        while not conversation.finished:
+            self.take_turn(conversation)
+
+        return self.finish_conversation(conversation)
 
-            if self.end_phrase_interruption("agent1", chain1_out):
-                break
+    async def agenerate_item_from_config(self, conversation_config: Dict[str, Any]) -> Dict[str, Union[List[List[Any]], float, int]]:
+        """Run a conversation dispatching each turn as soon as the previous one returns.
 
-            chain2_out = chain2.predict(input=chain1_out)
-            utterances.append(["agent2", chain2_out])
+        Turns of one conversation stay sequential, while the async engine keeps up to `concurrency`
+        conversations active and starts a new one whenever a conversation ends.
+        """
+        conversation = self.start_conversation(conversation_config)
+        while not conversation.finished:
+            await self.run_in_executor(self.take_turn, conversation)
 
-            if self.end_phrase_interruption("agent2", chain2_out):
-                break
+        return self.finish_conversation(conversation)
 
-            chain1_inp = chain2_out
 
-        return {**conversation_config,
-                "agent1": system_prompt1,
-                "agent2": system_prompt2,
-                "utterances": utterances}
+@dataclass
+class Conversation:
+    """State of a conversation in progress."""
+    config: Dict[str, Any]
+    """Options combination of the conversation."""
+    chains: Dict[str, ConversationChain]
+    """Chains of the agents."""
+    system_prompts: Dict[str, str]
+    """Formatted system prompts of the agents."""
+    next_input: str
+    """Input of the next turn."""
+    next_agent: str = "agent1"
+    """Agent producing the next utterance."""
+    utterances: List[List[str]] = field(default_factory=lambda: [])
+    """Utterances produced so far."""
+    finished: bool = False
+    """Whether the conversation reached its length or end phrase."""
@@ -0,0 +1,143 @@
+import threading
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+MODEL_PRICES = {
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-4": (0.03, 0.06),
+    "text-davinci-003": (0.02, 0.02),
+    "text-davinci-002": (0.02, 0.02),
+    "text-curie-001": (0.002, 0.002),
+    "text-babbage-001": (0.0005, 0.0005),
+    "text-ada-001": (0.0004, 0.0004),
+}
+"""Prices in USD per 1000 prompt and completion tokens by model name. Dated snapshots, such as "gpt-4-0613",
+use the price of the longest model name they start with."""
+FREE_BACKENDS = ["mock", "local"]
+"""Backends that do not charge for requests."""
+
+
+def get_model_price(backend_str: str) -> Optional[Tuple[float, float]]:
+    """Get the prices per 1000 prompt and completion tokens of a "backend|model" string or an OpenAI model name."""
+    backend, _, model = backend_str.rpartition("|")
+    if backend.lower() in FREE_BACKENDS:
+        return 0.0, 0.0
+    if backend and backend.lower() != "openai":
+        return None
+
+    names = [name for name in MODEL_PRICES if model == name or model.startswith(f"{name}-")]
+    if not names:
+        return None
+
+    return MODEL_PRICES[max(names, key=len)]
+
+
+def get_cost(backend_str: str, prompt_tokens: float, completion_tokens: float) -> Optional[float]:
+    """Get the cost in USD of a request, or None if the price of its model is unknown."""
+    price = get_model_price(backend_str)
+    if price is None:
+        return None
+
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+
+
+@dataclass
+class UsageEstimate:
+    items: int = 0
+    """Number of items the estimate covers."""
+    prompt_tokens: float = 0.0
+    """Expected number of prompt tokens."""
+    completion_tokens: float = 0.0
+    """Upper bound of the number of completion tokens."""
+    cost: float = 0.0
+    """Upper bound of the cost in USD of the backends with a known price."""
+    unpriced_backends: List[str] = field(default_factory=lambda: [])
+    """Backends whose requests are not included in the cost."""
+
+    def add(self, backend_str: str, prompt_tokens: float, completion_tokens: float) -> None:
+        """Add the usage of a request."""
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        cost = get_cost(backend_str, prompt_tokens, completion_tokens)
+        if cost is not None:
+            self.cost += cost
+        elif backend_str not in self.unpriced_backends:
+            self.unpriced_backends.append(backend_str)
+
+    def scale(self, factor: float) -> None:
+        """Extrapolate the usage of a sample of items to all items."""
+        self.prompt_tokens *= factor
+        self.completion_tokens *= factor
+        self.cost *= factor
+
+
+class Budget:
+    """Limits on the tokens and money spent by a run.
+
+    Usage is charged after every request. Once a limit is reached the generators stop scheduling new items,
+    while the items in flight are still completed, so a run may exceed its limits by the usage of those items.
+    A budget may be shared by several generators, and a child budget also charges its parent.
+    """
+
+    max_cost: Optional[float] = None
+    """Maximum cost in USD of the requests to backends with a known price."""
+    max_tokens: Optional[int] = None
+    """Maximum number of prompt and completion tokens."""
+    parent: Optional["Budget"] = None
+    """Budget shared with other generators that is charged as well."""
+
+    def __init__(
+        self,
+        max_cost: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        parent: Optional["Budget"] = None
+    ) -> None:
+        """Initialize Budget."""
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.parent = parent
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.lock = threading.Lock()
+
+    def charge(self, backend_str: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+        """Add the usage of a request and return its cost."""
+        cost = get_cost(backend_str, prompt_tokens, completion_tokens)
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost or 0.0
+
+        if self.parent is not None:
+            self.parent.charge(backend_str, prompt_tokens, completion_tokens)
+
+        return cost
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether a limit of this budget or of its parent has been reached."""
+        if self.max_cost is not None and self.cost >= self.max_cost:
+            return True
+        if self.max_tokens is not None and self.prompt_tokens + self.completion_tokens >= self.max_tokens:
+            return True
+
+        return self.parent is not None and self.parent.exhausted
+
+
+def split_usage(usage: Dict[str, float], count: int) -> List[Dict[str, float]]:
+    """Divide the usage of a request producing several items evenly, keeping token counts whole."""
+    shares = [{} for _ in range(count)]
+    for key, value in usage.items():
+        if isinstance(value, int):
+            for position in range(count):
+                shares[position][key] = value // count + (1 if position < value % count else 0)
+        else:
+            for position in range(count):
+                shares[position][key] = None if value is None else value / count
+
+    return shares
@@ -0,0 +1,185 @@
+import re
+import json
+import zlib
+import random
+import hashlib
+
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+MERSENNE_PRIME = (1 << 61) - 1
+"""Modulus of the universal hash functions of the MinHash signatures."""
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase a text and collapse its whitespace so that trivial variations are exact duplicates."""
+    return " ".join(text.lower().split())
+
+
+def get_item_text(item: Dict[str, Any]) -> str:
+    """Get the generated text of a dataset item."""
+    if "utterances" in item:
+        return "\n".join(text for _, text in item["utterances"])
+
+    return item.get("output", "")
+
+
+def get_shingles(text: str, size: int) -> Set[int]:
+    """Hash the overlapping word n-grams of a normalized text."""
+    words = re.findall(r"\w+", text)
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+
+    return {zlib.crc32(" ".join(words[position:position + size]).encode("utf-8"))
+            for position in range(len(words) - size + 1)}
+
+
+@dataclass
+class DeduplicationStats:
+    generated: int = 0
+    """Number of items produced for an options combination, including dropped ones."""
+    exact_duplicates: int = 0
+    """Number of dropped items identical to a previous one after normalization."""
+    near_duplicates: int = 0
+    """Number of dropped items similar to a previous one."""
+
+    @property
+    def drop_rate(self) -> float:
+        """Share of the produced items that were dropped."""
+        dropped = self.exact_duplicates + self.near_duplicates
+        return dropped / self.generated if self.generated else 0.0
+
+
+class Deduplicator:
+    """Filter of exact and near-duplicate texts with a bounded in-memory index.
+
+    Exact duplicates are found by the hash of the normalized text. Near duplicates are found with MinHash
+    signatures of word shingles, indexed by locality-sensitive hashing in `bands` bands. Candidates sharing a band
+    are kept if their estimated Jaccard similarity reaches `threshold`. Once `max_entries` texts are indexed, the
+    oldest ones are forgotten.
+    """
+
+    threshold: float
+    """Minimum estimated Jaccard similarity of near duplicates."""
+    num_permutations: int
+    """Number of hash functions of a MinHash signature."""
+    bands: int
+    """Number of LSH bands. Each band covers `num_permutations // bands` hash values."""
+    shingle_size: int
+    """Number of words of each shingle."""
+    max_entries: int
+    """Maximum number of indexed texts."""
+    stats: Dict[str, DeduplicationStats]
+    """Drop statistics by options combination."""
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_permutations: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        max_entries: int = 100000,
+        seed: int = 0
+    ) -> None:
+        """Initialize Deduplicator."""
+        if num_permutations % bands != 0:
+            raise ValueError("The number of permutations must be a multiple of the number of bands.")
+
+        self.threshold = threshold
+        self.num_permutations = num_permutations
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.stats = {}
+
+        generator = random.Random(seed)
+        self.permutations = [(generator.randrange(1, MERSENNE_PRIME), generator.randrange(MERSENNE_PRIME))
+                             for _ in range(num_permutations)]
+
+        self.exact_hashes: OrderedDict[bytes, None] = OrderedDict()
+        self.signatures: OrderedDict[int, Tuple[int, ...]] = OrderedDict()
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self.next_id = 0
+
+    def get_signature(self, text: str) -> Tuple[int, ...]:
+        """Compute the MinHash signature of a normalized text."""
+        shingles = get_shingles(text, self.shingle_size)
+        return tuple(min((a * shingle + b) % MERSENNE_PRIME for shingle in shingles)
+                     for a, b in self.permutations)
+
+    def get_band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        """Split a signature into the keys of its LSH buckets."""
+        rows = self.num_permutations // self.bands
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def find_near_duplicate(self, signature: Tuple[int, ...]) -> bool:
+        """Check whether an indexed signature is similar enough to the given one."""
+        candidates = set()
+        for band_key in self.get_band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+
+        for candidate in candidates:
+            other = self.signatures[candidate]
+            similarity = sum(1 for a, b in zip(signature, other) if a == b) / self.num_permutations
+            if similarity >= self.threshold:
+                return True
+
+        return False
+
+    def add(self, exact_hash: bytes, signature: Tuple[int, ...]) -> None:
+        """Index a unique text, forgetting the oldest ones if the index is full."""
+        self.exact_hashes[exact_hash] = None
+        if len(self.exact_hashes) > self.max_entries:
+            self.exact_hashes.popitem(last=False)
+
+        entry_id = self.next_id
+        self.next_id += 1
+        self.signatures[entry_id] = signature
+        for band_key in self.get_band_keys(signature):
+            self.buckets.setdefault(band_key, set()).add(entry_id)
+
+        if len(self.signatures) > self.max_entries:
+            oldest_id, oldest_signature = self.signatures.popitem(last=False)
+            for band_key in self.get_band_keys(oldest_signature):
+                bucket = self.buckets[band_key]
+                bucket.discard(oldest_id)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def check(self, text: str, combination: str) -> Optional[str]:
+        """Index a text unless it duplicates a previous one.
+
+        Return "exact" or "near" for duplicates, which should be dropped, and None for unique texts.
+        """
+        stats = self.stats.setdefault(combination, DeduplicationStats())
+        stats.generated += 1
+
+        normalized = normalize_text(text)
+        exact_hash = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if exact_hash in self.exact_hashes:
+            stats.exact_duplicates += 1
+            return "exact"
+
+        signature = self.get_signature(normalized)
+        if self.threshold < 1 and self.find_near_duplicate(signature):
+            stats.near_duplicates += 1
+            return "near"
+
+        self.add(exact_hash, signature)
+        return None
+
+    def get_report(self) -> List[Dict[str, Any]]:
+        """Get the drop statistics of every options combination."""
+        return [{"combination": json.loads(combination), **asdict(stats), "drop_rate": stats.drop_rate}
+                for combination, stats in self.stats.items()]
+
+    def get_total_stats(self) -> DeduplicationStats:
+        """Sum the drop statistics of all options combinations."""
+        total = DeduplicationStats()
+        for stats in self.stats.values():
+            total.generated += stats.generated
+            total.exact_duplicates += stats.exact_duplicates
+            total.near_duplicates += stats.near_duplicates
+
+        return total
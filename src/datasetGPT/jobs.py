@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from .base import DatasetGenerator
+from .costs import Budget
+from .outputs import DatasetWriter, check_output_options
+from .ratelimit import PrioritySlotPool
+from .runner import agenerate_dataset, prepare_dataset
+from .telemetry import ProgressReporter
+
+JOB_TYPES = ["texts", "conversations"]
+JOB_KEYS = ["name", "type", "priority", "concurrency", "path", "format", "compression", "single_file", "resume",
+            "overwrite", "background_writes"]
+SHARED_CONFIG_KEYS = ["requests_per_minute", "tokens_per_minute", "max_retries", "cache_path", "adaptive_concurrency"]
+
+
+@dataclass
+class Job:
+    name: str
+    """Name of the job used in reports."""
+    generator: DatasetGenerator
+    """Generator of the job's items."""
+    dataset_writer: DatasetWriter
+    """Writer of the job's output."""
+    concurrency: int
+    """Maximum number of the job's items in flight."""
+    remaining: int = 0
+    """Number of items left to generate."""
+
+
+def load_jobs_file(path: str) -> Dict[str, Any]:
+    """Read a jobs file in YAML or JSON. YAML requires PyYAML, JSON files are read without it."""
+    with open(path, "r") as jobs_file:
+        content = jobs_file.read()
+
+    if path.endswith(".json"):
+        return json.loads(content)
+
+    try:
+        import yaml
+    except ImportError:
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            raise ImportError("YAML jobs files require the PyYAML package. Install it with `pip install pyyaml` "
+                              "or write the jobs file in JSON.")
+
+    return yaml.safe_load(content)
+
+
+def get_job_generator(job_type: str) -> Tuple[Type[DatasetGenerator], Type[Any]]:
+    """Import the generator and config classes of a job type. Only conversations jobs load langchain."""
+    if job_type == "texts":
+        from .texts import TextsGenerator, TextsGeneratorConfig
+        return TextsGenerator, TextsGeneratorConfig
+
+    from .conversations import ConversationsGenerator, ConversationsGeneratorConfig
+    return ConversationsGenerator, ConversationsGeneratorConfig
+
+
+def create_job_generator(job_spec: Dict[str, Any], defaults: Dict[str, Any], slot_pool: PrioritySlotPool) -> DatasetGenerator:
+    """Create the generator of a job described in a jobs file and check its output settings."""
+    name = get_job_name(job_spec)
+    job_type = job_spec.get("type", "texts")
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Job {name}: unknown type {job_type}. Use one of {', '.join(JOB_TYPES)}.")
+
+    generator_class, config_class = get_job_generator(job_type)
+    config_fields = {config_field.name for config_field in fields(config_class)}
+    config_values = {key: value for key, value in job_spec.items() if key not in JOB_KEYS}
+
+    unknown_keys = config_values.keys() - config_fields
+    if unknown_keys:
+        raise ValueError(f"Job {name}: unknown keys {', '.join(sorted(unknown_keys))}.")
+
+    config_values = {**{key: value for key, value in defaults.items() if key in config_fields}, **config_values}
+    if "openai_api_key" in config_fields and "openai_api_key" not in config_values:
+        config_values["openai_api_key"] = os.environ.get("OPENAI_API_KEY")
+    # Options are given as lists of pairs, which YAML and JSON cannot express as tuples.
+    config_values["options"] = [tuple(option) for option in config_values.get("options", [])]
+
+    try:
+        generator = generator_class(config_class(**config_values))
+        check_output_options(job_spec.get("path"),
+                             job_spec.get("single_file", False),
+                             job_spec.get("format", "json"),
+                             job_spec.get("compression", "none"),
+                             job_spec.get("resume", False),
+                             job_spec.get("overwrite", False))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Job {name}: {error}")
+
+    generator.slot_pool = slot_pool
+    generator.priority = job_spec.get("priority", 0)
+
+    return generator
+
+
+def create_job(job_spec: Dict[str, Any], generator: DatasetGenerator, concurrency: int) -> Job:
+    """Create the writer of a job whose generator and output settings have been checked."""
+    dataset_writer = DatasetWriter(job_spec.get("path"),
+                                   job_spec.get("single_file", False),
+                                   job_spec.get("format", "json"),
+                                   job_spec.get("compression", "none"),
+                                   resume=job_spec.get("resume", False),
+                                   background=job_spec.get("background_writes", True),
+                                   overwrite=job_spec.get("overwrite", False))
+
+    return Job(name=get_job_name(job_spec),
+               generator=generator,
+               dataset_writer=dataset_writer,
+               concurrency=min(job_spec.get("concurrency", concurrency), concurrency))
+
+
+def get_job_name(job_spec: Dict[str, Any]) -> str:
+    """Get the name of a job used in errors and reports."""
+    return job_spec.get("name", job_spec.get("path", "job"))
+
+
+def check_shared_settings(job_specs: List[Dict[str, Any]], generators: List[DatasetGenerator]) -> None:
+    """Check that jobs writing to the same path or sending requests to the same backend agree.
+
+    Every backend has one rate limiter shared by all jobs, so its limits must not differ between jobs.
+    """
+    paths: Dict[str, str] = {}
+    rate_limits: Dict[str, Tuple[str, Tuple[Optional[float], Optional[float]]]] = {}
+
+    for job_spec, generator in zip(job_specs, generators):
+        name = get_job_name(job_spec)
+        path = job_spec.get("path")
+        if path is not None:
+            path = os.path.abspath(path)
+            if path in paths:
+                raise ValueError(f"Jobs {paths[path]} and {name} write to the same path {job_spec['path']}.")
+            paths[path] = name
+
+        job_rate_limits = (generator.config.requests_per_minute, generator.config.tokens_per_minute)
+        for backend_str in generator.get_backends():
+            other_name, other_rate_limits = rate_limits.setdefault(backend_str, (name, job_rate_limits))
+            if other_rate_limits != job_rate_limits:
+                raise ValueError(f"Jobs {other_name} and {name} set different rate limits for the backend {backend_str}. "
+                                 "Its rate limiter is shared by all jobs, so set requests_per_minute and "
+                                 "tokens_per_minute at the top level of the jobs file instead.")
+
+
+def load_jobs(path: str, concurrency: Optional[int] = None) -> List[Job]:
+    """Create the jobs of a jobs file sharing one pool of `concurrency` slots.
+
+    The top level of the file sets the global `concurrency` and defaults, such as rate limits, for all job configs.
+    Each entry of `jobs` has a `type` ("texts" or "conversations"), the fields of the corresponding generator config,
+    and optionally a `name`, a `priority`, its own `concurrency` cap and the output settings `path`, `format`,
+    `compression`, `single_file`, `resume`, `overwrite` and `background_writes`. Top-level `max_cost` and `max_tokens` limits
+    are shared by all jobs, while the same keys in a job only limit that job.
+    All jobs are checked before any output is opened, so an invalid job leaves the outputs of the others untouched.
+    """
+    jobs_file = load_jobs_file(path)
+    concurrency = concurrency or jobs_file.get("concurrency", 1)
+    defaults = {key: jobs_file[key] for key in SHARED_CONFIG_KEYS if key in jobs_file}
+    slot_pool = PrioritySlotPool(concurrency)
+
+    job_specs = jobs_file.get("jobs", [])
+    if not job_specs:
+        raise ValueError(f"The jobs file {path} does not define any jobs.")
+
+    generators = [create_job_generator(job_spec, defaults, slot_pool) for job_spec in job_specs]
+    check_shared_settings(job_specs, generators)
+    jobs = [create_job(job_spec, generator, concurrency) for job_spec, generator in zip(job_specs, generators)]
+
+    if "max_cost" in jobs_file or "max_tokens" in jobs_file:
+        budget = Budget(jobs_file.get("max_cost"), jobs_file.get("max_tokens"))
+        for job in jobs:
+            if job.generator.budget is None:
+                job.generator.budget = Budget(parent=budget)
+            else:
+                job.generator.budget.parent = budget
+
+    return jobs
+
+
+def run_jobs(jobs: List[Job], progress: bool = False) -> Dict[str, float]:
+    """Run all jobs concurrently in one event loop and return the time each one took."""
+    for job in jobs:
+        job.remaining = prepare_dataset(job.generator, job.dataset_writer)
+
+    progress_reporter = None
+    if progress:
+        progress_reporter = ProgressReporter(sum(job.remaining for job in jobs))
+
+    seconds = {}
+
+    async def run_job(job: Job) -> None:
+        start = time.perf_counter()
+        with job.dataset_writer:
+            await agenerate_dataset(job.generator, job.dataset_writer, job.concurrency, progress_reporter)
+        seconds[job.name] = time.perf_counter() - start
+
+    async def run() -> None:
+        await asyncio.gather(*(run_job(job) for job in jobs))
+
+    try:
+        asyncio.run(run())
+    finally:
+        if progress_reporter is not None:
+            progress_reporter.close()
+
+    return seconds
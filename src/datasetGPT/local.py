@@ -0,0 +1,390 @@
+import copy
+import time
+import queue
+import itertools
+import threading
+import warnings
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Tuple
+
+from .backends import Generation, GenerationResult
+
+LLAMA_CPP_EXTENSIONS = [".gguf", ".ggml", ".bin"]
+"""Extensions of model files loaded with llama.cpp. Other paths are loaded with transformers."""
+
+
+def import_transformers() -> Tuple[Any, Any]:
+    """Import torch and transformers, which are only required by local models that are not llama.cpp files."""
+    try:
+        import torch
+        import transformers
+    except ImportError:
+        raise ImportError(
+            "Local transformers models require the transformers and torch packages. "
+            "Install them with `pip install transformers torch`.")
+
+    return torch, transformers
+
+
+def import_llama_cpp() -> Any:
+    """Import llama-cpp-python, which is only required by local GGUF models."""
+    try:
+        import llama_cpp
+    except ImportError:
+        raise ImportError(
+            "Local GGUF models require the llama-cpp-python package. Install it with `pip install llama-cpp-python`.")
+
+    return llama_cpp
+
+
+def get_common_prefix_length(sequences: List[List[int]]) -> int:
+    """Get the number of leading tokens shared by all sequences."""
+    length = min(len(sequence) for sequence in sequences)
+    for position in range(length):
+        token = sequences[0][position]
+        if any(sequence[position] != token for sequence in sequences):
+            return position
+
+    return length
+
+
+@dataclass
+class LocalRequest:
+    prompts: List[str]
+    """Prompts to complete, repeated for several completions of the same prompt."""
+    temperature: float
+    """Sampling temperature. Greedy decoding is used at 0."""
+    max_tokens: int
+    """Maximum number of tokens of each completion."""
+    future: Future = field(default_factory=Future)
+    """Resolved with the completions and their prompt and completion tokens."""
+
+
+class LocalModel(ABC):
+    """Model loaded once per process that serves the requests of all threads in batches.
+
+    Requests are queued and a worker thread takes as many of them as are waiting, up to `max_batch_size` prompts
+    with the same generation parameters, as soon as the previous batch is done. Items in flight therefore share
+    forward passes, and the batch size follows the number of concurrent items.
+    """
+
+    path: str
+    """Path of the model file or directory, or the name of a model on the Hugging Face Hub."""
+    max_batch_size: int
+    """Maximum number of prompts generated together."""
+    batch_wait: float
+    """Time in seconds the worker waits for more requests before starting a batch that is not full."""
+    prompt_tokens: int = 0
+    """Number of prompt tokens processed so far."""
+    completion_tokens: int = 0
+    """Number of tokens generated so far."""
+    generation_seconds: float = 0.0
+    """Time spent generating batches."""
+    batches: int = 0
+    """Number of generated batches."""
+    prompts: int = 0
+    """Number of generated completions."""
+
+    def __init__(self, path: str, max_batch_size: int = 32, batch_wait: float = 0.005) -> None:
+        """Initialize LocalModel."""
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.requests: "queue.Queue[LocalRequest]" = queue.Queue()
+        self.worker: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Generated tokens per second of generation time."""
+        return self.completion_tokens / self.generation_seconds if self.generation_seconds else 0.0
+
+    def complete(self, prompts: List[str], temperature: float, max_tokens: int) -> List[Tuple[str, int, int]]:
+        """Generate a completion of each prompt together with the requests of other threads.
+
+        Return the completions with their numbers of prompt and completion tokens.
+        """
+        request = LocalRequest(prompts, temperature, max_tokens)
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.serve, daemon=True)
+                self.worker.start()
+        self.requests.put(request)
+
+        return request.future.result()
+
+    def take_batch(self) -> List[LocalRequest]:
+        """Wait for a request and add the compatible requests queued shortly after it."""
+        batch = [self.requests.get()]
+        size = len(batch[0].prompts)
+        deferred = []
+        deadline = time.monotonic() + self.batch_wait
+
+        while size < self.max_batch_size:
+            try:
+                request = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+
+            compatible = (request.temperature, request.max_tokens) == (batch[0].temperature, batch[0].max_tokens)
+            if compatible and size + len(request.prompts) <= self.max_batch_size:
+                batch.append(request)
+                size += len(request.prompts)
+            else:
+                deferred.append(request)
+
+        for request in deferred:
+            self.requests.put(request)
+
+        return batch
+
+    def serve(self) -> None:
+        """Generate the queued requests batch by batch."""
+        while True:
+            batch = self.take_batch()
+            prompts = [prompt for request in batch for prompt in request.prompts]
+
+            start = time.perf_counter()
+            try:
+                completions = self.generate_batch(prompts, batch[0].temperature, batch[0].max_tokens)
+            except Exception as error:
+                for request in batch:
+                    request.future.set_exception(error)
+                continue
+
+            with self.lock:
+                self.generation_seconds += time.perf_counter() - start
+                self.batches += 1
+                self.prompts += len(prompts)
+                self.prompt_tokens += sum(prompt_tokens for _, prompt_tokens, _ in completions)
+                self.completion_tokens += sum(completion_tokens for _, _, completion_tokens in completions)
+
+            position = 0
+            for request in batch:
+                request.future.set_result(completions[position:position + len(request.prompts)])
+                position += len(request.prompts)
+
+    @abstractmethod
+    def generate_batch(self, prompts: List[str], temperature: float, max_tokens: int) -> List[Tuple[str, int, int]]:
+        """Complete a batch of prompts and count their tokens."""
+
+
+class TransformersModel(LocalModel):
+    """Causal language model run with transformers and torch on the CPU or a GPU.
+
+    The prompts of a batch are generated in the same forward passes. The keys and values of the prefix shared by
+    the prompts of a batch, typically the part of the prompt template before the first option, are computed once
+    and kept in an LRU cache, so later batches starting with the same prefix skip it entirely.
+    """
+
+    prefix_cache_size: int
+    """Maximum number of cached prefixes."""
+    min_prefix_tokens: int
+    """Minimum length of a shared prefix worth caching."""
+
+    def __init__(
+        self,
+        path: str,
+        max_batch_size: int = 32,
+        batch_wait: float = 0.005,
+        prefix_cache_size: int = 8,
+        min_prefix_tokens: int = 8
+    ) -> None:
+        """Initialize TransformersModel."""
+        super().__init__(path, max_batch_size, batch_wait)
+        torch, transformers = import_transformers()
+
+        self.torch = torch
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(path)
+        self.model = transformers.AutoModelForCausalLM.from_pretrained(path)
+        self.model.eval()
+
+        if self.tokenizer.pad_token_id is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.pad_token_id = self.tokenizer.pad_token_id
+
+        self.prefix_cache_size = prefix_cache_size
+        self.min_prefix_tokens = min_prefix_tokens
+        self.prefix_cache: OrderedDict[Tuple[int, ...], Any] = OrderedDict()
+        self.prefix_cache_hits = 0
+        self.prefix_cache_enabled = True
+
+    def get_prefix_cache(self, token_ids: List[List[int]]) -> Tuple[int, Optional[Any]]:
+        """Get the cached keys and values of the longest usable prefix of all prompts.
+
+        At least one token of each prompt is left out of the prefix, so that every prompt has an input to
+        continue from.
+        """
+        shared = token_ids[0][:min(get_common_prefix_length(token_ids), min(map(len, token_ids)) - 1)]
+
+        for prefix in sorted(self.prefix_cache, key=len, reverse=True):
+            if len(prefix) <= len(shared) and tuple(shared[:len(prefix)]) == prefix:
+                self.prefix_cache.move_to_end(prefix)
+                self.prefix_cache_hits += 1
+                return len(prefix), self.prefix_cache[prefix]
+
+        if len(token_ids) < 2 or len(shared) < self.min_prefix_tokens:
+            return 0, None
+
+        with self.torch.no_grad():
+            past_key_values = self.model(self.torch.tensor([shared]), use_cache=True).past_key_values
+
+        self.prefix_cache[tuple(shared)] = past_key_values
+        if len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+
+        return len(shared), past_key_values
+
+    def expand_prefix_cache(self, past_key_values: Any, batch_size: int) -> Any:
+        """Copy the cached keys and values of a prefix for every prompt of a batch.
+
+        Generation appends to the copy, so the cached prefix itself is left unchanged.
+        """
+        if hasattr(past_key_values, "batch_repeat_interleave"):
+            expanded = copy.deepcopy(past_key_values)
+            expanded.batch_repeat_interleave(batch_size)
+            return expanded
+
+        # Older transformers versions return a tuple with the keys and values of each layer.
+        return tuple((key.expand(batch_size, -1, -1, -1).contiguous(),
+                      value.expand(batch_size, -1, -1, -1).contiguous())
+                     for key, value in past_key_values)
+
+    def generate_batch(self, prompts: List[str], temperature: float, max_tokens: int) -> List[Tuple[str, int, int]]:
+        """Complete a batch of prompts in the same forward passes, reusing the keys and values of their prefix."""
+        token_ids = [self.tokenizer(prompt).input_ids for prompt in prompts]
+
+        prefix_length, past_key_values = 0, None
+        if self.prefix_cache_enabled:
+            prefix_length, past_key_values = self.get_prefix_cache(token_ids)
+
+        # The suffixes are padded on their left, between the shared prefix and the rest of each prompt.
+        suffixes = [ids[prefix_length:] for ids in token_ids]
+        suffix_length = max(len(suffix) for suffix in suffixes)
+        input_ids = [ids[:prefix_length] + [self.pad_token_id] * (suffix_length - len(suffix)) + suffix
+                     for ids, suffix in zip(token_ids, suffixes)]
+        attention_mask = [[1] * prefix_length + [0] * (suffix_length - len(suffix)) + [1] * len(suffix)
+                          for suffix in suffixes]
+
+        generate_kwargs = {"input_ids": self.torch.tensor(input_ids),
+                           "attention_mask": self.torch.tensor(attention_mask),
+                           "max_new_tokens": max_tokens,
+                           "pad_token_id": self.pad_token_id,
+                           "do_sample": temperature > 0}
+        if temperature > 0:
+            generate_kwargs["temperature"] = temperature
+
+        with self.torch.no_grad():
+            if past_key_values is None:
+                sequences = self.model.generate(**generate_kwargs)
+            else:
+                try:
+                    sequences = self.model.generate(**generate_kwargs,
+                                                    past_key_values=self.expand_prefix_cache(past_key_values, len(prompts)))
+                except (TypeError, ValueError, RuntimeError) as error:
+                    warnings.warn(f"Disabling the prefix cache of {self.path}, which this model does not support: {error}")
+                    self.prefix_cache_enabled = False
+                    self.prefix_cache.clear()
+                    sequences = self.model.generate(**generate_kwargs)
+
+        completions = []
+        for ids, sequence in zip(token_ids, sequences[:, len(input_ids[0]):].tolist()):
+            if self.tokenizer.eos_token_id in sequence:
+                sequence = sequence[:sequence.index(self.tokenizer.eos_token_id) + 1]
+            text = self.tokenizer.decode(sequence, skip_special_tokens=True)
+            completions.append((text, len(ids), len(sequence)))
+
+        return completions
+
+
+class LlamaCppModel(LocalModel):
+    """GGUF model run with llama.cpp on the CPU.
+
+    llama.cpp evaluates one sequence at a time and keeps the keys and values of its last prompt. The prompts of
+    a batch are therefore generated in sorted order, so that consecutive prompts share their longest prefix and
+    only the remainder of each prompt is evaluated. Earlier prefixes are kept in a RAM cache.
+    """
+
+    seeds: Iterator[int]
+    """Seeds of the sampled completions, distinct across all requests served by the model."""
+
+    def __init__(
+        self,
+        path: str,
+        max_batch_size: int = 32,
+        batch_wait: float = 0.005,
+        context_size: int = 2048,
+        cache_bytes: int = 1 << 30
+    ) -> None:
+        """Initialize LlamaCppModel."""
+        super().__init__(path, max_batch_size, batch_wait)
+        llama_cpp = import_llama_cpp()
+
+        self.model = llama_cpp.Llama(model_path=path, n_ctx=context_size, verbose=False)
+        self.model.set_cache(llama_cpp.LlamaRAMCache(capacity_bytes=cache_bytes))
+        # Only the worker thread draws seeds, so the counter needs no lock.
+        self.seeds = itertools.count()
+
+    def generate_batch(self, prompts: List[str], temperature: float, max_tokens: int) -> List[Tuple[str, int, int]]:
+        """Complete the prompts of a batch in prefix order."""
+        completions = [None] * len(prompts)
+        for position in sorted(range(len(prompts)), key=lambda position: prompts[position]):
+            response = self.model.create_completion(prompts[position],
+                                                    max_tokens=max_tokens,
+                                                    temperature=temperature,
+                                                    # Repeated prompts need different seeds to get different samples.
+                                                    seed=next(self.seeds) if temperature > 0 else None)
+            usage = response["usage"]
+            completions[position] = (response["choices"][0]["text"], usage["prompt_tokens"], usage["completion_tokens"])
+
+        return completions
+
+
+def load_local_model(path: str) -> LocalModel:
+    """Load a llama.cpp model file or a transformers model directory or Hub name."""
+    if any(path.lower().endswith(extension) for extension in LLAMA_CPP_EXTENSIONS):
+        return LlamaCppModel(path)
+
+    return TransformersModel(path)
+
+
+@dataclass
+class LocalLLM:
+    """Completion LLM backed by a local model shared by the whole process.
+
+    It implements the part of the langchain LLM interface used by the texts generator.
+    """
+
+    model: LocalModel
+    """Loaded model serving the requests."""
+    temperature: float = 0.0
+    """Sampling temperature."""
+    max_tokens: int = 256
+    """Maximum number of tokens of a completion."""
+    n: int = 1
+    """Number of completions generated for each prompt."""
+
+    def __call__(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        """Generate a single completion of a prompt."""
+        return self.generate([prompt], stop).generations[0][0].text
+
+    def generate(self, prompts: List[str], stop: Optional[List[str]] = None) -> GenerationResult:
+        """Generate `n` completions of each prompt in the batches of the local model."""
+        completions = self.model.complete([prompt for prompt in prompts for _ in range(self.n)],
+                                          self.temperature,
+                                          self.max_tokens)
+
+        generations = [[Generation(text=text) for text, _, _ in completions[position:position + self.n]]
+                       for position in range(0, len(completions), self.n)]
+        # The prompt is processed once for all of its completions, like with the OpenAI API.
+        prompt_tokens = sum(prompt_tokens for _, prompt_tokens, _ in completions[::self.n])
+        completion_tokens = sum(completion_tokens for _, _, completion_tokens in completions)
+
+        return GenerationResult(generations=generations,
+                                llm_output={"token_usage": {"prompt_tokens": prompt_tokens,
+                                                            "completion_tokens": completion_tokens,
+                                                            "total_tokens": prompt_tokens + completion_tokens}})
@@ -0,0 +1,84 @@
+import os
+
+from typing import List, Optional, Set
+
+
+class RunManifest:
+    """Append-only record of the options combinations whose items have been saved.
+
+    The manifest is a text file with one combination index per line, listed in the order the items were written.
+    An optional first line starting with "#" holds a fingerprint of the options combinations.
+    """
+
+    path: str
+    """Path of the manifest file."""
+    indices: List[int]
+    """Indices of the saved items in the order they were written."""
+    completed: Set[int]
+    """Indices of the saved items."""
+    fingerprint: Optional[str] = None
+    """Fingerprint of the options combinations the indices refer to."""
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        """Initialize RunManifest."""
+        self.path = path
+        self.indices = []
+        self.completed = set()
+        self.unflushed: List[int] = []
+
+        if resume and os.path.isfile(path):
+            self.load()
+        else:
+            directory = os.path.dirname(path)
+            if directory != "" and directory != ".":
+                os.makedirs(directory, exist_ok=True)
+            open(path, "w").close()
+
+    def load(self) -> None:
+        """Read the indices recorded by a previous run."""
+        with open(self.path, "r") as manifest_file:
+            for line in manifest_file:
+                # A line without a newline was interrupted while being written.
+                if not line.endswith("\n"):
+                    break
+                if line.startswith("#"):
+                    self.fingerprint = line[1:].strip()
+                else:
+                    self.indices.append(int(line))
+
+        self.completed = set(self.indices)
+
+    def set_fingerprint(self, fingerprint: str) -> None:
+        """Record the fingerprint of the options combinations or check it against a resumed run."""
+        if self.fingerprint is not None and self.fingerprint != fingerprint:
+            raise ValueError("Cannot resume a run with different options. Start a new run or restore the original options.")
+
+        if self.fingerprint is None and not self.indices:
+            self.fingerprint = fingerprint
+            with open(self.path, "w") as manifest_file:
+                manifest_file.write(f"#{fingerprint}\n")
+
+    def mark(self, index: int) -> None:
+        """Record a saved item. The record is persisted on the next flush."""
+        self.indices.append(index)
+        self.completed.add(index)
+        self.unflushed.append(index)
+
+    def flush(self, sync: bool = False) -> None:
+        """Append the recently saved indices to the manifest file."""
+        if not self.unflushed:
+            return
+
+        with open(self.path, "a") as manifest_file:
+            manifest_file.write("".join(f"{index}\n" for index in self.unflushed))
+            if sync:
+                manifest_file.flush()
+                os.fsync(manifest_file.fileno())
+
+        self.unflushed = []
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.completed
@@ -0,0 +1,69 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import BaseMessage, SystemMessage
+
+from .tokens import count_tokens
+
+MEMORY_STRATEGIES = ["buffer", "window", "summary"]
+
+
+def truncate_messages(messages: List[BaseMessage], max_tokens: int) -> List[BaseMessage]:
+    """Keep the most recent messages whose total number of tokens fits in a budget."""
+    total_tokens = 0
+    for position in range(len(messages) - 1, -1, -1):
+        total_tokens += count_tokens(messages[position].content)
+        if total_tokens > max_tokens:
+            return messages[position + 1:]
+
+    return messages
+
+
+class BoundedConversationMemory(ConversationBufferMemory):
+    """Conversation memory that only sends a bounded part of the history to the model.
+
+    The whole history stays in `chat_memory`. The "buffer" strategy sends all of it, "window" sends the last
+    `window` exchanges and "summary" sends a running summary followed by the exchanges that are not summarized yet.
+    The summary is extended once `2 * window` exchanges are pending, keeping the last `window` of them verbatim.
+    Any strategy can be capped with `max_tokens`, which drops the oldest messages first.
+    """
+
+    strategy: str = "buffer"
+    """Strategy selecting the messages sent to the model: "buffer", "window" or "summary"."""
+    window: int = 5
+    """Number of most recent exchanges kept verbatim by the "window" and "summary" strategies."""
+    max_tokens: Optional[int] = None
+    """Maximum number of history tokens sent to the model, counted with the local tokenizer."""
+    summarize: Optional[Callable[[str, List[BaseMessage]], str]] = None
+    """Function extending a summary with new messages. Required by the "summary" strategy."""
+    summary: str = ""
+    """Summary of the messages that left the window."""
+    summarized: int = 0
+    """Number of messages included in the summary."""
+
+    @property
+    def buffer(self) -> Any:
+        """Messages sent to the model with the next input."""
+        messages = self.chat_memory.messages
+        if self.strategy == "window":
+            messages = messages[max(0, len(messages) - 2 * self.window):]
+        elif self.strategy == "summary":
+            messages = messages[self.summarized:]
+            if self.summary:
+                messages = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"), *messages]
+
+        if self.max_tokens is not None:
+            messages = truncate_messages(messages, self.max_tokens)
+
+        return messages
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Save an exchange and summarize older messages if enough of them are pending."""
+        super().save_context(inputs, outputs)
+
+        if self.strategy == "summary":
+            messages = self.chat_memory.messages
+            if len(messages) - self.summarized >= 4 * self.window:
+                end = len(messages) - 2 * self.window
+                self.summary = self.summarize(self.summary, messages[self.summarized:end])
+                self.summarized = end
@@ -0,0 +1,185 @@
+import time
+import random
+import asyncio
+
+from dataclasses import dataclass, fields, replace
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .backends import Generation, GenerationResult
+from .tokens import count_tokens
+
+MOCK_WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+              "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua"]
+
+
+@dataclass
+class MockProfile:
+    latency: float = 0.01
+    """Median latency of a request in seconds."""
+    sigma: float = 0.25
+    """Shape of the log-normal latency distribution. Larger values produce heavier tails."""
+    error_rate: float = 0.0
+    """Probability that a request fails with a retryable server error."""
+    throttle_rate: float = 0.0
+    """Probability that a request fails with a rate limit error."""
+    tokens: int = 64
+    """Average number of tokens of a completion."""
+    token_latency: float = 0.0
+    """Time in seconds to generate each token after the first one, which arrives after `latency`."""
+
+
+MOCK_PROFILES = {
+    "instant": MockProfile(latency=0.0, sigma=0.0),
+    "fast": MockProfile(),
+    "realistic": MockProfile(latency=0.8, sigma=0.5, tokens=120, token_latency=0.01),
+    "slow": MockProfile(latency=3.0, sigma=0.6, tokens=250, token_latency=0.02),
+    "flaky": MockProfile(latency=0.2, sigma=0.6, error_rate=0.05, throttle_rate=0.05),
+}
+
+
+def parse_mock_profile(profile_str: str) -> MockProfile:
+    """Parse a profile given by name, by "key=value" pairs or by a name followed by overrides.
+
+    For example: "fast", "latency=0.5,error_rate=0.1" or "realistic,throttle_rate=0.2".
+    """
+    profile = MockProfile()
+    overrides = {}
+    field_types = {profile_field.name: profile_field.type for profile_field in fields(MockProfile)}
+
+    for part in filter(None, profile_str.split(",")):
+        if "=" not in part:
+            if part not in MOCK_PROFILES:
+                raise ValueError(f"Unknown mock profile: {part}. Choose one of {', '.join(MOCK_PROFILES)}.")
+            profile = MOCK_PROFILES[part]
+            continue
+
+        key, value = part.split("=", 1)
+        if key not in field_types:
+            raise ValueError(f"Unknown mock profile parameter: {key}.")
+        overrides[key] = int(value) if field_types[key] in (int, "int") else float(value)
+
+    return replace(profile, **overrides)
+
+
+class MockServerError(Exception):
+    """Synthetic transient server error."""
+    status_code = 503
+
+
+class MockRateLimitError(Exception):
+    """Synthetic rate limit error."""
+    status_code = 429
+
+
+def sample_latency(profile: MockProfile) -> float:
+    """Sample the time in seconds until the first token of a response."""
+    if profile.latency <= 0:
+        return 0.0
+
+    return random.lognormvariate(0, profile.sigma) * profile.latency if profile.sigma else profile.latency
+
+
+def sample_tokens(profile: MockProfile, max_tokens: Optional[int] = None) -> List[str]:
+    """Possibly fail like a backend, and otherwise sample the tokens of a synthetic completion."""
+    outcome = random.random()
+    if outcome < profile.throttle_rate:
+        raise MockRateLimitError("Mock rate limit exceeded.")
+    if outcome < profile.throttle_rate + profile.error_rate:
+        raise MockServerError("Mock server error.")
+
+    num_tokens = max(1, int(random.expovariate(1 / profile.tokens))) if profile.tokens else 1
+    if max_tokens:
+        num_tokens = min(num_tokens, max_tokens)
+
+    return [" " + random.choice(MOCK_WORDS) for _ in range(num_tokens)]
+
+
+def simulate_request(
+    profile: MockProfile,
+    max_tokens: Optional[int] = None,
+    on_token: Optional[Callable[[str], None]] = None
+) -> str:
+    """Wait for a sampled latency, possibly fail, and return a synthetic completion.
+
+    If `on_token` is given, the completion is streamed to it one token at a time.
+    """
+    latency = sample_latency(profile)
+    if latency > 0:
+        time.sleep(latency)
+
+    tokens = sample_tokens(profile, max_tokens)
+    if on_token is None:
+        if profile.token_latency > 0:
+            time.sleep(profile.token_latency * (len(tokens) - 1))
+        return "".join(tokens)
+
+    for position, token in enumerate(tokens):
+        if position > 0 and profile.token_latency > 0:
+            time.sleep(profile.token_latency)
+        on_token(token)
+
+    return "".join(tokens)
+
+
+async def asimulate_request(
+    profile: MockProfile,
+    max_tokens: Optional[int] = None,
+    on_token: Optional[Callable[[str], Awaitable[None]]] = None
+) -> str:
+    """Simulate a request like `simulate_request` without blocking the event loop while waiting."""
+    await asyncio.sleep(sample_latency(profile))
+
+    tokens = sample_tokens(profile, max_tokens)
+    if on_token is None:
+        await asyncio.sleep(profile.token_latency * (len(tokens) - 1))
+        return "".join(tokens)
+
+    for position, token in enumerate(tokens):
+        if position > 0 and profile.token_latency > 0:
+            await asyncio.sleep(profile.token_latency)
+        await on_token(token)
+
+    return "".join(tokens)
+
+
+def get_token_usage(prompt_tokens: int, completions: List[str]) -> Dict[str, int]:
+    """Report token usage in the format of the OpenAI API."""
+    completion_tokens = sum(count_tokens(completion) for completion in completions)
+    return {"prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+@dataclass
+class MockLLM:
+    """Completion LLM returning synthetic outputs without network access.
+
+    It implements the part of the langchain LLM interface used by the texts generator without importing
+    langchain, so offline runs and benchmarks start quickly.
+    """
+
+    profile: MockProfile
+    """Latency, error and length characteristics of the responses."""
+    max_tokens: Optional[int] = None
+    """Maximum number of tokens of a completion."""
+    n: int = 1
+    """Number of completions generated for each prompt."""
+
+    def __call__(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        """Generate a single completion of a prompt."""
+        return simulate_request(self.profile, self.max_tokens)
+
+    def generate(self, prompts: List[str], stop: Optional[List[str]] = None) -> GenerationResult:
+        """Generate `n` completions of each prompt."""
+        generations = []
+        completions = []
+        for prompt in prompts:
+            # A prompt with several completions is a single request, like with the OpenAI API.
+            texts = [simulate_request(self.profile, self.max_tokens)]
+            texts += [simulate_request(replace(self.profile, latency=0), self.max_tokens) for _ in range(self.n - 1)]
+            generations.append([Generation(text=text) for text in texts])
+            completions += texts
+
+        prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+        return GenerationResult(generations=generations,
+                                llm_output={"token_usage": get_token_usage(prompt_tokens, completions)})
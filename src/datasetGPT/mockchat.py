@@ -0,0 +1,50 @@
+from typing import Any, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+
+from .mock import MockProfile, asimulate_request, get_token_usage, simulate_request
+from .tokens import count_tokens
+
+
+class MockChatModel(BaseChatModel):
+    """Chat model returning synthetic messages without network access."""
+
+    profile: MockProfile
+    """Latency, error and length characteristics of the responses."""
+    max_tokens: Optional[int] = None
+    """Maximum number of tokens of a message."""
+    streaming: bool = False
+    """Whether to stream messages to the callbacks one token at a time."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock-chat"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        on_token = run_manager.on_llm_new_token if self.streaming and run_manager is not None else None
+        text = simulate_request(self.profile, self.max_tokens, on_token)
+        prompt_tokens = sum(count_tokens(message.content) for message in messages)
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))],
+                          llm_output={"token_usage": get_token_usage(prompt_tokens, [text])})
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        on_token = run_manager.on_llm_new_token if self.streaming and run_manager is not None else None
+        text = await asimulate_request(self.profile, self.max_tokens, on_token)
+        prompt_tokens = sum(count_tokens(message.content) for message in messages)
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))],
+                          llm_output={"token_usage": get_token_usage(prompt_tokens, [text])})
@@ -1,8 +1,110 @@
+import io
 import os
 import json
+import gzip
+import time
+import queue
+import atexit
+import asyncio
+import threading
 
 from uuid import uuid4
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, List, BinaryIO, Optional, Sequence, Tuple
+
+from .columnar import COLUMNAR_FORMATS, COLUMNAR_COMPRESSIONS, COLUMNAR_MAGIC_NUMBERS, ColumnarWriter, import_pyarrow, to_row
+from .manifest import RunManifest
+
+OUTPUT_FORMATS = ["json", "jsonl", *COLUMNAR_FORMATS]
+COMPRESSION_EXTENSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_MAGIC_NUMBERS = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+
+def open_reader(path: str, compression: str = "none") -> BinaryIO:
+    """Open a possibly compressed streaming output for reading."""
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    elif compression == "zstd":
+        import zstandard
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"),
+                                                                            read_across_frames=True,
+                                                                            closefd=True))
+    return open(path, "rb")
+
+
+def detect_output_options(path: str) -> Tuple[bool, str, str]:
+    """Detect whether an existing output is a single file, its format and its compression."""
+    if os.path.isdir(path):
+        return False, "json", "none"
+
+    with open(path, "rb") as input_file:
+        header = input_file.read(6)
+
+    for output_format, magic_number in COLUMNAR_MAGIC_NUMBERS.items():
+        if header.startswith(magic_number):
+            return True, output_format, "none"
+
+    for compression, magic_number in COMPRESSION_MAGIC_NUMBERS.items():
+        if header.startswith(magic_number):
+            return True, "jsonl", compression
+
+    output_format = "json" if header.lstrip().startswith(b"[") else "jsonl"
+    return True, output_format, "none"
+
+
+def get_previous_output(path: str, single_file: bool) -> List[str]:
+    """List the files of a previous run writing to a path.
+
+    A single file output comes with its partial file and manifest, while every file of an output directory counts.
+    """
+    if single_file:
+        return [previous_path for previous_path in [path, f"{path}.part", f"{path}.manifest"]
+                if os.path.isfile(previous_path)]
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in os.listdir(path)]
+
+    return []
+
+
+def check_output_options(
+    path: Optional[str],
+    single_file: bool,
+    output_format: str,
+    compression: str,
+    resume: bool = False,
+    overwrite: bool = False
+) -> None:
+    """Check the settings of an output without writing anything, so that several outputs can be checked first."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}.")
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unsupported compression: {compression}.")
+    if output_format in COLUMNAR_FORMATS:
+        if compression not in COLUMNAR_COMPRESSIONS[output_format]:
+            raise ValueError(f"Compression {compression} is not supported for the {output_format} output format.")
+        import_pyarrow()
+    elif compression != "none" and output_format != "jsonl":
+        raise ValueError("Compression is only supported for the jsonl, parquet and arrow output formats.")
+
+    # Streaming and columnar outputs always write to a single file.
+    if output_format != "json":
+        single_file = True
+
+    if resume and path == None:
+        raise ValueError("Resuming a run requires the path of its output.")
+    if resume and output_format in COLUMNAR_FORMATS:
+        raise ValueError(f"Resuming a run is not supported for the {output_format} output format.")
+    if resume and overwrite:
+        raise ValueError("A run cannot both resume and overwrite its output.")
+
+    # Without a path, or with a directory in single file mode, the output gets a new unique name.
+    if path == None or (os.path.isdir(path) and single_file):
+        return
+    if os.path.isfile(path) and not single_file:
+        raise ValueError(
+            "Cannot write to a file with the single_file mode disabled. Try setting --single-file.")
+    if not resume and not overwrite and get_previous_output(path, single_file):
+        raise ValueError(f"The output {path} already exists. "
+                         "Use --resume to continue its run or --overwrite to replace it.")
 
 
 class DatasetWriter:
@@ -12,47 +114,410 @@ class DatasetWriter:
     """Whether to save all dataset items in a single file."""
     path: str
     """Path of the output file or directory."""
+    output_format: str
+    """Format of the output: "json", streaming "jsonl" or columnar "parquet" and "arrow"."""
+    compression: str
+    """Compression of a "jsonl" output ("none", "gzip" or "zstd") or codec of a columnar output."""
+    buffer_size: int
+    """Number of bytes buffered in memory before they are written to a "jsonl" output."""
+    fsync_interval: int
+    """Number of items after which a "jsonl" output is flushed and synced to disk."""
+    row_group_size: int
+    """Number of items of each row group of a columnar output."""
     dataset_items: List[Dict[str, Any]]
     """Collection of all the items in the current dataset."""
+    resume: bool
+    """Whether to continue a previous run writing to the same path."""
+    overwrite: bool
+    """Whether to replace the output of a previous run writing to the same path."""
+    manifest: RunManifest
+    """Record of the options combinations whose items have been saved."""
+    background: bool
+    """Whether items are written by a dedicated thread, so that slow disks do not stall generation."""
+    queue_size: int
+    """Number of items waiting for the writer thread after which saving an item blocks."""
+    on_write: Optional[Callable[[Optional[int], float], None]]
+    """Called with the index and the write time of each written item, on the thread that wrote it."""
 
-    def __init__(self, path: str = None, single_file: bool = False) -> None:
+    def __init__(
+        self,
+        path: str = None,
+        single_file: bool = False,
+        output_format: str = "json",
+        compression: str = "none",
+        buffer_size: int = 1 << 20,
+        fsync_interval: int = 100,
+        resume: bool = False,
+        row_group_size: int = 1000,
+        background: bool = False,
+        queue_size: int = 1000,
+        overwrite: bool = False
+    ) -> None:
         """Initialize DatasetWriter."""
+        check_output_options(path, single_file, output_format, compression, resume, overwrite)
+
+        # Streaming and columnar outputs always write to a single file.
+        if output_format != "json":
+            single_file = True
+
+        self.output_format = output_format
+        self.compression = compression
+
         if path == None and single_file:
-            path = self.get_unique_filename(os.getcwd())
+            path = self.get_unique_filename(os.getcwd(), self.extension)
         elif path == None and not single_file:
             path = self.get_unique_dirname(os.getcwd())
         elif os.path.isdir(path) and single_file:
-            path = self.get_unique_filename(path)
-        elif os.path.isfile(path) and not single_file:
-            raise ValueError(
-                "Cannot write to a file with the single_file mode disabled. Try setting --single-file.")
+            path = self.get_unique_filename(path, self.extension)
 
         self.single_file = single_file
         self.path = path
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.row_group_size = row_group_size
         self.dataset_items = []
+        self.option_values: Dict[str, Sequence[Any]] = {}
+        self.columnar_writer: Optional[ColumnarWriter] = None
+
+        self.stream_file: Optional[BinaryIO] = None
+        self.stream: Optional[BinaryIO] = None
+        self.stream_buffer: List[bytes] = []
+        self.stream_buffer_size = 0
+        self.unsynced_items = 0
+        self.directory_created = False
+
+        self.resume = resume
+        self.overwrite = overwrite
+        if overwrite:
+            self.remove_previous_output()
+        self.manifest = RunManifest(self.manifest_path, resume)
+        if resume:
+            self.restore()
+
+        self.background = background
+        self.queue_size = queue_size
+        self.queue: "queue.Queue[Optional[Tuple[Dict[str, Any], Optional[int]]]]" = queue.Queue(queue_size)
+        self.writer_thread: Optional[threading.Thread] = None
+        self.writer_error: Optional[BaseException] = None
+        self.on_write = None
+        if background:
+            self.start_writer()
+
+    @property
+    def extension(self) -> str:
+        """File extension of a single file output."""
+        if self.output_format in COLUMNAR_FORMATS:
+            return f".{self.output_format}"
+        return f".{self.output_format}{COMPRESSION_EXTENSIONS[self.compression]}"
+
+    @property
+    def partial_path(self) -> str:
+        """Path of a streaming output before it is finalized."""
+        return f"{self.path}.part"
+
+    @property
+    def manifest_path(self) -> str:
+        """Path of the run manifest."""
+        if self.single_file:
+            return f"{self.path}.manifest"
+        return os.path.join(self.path, ".manifest")
+
+    def remove_previous_output(self):
+        """Remove the items and the manifest of a previous run writing to the same path."""
+        for path in get_previous_output(self.path, self.single_file):
+            # Other files in an output directory are kept, only items and the manifest belong to a run.
+            if os.path.isfile(path) and (self.single_file or path.endswith(".json") or path == self.manifest_path):
+                os.remove(path)
+
+    def restore(self):
+        """Drop items of a resumed run that were written but not recorded in its manifest."""
+        if self.output_format == "jsonl":
+            if os.path.isfile(self.path) and not os.path.isfile(self.partial_path):
+                os.replace(self.path, self.partial_path)
+            if os.path.isfile(self.partial_path):
+                self.restore_stream()
+        elif self.single_file and os.path.isfile(self.path):
+            with open(self.path, "r") as input_file:
+                self.dataset_items = json.load(input_file)[:len(self.manifest)]
+
+    def restore_stream(self):
+        """Keep only the recorded lines of the partial file of a resumed streaming output."""
+        lines = []
+        try:
+            with self.open_reader(self.partial_path) as reader:
+                for line in reader:
+                    if len(lines) == len(self.manifest) or not line.endswith(b"\n"):
+                        break
+                    lines.append(line)
+        except (EOFError, OSError):
+            # The end of a compressed stream may be missing after a crash.
+            pass
+
+        if len(lines) < len(self.manifest):
+            raise ValueError(f"The output {self.partial_path} has fewer items than its manifest.")
+
+        os.remove(self.partial_path)
+        self.open_stream()
+        self.stream.write(b"".join(lines))
+        self.flush()
+
+    def open_reader(self, path: str) -> BinaryIO:
+        """Open a possibly compressed streaming output for reading."""
+        return open_reader(path, self.compression)
 
     def get_unique_dirname(self, base_path):
         """Get a unique dirname."""
         return os.path.join(base_path, str(uuid4()))
 
-    def get_unique_filename(self, base_path):
+    def get_unique_filename(self, base_path, extension=".json"):
         """Get a unique filename."""
-        return os.path.join(base_path, f"{uuid4()}.json")
+        return os.path.join(base_path, f"{uuid4()}{extension}")
 
-    def save_intermediate_result(self, result: Dict[str, Any]):
-        """Either save an item to its own file or concatenate it with all dataset items in a single file."""
-        if self.single_file:
-            self.dataset_items.append(result)
+    def get_indexed_filename(self, index: int) -> str:
+        """Get the filename of the item of an options combination."""
+        return os.path.join(self.path, f"{index}.json")
+
+    def set_option_values(self, option_values: Dict[str, Sequence[Any]]) -> None:
+        """Declare the possible values of each option so that columnar outputs get types fitting all of them."""
+        self.option_values = option_values
+
+    def write_row_group(self):
+        """Write the buffered items of a columnar output as one row group."""
+        if self.columnar_writer is None:
+            self.make_parent_directory()
+            self.columnar_writer = ColumnarWriter(self.partial_path,
+                                                  self.output_format,
+                                                  self.compression,
+                                                  self.option_values)
 
-            current_directory = os.path.dirname(self.path)
-            if current_directory != "" and current_directory != ".":
-                os.makedirs(current_directory, exist_ok=True)
+        self.columnar_writer.write_rows([to_row(item) for item in self.dataset_items])
+        self.dataset_items = []
+        self.manifest.flush(sync=True)
+
+    def make_parent_directory(self):
+        """Create the directory containing a single file output."""
+        current_directory = os.path.dirname(self.path)
+        if current_directory != "" and current_directory != ".":
+            os.makedirs(current_directory, exist_ok=True)
+
+    def open_stream(self):
+        """Open the partial file of a streaming output for appending."""
+        self.make_parent_directory()
+        self.stream_file = open(self.partial_path, "ab" if self.resume else "wb")
 
-            with open(self.path, "w") as output_file:
-                json.dump(self.dataset_items, output_file)
+        if self.compression == "gzip":
+            self.stream = gzip.GzipFile(fileobj=self.stream_file, mode="ab")
+        elif self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError(
+                    "zstd compression requires the zstandard package. Install it with `pip install zstandard`.")
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.stream_file, closefd=False)
         else:
-            current_filepath = self.get_unique_filename(self.path)
+            self.stream = self.stream_file
+
+    def append_line(self, result: Dict[str, Any]):
+        """Buffer an item as a single JSON line of a streaming output."""
+        if self.stream is None:
+            self.open_stream()
+
+        line = (json.dumps(result) + "\n").encode("utf-8")
+        self.stream_buffer.append(line)
+        self.stream_buffer_size += len(line)
+        self.unsynced_items += 1
+
+        if self.stream_buffer_size >= self.buffer_size:
+            self.write_buffer()
+        if self.unsynced_items >= self.fsync_interval:
+            self.flush()
+
+    def write_buffer(self):
+        """Write buffered lines to a streaming output."""
+        if self.stream_buffer:
+            self.stream.write(b"".join(self.stream_buffer))
+            self.stream_buffer = []
+            self.stream_buffer_size = 0
+
+    def flush(self):
+        """Write all buffered items of a streaming or columnar output and sync them to disk."""
+        if self.output_format in COLUMNAR_FORMATS and self.dataset_items:
+            self.write_row_group()
+        if self.stream is None:
+            return
+
+        self.write_buffer()
+        if self.compression == "gzip":
+            self.stream.flush(zlib_mode=gzip.zlib.Z_SYNC_FLUSH)
+        elif self.compression == "zstd":
+            import zstandard
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+
+        self.stream_file.flush()
+        os.fsync(self.stream_file.fileno())
+        self.unsynced_items = 0
+        self.manifest.flush(sync=True)
+
+    def close(self):
+        """Flush a streaming or columnar output and atomically move it to its final path."""
+        self.stop_writer()
+        if self.output_format in COLUMNAR_FORMATS:
+            if self.dataset_items:
+                self.write_row_group()
+            if self.columnar_writer is None:
+                return
+
+            self.columnar_writer.close()
+            os.replace(self.partial_path, self.path)
+            return
+
+        if self.stream is None:
+            return
+
+        self.write_buffer()
+        if self.stream is not self.stream_file:
+            self.stream.close()
+
+        self.stream_file.flush()
+        os.fsync(self.stream_file.fileno())
+        self.stream_file.close()
+        self.stream = self.stream_file = None
+        self.manifest.flush(sync=True)
+
+        os.replace(self.partial_path, self.path)
+
+    def write_items(self, items: List[Tuple[Dict[str, Any], Optional[int]]]):
+        """Write items with the indices of their options combinations, as one batch."""
+        start = time.perf_counter()
+        for result, index in items:
+            if index is not None:
+                self.manifest.mark(index)
+
+            if self.output_format == "jsonl":
+                self.append_line(result)
+            elif self.output_format in COLUMNAR_FORMATS or self.single_file:
+                self.dataset_items.append(result)
+                if self.output_format in COLUMNAR_FORMATS and len(self.dataset_items) >= self.row_group_size:
+                    self.write_row_group()
+            else:
+                if index is None:
+                    current_filepath = self.get_unique_filename(self.path)
+                else:
+                    current_filepath = self.get_indexed_filename(index)
+
+                if not self.directory_created:
+                    os.makedirs(self.path, exist_ok=True)
+                    self.directory_created = True
+                with open(current_filepath, "w") as output_file:
+                    json.dump(result, output_file)
 
-            os.makedirs(self.path, exist_ok=True)
-            with open(current_filepath, "w") as output_file:
-                json.dump(result, output_file)
+        # Streaming and columnar outputs record their manifest when they are flushed.
+        if self.output_format == "json":
+            if self.single_file:
+                self.make_parent_directory()
+                with open(self.path, "w") as output_file:
+                    json.dump(self.dataset_items, output_file)
+
+            self.manifest.flush()
+
+        if self.on_write is not None:
+            # The time of a batch is divided evenly among its items.
+            seconds = (time.perf_counter() - start) / len(items)
+            for _, index in items:
+                self.on_write(index, seconds)
+
+    def start_writer(self):
+        """Start the thread writing queued items. It is flushed at exit if the writer is never closed."""
+        self.writer_thread = threading.Thread(target=self.write_queued_items, name="datasetGPT-writer", daemon=True)
+        self.writer_thread.start()
+        atexit.register(self.flush_at_exit)
+
+    def write_queued_items(self):
+        """Write the queued items in batches until the writer is stopped."""
+        while True:
+            entries = [self.queue.get()]
+            while entries[-1] is not None:
+                try:
+                    entries.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            items = [entry for entry in entries if entry is not None]
+            try:
+                if items and self.writer_error is None:
+                    self.write_items(items)
+            except BaseException as error:
+                # The error is raised again in the thread saving items.
+                self.writer_error = error
+            finally:
+                for _ in entries:
+                    self.queue.task_done()
+
+            if entries[-1] is None:
+                return
+
+    def raise_writer_error(self):
+        """Raise the error that stopped the writer thread, if any."""
+        if self.writer_error is not None:
+            error, self.writer_error = self.writer_error, None
+            raise error
+
+    def stop_writer(self):
+        """Wait until all queued items are written and stop the writer thread."""
+        if self.writer_thread is None:
+            return
+
+        self.queue.put(None)
+        self.writer_thread.join()
+        self.writer_thread = None
+        atexit.unregister(self.flush_at_exit)
+        self.raise_writer_error()
+
+    def flush_at_exit(self):
+        """Write the queued items of a writer that was never closed, keeping them in its partial file."""
+        self.stop_writer()
+        self.flush()
+
+    def save_intermediate_result(self, result: Dict[str, Any], index: Optional[int] = None):
+        """Either save an item to its own file or concatenate it with all dataset items in a single file.
+
+        If the index of the item's options combination is given, it is recorded in the run manifest
+        and used to name the item's file. With a background writer, the item is queued instead, blocking
+        while the queue is full.
+        """
+        if self.writer_thread is None:
+            self.write_items([(result, index)])
+            return
+
+        while True:
+            self.raise_writer_error()
+            try:
+                self.queue.put((result, index), timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    async def asave_intermediate_result(self, result: Dict[str, Any], index: Optional[int] = None):
+        """Save an item without blocking the event loop while the queue of a background writer is full."""
+        if self.writer_thread is not None and self.writer_error is None:
+            try:
+                self.queue.put_nowait((result, index))
+                return
+            except queue.Full:
+                await asyncio.get_running_loop().run_in_executor(None, self.save_intermediate_result, result, index)
+                return
+
+        self.save_intermediate_result(result, index)
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Queued items are written first, also when the run is interrupted.
+        self.stop_writer()
+
+        # A failed run keeps its partial file so that it is never mistaken for a complete dataset.
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()
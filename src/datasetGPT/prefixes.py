@@ -0,0 +1,108 @@
+import time
+import hashlib
+import threading
+
+from string import Formatter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from .tokens import count_tokens
+
+SYSTEM_LAYOUTS = ["inline", "prefix"]
+PROVIDER_CACHE_SECONDS = 300
+"""Time after which a prefix is assumed to have left the prompt cache of a provider."""
+
+
+def get_constant_prefix(template: str) -> str:
+    """Get the literal text of a template before its first placeholder."""
+    prefix = ""
+    for literal_text, field_name, _, _ in Formatter().parse(template):
+        prefix += literal_text
+        if field_name is not None:
+            break
+
+    return prefix
+
+
+def get_placeholder_template(template: str) -> str:
+    """Replace the placeholders of a template by their names in angle brackets, so that it no longer varies."""
+    return "".join(literal_text + (f"<{field_name}>" if field_name is not None else "")
+                   for literal_text, field_name, _, _ in Formatter().parse(template))
+
+
+def get_placeholder_order(templates: List[str]) -> List[str]:
+    """Get the placeholders of templates in the order they first appear."""
+    order = []
+    for template in templates:
+        for _, field_name, _, _ in Formatter().parse(template):
+            if field_name is not None and field_name not in order:
+                order.append(field_name)
+
+    return order
+
+
+@dataclass
+class PrefixStats:
+    text: str
+    """Beginning of the prefix, for reports."""
+    tokens: int
+    """Number of tokens of the prefix."""
+    requests: int = 0
+    """Number of requests starting with the prefix."""
+    hits: int = 0
+    """Number of requests sent while the prefix was likely still in the prompt cache of the provider."""
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of the requests that could reuse a cached prefix."""
+        return self.hits / self.requests if self.requests else 0.0
+
+    @property
+    def reused_tokens(self) -> int:
+        """Number of prompt tokens that could be served from a prompt cache."""
+        return self.hits * self.tokens
+
+
+class PrefixTracker:
+    """Statistics of the constant prefixes that start the requests of a run.
+
+    A request counts as a hit when the same prefix was sent to the same backend less than `cache_seconds` ago,
+    which is when providers with automatic prompt caching, and local KV caches, can skip its tokens.
+    """
+
+    cache_seconds: float
+    """Time after which a prefix is assumed to have been evicted."""
+    stats: Dict[str, PrefixStats]
+    """Statistics by prefix hash."""
+
+    def __init__(self, cache_seconds: float = PROVIDER_CACHE_SECONDS) -> None:
+        """Initialize PrefixTracker."""
+        self.cache_seconds = cache_seconds
+        self.stats = {}
+        self.last_sent: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def record(self, prefix: str, backend_str: str) -> bool:
+        """Count a request starting with a prefix and return whether it could reuse a cached prefix."""
+        key = hashlib.blake2b(prefix.encode("utf-8"), digest_size=8).hexdigest()
+        now = time.monotonic()
+
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = PrefixStats(text=prefix[:60], tokens=count_tokens(prefix))
+                self.stats[key] = stats
+
+            last_sent: Optional[float] = self.last_sent.get(f"{backend_str}|{key}")
+            hit = last_sent is not None and now - last_sent < self.cache_seconds
+            self.last_sent[f"{backend_str}|{key}"] = now
+
+            stats.requests += 1
+            stats.hits += int(hit)
+
+        return hit
+
+    def get_report(self) -> List[Dict[str, Any]]:
+        """Get the statistics of every prefix."""
+        return [{"prefix": key, **asdict(stats), "hit_rate": stats.hit_rate, "reused_tokens": stats.reused_tokens}
+                for key, stats in self.stats.items()]
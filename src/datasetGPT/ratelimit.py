@@ -0,0 +1,235 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+
+from typing import Optional
+
+RETRYABLE_STATUS_CODES = [408, 409, 429, 500, 502, 503, 504]
+RETRYABLE_ERRORS = ["RateLimitError",
+                    "APIError",
+                    "APIConnectionError",
+                    "Timeout",
+                    "TryAgain",
+                    "ServiceUnavailableError",
+                    "ConnectionError",
+                    "TimeoutError"]
+THROTTLING_ERRORS = ["RateLimitError"]
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Get the HTTP status code attached to a backend error."""
+    for attribute in ["http_status", "status_code", "status"]:
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+
+    return None
+
+
+def is_throttling(error: Exception) -> bool:
+    """Check whether an error signals that the backend rate limit was exceeded."""
+    return type(error).__name__ in THROTTLING_ERRORS or get_status_code(error) == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed request may succeed if it is sent again."""
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    """Token bucket refilled at a constant rate.
+
+    Callers reserve tokens up front and may drive the balance negative. They then wait until the debt is repaid,
+    so requests larger than the bucket capacity are still admitted and callers are served in order.
+    """
+
+    rate: float
+    """Tokens added per second."""
+    capacity: float
+    """Maximum number of tokens that can accumulate while the bucket is idle."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10) -> None:
+        """Initialize TokenBucket."""
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take tokens from the bucket and return how many seconds to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+
+            return max(0.0, -self.tokens / self.rate)
+
+    def get_delay(self, amount: float) -> float:
+        """Get how many seconds a reservation of tokens would wait, without taking them."""
+        with self.lock:
+            tokens = min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+            return max(0.0, (amount - tokens) / self.rate)
+
+
+class RateLimiter:
+    """Requests per minute and tokens per minute limits of a backend."""
+
+    requests: Optional[TokenBucket] = None
+    """Bucket limiting the number of requests."""
+    tokens: Optional[TokenBucket] = None
+    """Bucket limiting the number of prompt and completion tokens."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        """Initialize RateLimiter."""
+        if requests_per_minute:
+            self.requests = TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request using the given number of tokens may be sent. Return the time waited."""
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+
+        if delay > 0:
+            time.sleep(delay)
+
+        return delay
+
+    def get_delay(self, tokens: int = 0) -> float:
+        """Get how long a request using the given number of tokens would wait, without acquiring it."""
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.get_delay(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.get_delay(tokens))
+
+        return delay
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    max_retries: int
+    """Maximum number of times a failed request is sent again."""
+    base_delay: float
+    """Upper bound in seconds of the first backoff delay."""
+    max_delay: float
+    """Upper bound in seconds of any backoff delay."""
+
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        """Initialize RetryPolicy."""
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int) -> float:
+        """Get a random delay before the retry following a given attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease controller of the number of requests in flight."""
+
+    limit: float
+    """Current number of allowed requests in flight."""
+    min_limit: float
+    """Lowest allowed limit."""
+    max_limit: float
+    """Highest allowed limit."""
+    decrease_factor: float
+    """Factor applied to the limit when the backend throttles requests."""
+    cooldown: float
+    """Seconds after a decrease during which further throttling is attributed to the same congestion."""
+
+    def __init__(
+        self,
+        max_limit: float,
+        min_limit: float = 1,
+        decrease_factor: float = 0.5,
+        cooldown: float = 5.0
+    ) -> None:
+        """Initialize AIMDController."""
+        self.limit = max_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.decreased = float("-inf")
+        self.lock = threading.Lock()
+
+    @property
+    def concurrency(self) -> int:
+        """Number of requests that may currently be in flight."""
+        return max(1, int(self.limit))
+
+    def on_success(self) -> None:
+        """Grow the limit by about one request per window of successful requests."""
+        with self.lock:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_throttle(self) -> None:
+        """Shrink the limit once per congestion event."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.decreased >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.decreased = now
+
+
+class PrioritySlotPool:
+    """Fixed number of slots for items in flight shared by several generators of one event loop.
+
+    When a slot is released, it is handed to the waiting generator with the highest priority,
+    and to the earliest one among equal priorities.
+    """
+
+    size: int
+    """Total number of slots."""
+    available: int
+    """Number of free slots."""
+
+    def __init__(self, size: int) -> None:
+        """Initialize PrioritySlotPool."""
+        self.size = size
+        self.available = size
+        self.waiters = []
+        self.counter = itertools.count()
+
+    async def acquire(self, priority: int = 0) -> None:
+        """Wait for a free slot."""
+        if self.available > 0 and not self.waiters:
+            self.available -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # A slot granted to a cancelled waiter is passed on.
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Free a slot or hand it to the next waiter."""
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self.available += 1
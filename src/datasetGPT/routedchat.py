@@ -0,0 +1,91 @@
+from typing import Any, List, Optional
+
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import BaseMessage, ChatResult
+
+from .router import Endpoint, Router
+from .tokens import count_tokens
+
+
+class TokenTracker:
+    """Run manager passing streamed tokens on to the callbacks of a request and noting whether any was delivered."""
+
+    run_manager: Any
+    """Run manager of the request."""
+    delivered: bool
+    """Whether a token reached the callbacks."""
+
+    def __init__(self, run_manager: Any) -> None:
+        """Initialize TokenTracker."""
+        self.run_manager = run_manager
+        self.delivered = False
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.run_manager, name)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.delivered = True
+        self.run_manager.on_llm_new_token(token, **kwargs)
+
+
+class RoutedChatModel(BaseChatModel):
+    """Chat model sending each request to an endpoint of a router."""
+
+    router: Router
+    """Router of the logical backend."""
+    backends: Any
+    """Registry providing the chat model of each endpoint."""
+    temperature: float = 0.7
+    """Sampling temperature."""
+    openai_api_key: Optional[str] = None
+    """API key of the endpoints that do not set their own."""
+    streaming: bool = False
+    """Whether to stream messages to the callbacks one token at a time."""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    def get_endpoint_model(self, endpoint: Endpoint) -> BaseChatModel:
+        """Get the chat model of an endpoint."""
+        model = endpoint.model if endpoint.backend == "openai" else endpoint.backend_str
+        return self.backends.get_chat_model(model,
+                                            self.temperature,
+                                            endpoint.api_key or self.openai_api_key,
+                                            self.streaming,
+                                            endpoint.api_base)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        tokens = sum(count_tokens(message.content) for message in messages)
+        if run_manager is None:
+            return self.router.call(tokens, lambda endpoint: self.get_endpoint_model(endpoint)._generate(messages,
+                                                                                                         stop,
+                                                                                                         **kwargs))
+
+        # The callbacks, such as the end phrase search, cannot take back streamed tokens, so a stream that
+        # failed after its first token is retried by the generator with fresh callbacks instead of failing over.
+        tracker = TokenTracker(run_manager)
+        return self.router.call(tokens,
+                                lambda endpoint: self.get_endpoint_model(endpoint)._generate(messages,
+                                                                                             stop,
+                                                                                             tracker,
+                                                                                             **kwargs),
+                                lambda: not tracker.delivered)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return self._generate(messages, stop, run_manager, **kwargs)
@@ -0,0 +1,300 @@
+import time
+import threading
+import contextvars
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from .ratelimit import RateLimiter, get_status_code, is_retryable, is_throttling
+from .tokens import count_tokens
+
+if TYPE_CHECKING:
+    from .backends import BackendRegistry, GenerationResult
+
+ENDPOINT_PARAMETERS = ["api_key", "api_base", "rpm", "tpm"]
+ENDPOINT_ERROR_STATUS_CODES = [401, 403, 404]
+"""Status codes of errors caused by an endpoint, such as a revoked API key, rather than by a request."""
+LATENCY_SMOOTHING = 0.3
+"""Weight of the latest request in the moving average of the latency of an endpoint."""
+
+served_endpoint: contextvars.ContextVar[Optional["Endpoint"]] = contextvars.ContextVar("served_endpoint", default=None)
+"""Endpoint that served the latest routed request of the current context, used to price and label it."""
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    backend: str
+    """Backend name, such as "openai"."""
+    model: str
+    """Model name or mock profile."""
+    api_key: Optional[str] = None
+    """API key of the endpoint. The generator key is used if unset."""
+    api_base: Optional[str] = None
+    """Base URL of an OpenAI-compatible API, such as a local server."""
+    requests_per_minute: Optional[float] = None
+    """Maximum number of requests per minute sent to the endpoint."""
+    tokens_per_minute: Optional[float] = None
+    """Maximum number of prompt and completion tokens per minute sent to the endpoint."""
+
+    @property
+    def backend_str(self) -> str:
+        """The "backend|model" string of the endpoint, used to price its requests."""
+        return f"{self.backend}|{self.model}"
+
+    @property
+    def description(self) -> str:
+        """Description of the endpoint for reports, without its full API key."""
+        description = self.backend_str
+        if self.api_base is not None:
+            description += f" at {self.api_base}"
+        if self.api_key is not None:
+            description += f" with key ...{self.api_key[-4:]}"
+
+        return description
+
+
+def parse_endpoint(spec: str) -> Endpoint:
+    """Parse an endpoint given as "backend|model" followed by "|key=value" parameters.
+
+    For example: "openai|gpt-3.5-turbo|api_base=http://localhost:8000/v1|api_key=sk-...|rpm=3500".
+    """
+    parts = spec.split("|")
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        raise ValueError(f"Invalid endpoint {spec}. Use \"backend|model\" followed by \"|key=value\" parameters.")
+
+    parameters = {}
+    for part in parts[2:]:
+        key, separator, value = part.partition("=")
+        if not separator or key not in ENDPOINT_PARAMETERS:
+            raise ValueError(f"Unknown endpoint parameter: {part}. Choose one of {', '.join(ENDPOINT_PARAMETERS)}.")
+        parameters[key] = value
+
+    return Endpoint(backend=parts[0].lower(),
+                    model=parts[1],
+                    api_key=parameters.get("api_key"),
+                    api_base=parameters.get("api_base"),
+                    requests_per_minute=float(parameters["rpm"]) if "rpm" in parameters else None,
+                    tokens_per_minute=float(parameters["tpm"]) if "tpm" in parameters else None)
+
+
+@dataclass
+class EndpointStats:
+    latency: Optional[float] = None
+    """Moving average of the latency of successful requests in seconds."""
+    in_flight: int = 0
+    """Number of requests being sent to the endpoint."""
+    requests: int = 0
+    """Number of requests sent to the endpoint."""
+    errors: int = 0
+    """Number of failed requests."""
+    consecutive_failures: int = 0
+    """Number of failures since the last successful request."""
+    open_until: float = 0.0
+    """Monotonic time until which the endpoint receives no requests."""
+    cooldown: float = 0.0
+    """Duration of the latest time the circuit of the endpoint was opened."""
+
+
+class Router:
+    """Dispatcher of the requests to a logical backend over a pool of interchangeable endpoints.
+
+    Each request goes to the available endpoint with the shortest expected wait: its average latency times
+    the requests it already serves, plus the time until its quota admits the request. After `failure_threshold`
+    consecutive failures, or a single error caused by the endpoint itself, its circuit opens and it receives
+    no requests for `cooldown` seconds, doubling up to `max_cooldown` while it keeps failing. A failed request
+    is sent to another endpoint right away, and throttled endpoints are avoided for `throttle_seconds`.
+    """
+
+    name: str
+    """Logical backend name used in place of a "backend|model" string."""
+    endpoints: List[Endpoint]
+    """Interchangeable endpoints serving the logical backend."""
+    stats: List[EndpointStats]
+    """Statistics of each endpoint."""
+    rate_limiters: List[RateLimiter]
+    """Quota of each endpoint."""
+    failure_threshold: int
+    """Number of consecutive failures after which the circuit of an endpoint opens."""
+    cooldown: float
+    """Seconds an endpoint is skipped after its circuit opens for the first time."""
+    max_cooldown: float
+    """Upper bound in seconds of the time an endpoint is skipped."""
+    throttle_seconds: float
+    """Seconds a throttled endpoint is skipped."""
+
+    def __init__(
+        self,
+        name: str,
+        endpoints: List[Endpoint],
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+        throttle_seconds: float = 10.0
+    ) -> None:
+        """Initialize Router. Endpoints without their own quota get the given limits."""
+        if not endpoints:
+            raise ValueError(f"The backend {name} has no endpoints.")
+
+        self.name = name
+        self.endpoints = endpoints
+        self.stats = [EndpointStats() for _ in endpoints]
+        self.rate_limiters = [RateLimiter(endpoint.requests_per_minute or requests_per_minute,
+                                          endpoint.tokens_per_minute or tokens_per_minute)
+                              for endpoint in endpoints]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.throttle_seconds = throttle_seconds
+        self.lock = threading.Lock()
+
+    def choose(self, tokens: int, tried: List[int]) -> Optional[int]:
+        """Reserve the endpoint with the shortest expected wait that was not tried for the current request.
+
+        If every endpoint is unavailable, the first attempt of a request goes to the one that recovers first.
+        """
+        now = time.monotonic()
+        with self.lock:
+            untried = [position for position in range(len(self.endpoints)) if position not in tried]
+            available = [position for position in untried if self.stats[position].open_until <= now]
+            if not available:
+                if tried or not untried:
+                    return None
+                available = [min(untried, key=lambda position: self.stats[position].open_until)]
+
+            # Endpoints without a measured latency are assumed to be as fast as the fastest one.
+            latencies = [stats.latency for stats in self.stats if stats.latency is not None]
+            default_latency = min(latencies, default=0.0)
+
+            def get_expected_wait(position: int) -> Tuple[float, int, int]:
+                stats = self.stats[position]
+                latency = default_latency if stats.latency is None else stats.latency
+                wait = latency * (stats.in_flight + 1) + self.rate_limiters[position].get_delay(tokens)
+                # Ties go to the least loaded endpoint, so that equivalent endpoints share the requests.
+                return wait, stats.in_flight, stats.requests
+
+            position = min(available, key=get_expected_wait)
+            stats = self.stats[position]
+            stats.in_flight += 1
+            stats.requests += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                # Half-open circuit: a single request probes the endpoint while others keep avoiding it.
+                stats.open_until = now + stats.cooldown
+
+        return position
+
+    def record_success(self, position: int, seconds: float) -> None:
+        """Update the latency of an endpoint and close its circuit."""
+        with self.lock:
+            stats = self.stats[position]
+            stats.in_flight -= 1
+            stats.latency = seconds if stats.latency is None else (LATENCY_SMOOTHING * seconds
+                                                                   + (1 - LATENCY_SMOOTHING) * stats.latency)
+            stats.consecutive_failures = 0
+            stats.open_until = 0.0
+            stats.cooldown = 0.0
+
+    def record_failure(self, position: int, error: Exception) -> None:
+        """Count a failed request and open the circuit of an endpoint that keeps failing."""
+        now = time.monotonic()
+        with self.lock:
+            stats = self.stats[position]
+            stats.in_flight -= 1
+            if not is_retryable(error) and get_status_code(error) not in ENDPOINT_ERROR_STATUS_CODES:
+                # Invalid requests, or streams stopped at their end phrase, say nothing about the endpoint.
+                return
+
+            stats.errors += 1
+            if is_throttling(error):
+                stats.open_until = max(stats.open_until, now + self.throttle_seconds)
+                return
+
+            if get_status_code(error) in ENDPOINT_ERROR_STATUS_CODES:
+                stats.consecutive_failures = max(stats.consecutive_failures + 1, self.failure_threshold)
+            else:
+                stats.consecutive_failures += 1
+
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.cooldown = min(self.max_cooldown, stats.cooldown * 2 or self.cooldown)
+                stats.open_until = now + stats.cooldown
+
+    def call(
+        self,
+        tokens: int,
+        request: Callable[[Endpoint], Any],
+        can_fail_over: Optional[Callable[[], bool]] = None
+    ) -> Any:
+        """Send a request to the best endpoint, failing over to the others when it fails.
+
+        Errors that no other endpoint can avoid are raised at once, as is the last error once every
+        available endpoint was tried, so that the generator retries with backoff. So is the error of a request
+        for which `can_fail_over` returns False, such as a stream that already delivered part of its response.
+        """
+        tried = []
+        last_error: Optional[Exception] = None
+        while True:
+            position = self.choose(tokens, tried)
+            if position is None:
+                if last_error is None:
+                    raise RuntimeError(f"The backend {self.name} has no available endpoints.")
+                raise last_error
+
+            endpoint = self.endpoints[position]
+            try:
+                self.rate_limiters[position].acquire(tokens)
+                start = time.perf_counter()
+                served_endpoint.set(endpoint)
+                result = request(endpoint)
+            except Exception as error:
+                self.record_failure(position, error)
+                if not is_retryable(error) and get_status_code(error) not in ENDPOINT_ERROR_STATUS_CODES:
+                    raise
+                if can_fail_over is not None and not can_fail_over():
+                    raise
+
+                tried.append(position)
+                last_error = error
+            else:
+                self.record_success(position, time.perf_counter() - start)
+                return result
+
+    def get_report(self) -> List[Dict[str, Any]]:
+        """Get the statistics of every endpoint."""
+        now = time.monotonic()
+        with self.lock:
+            return [{"endpoint": endpoint.description,
+                     "requests": stats.requests,
+                     "errors": stats.errors,
+                     "latency": stats.latency,
+                     "available": stats.open_until <= now}
+                    for endpoint, stats in zip(self.endpoints, self.stats)]
+
+
+@dataclass
+class RoutedLLM:
+    """Completion LLM sending each request to an endpoint of a router."""
+
+    router: Router
+    """Router of the logical backend."""
+    backends: "BackendRegistry"
+    """Registry providing the client of each endpoint."""
+    temperature: float
+    """Sampling temperature."""
+    max_tokens: int
+    """Maximum number of tokens of a completion."""
+    n: int = 1
+    """Number of completions generated for each prompt."""
+
+    def __call__(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        return self.generate([prompt], stop).generations[0][0].text
+
+    def generate(self, prompts: List[str], stop: Optional[List[str]] = None) -> "GenerationResult":
+        """Complete prompts with the endpoint chosen by the router."""
+        tokens = sum(count_tokens(prompt) for prompt in prompts) + len(prompts) * self.n * self.max_tokens
+
+        def request(endpoint: Endpoint) -> "GenerationResult":
+            llm = self.backends.get_endpoint_llm(endpoint, self.temperature, self.max_tokens, self.n)
+            return llm.generate(prompts, stop)
+
+        return self.router.call(tokens, request)
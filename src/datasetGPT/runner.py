@@ -0,0 +1,62 @@
+import json
+
+from typing import Optional
+
+from .base import DatasetGenerator
+from .dedup import Deduplicator, get_item_text
+from .outputs import DatasetWriter
+from .telemetry import ProgressReporter
+
+
+def prepare_dataset(generator: DatasetGenerator, dataset_writer: DatasetWriter) -> int:
+    """Match a generator with its output, skipping the items saved by a resumed run.
+
+    Return the number of items left to generate.
+    """
+    dataset_writer.manifest.set_fingerprint(generator.options_configs.fingerprint())
+    dataset_writer.set_option_values(dict(zip(generator.options_configs.keys, generator.options_configs.values)))
+    generator.completed_indices = dataset_writer.manifest.completed
+
+    # Sampled runs select a sorted list of indices, whose membership tests would be linear.
+    selected = generator.indices if isinstance(generator.indices, range) else set(generator.indices)
+    completed = sum(1 for index in generator.completed_indices if index in selected)
+    return len(generator.indices) - completed
+
+
+async def agenerate_dataset(
+    generator: DatasetGenerator,
+    dataset_writer: DatasetWriter,
+    concurrency: int = 1,
+    progress_reporter: Optional[ProgressReporter] = None,
+    deduplicator: Optional[Deduplicator] = None,
+    top_up: int = 0
+) -> None:
+    """Save every item produced by a generator with the given concurrency.
+
+    With a deduplicator, duplicate items are dropped and their options combinations are requested again
+    up to `top_up` times.
+    """
+    instrumentation = generator.instrumentation
+    # Writes are timed where they happen, which is the writer thread for background writes.
+    dataset_writer.on_write = instrumentation.record_write
+    instrumentation.track_writes = True
+
+    async for index, item in generator.agenerate_items(concurrency):
+        if deduplicator is not None:
+            options_config = generator.options_configs[index]
+            combination = json.dumps({key: value for key, value in options_config.items() if key != "sample_id"},
+                                     sort_keys=True,
+                                     default=str)
+
+            if deduplicator.check(get_item_text(item), combination) is not None:
+                instrumentation.record_drop(index)
+                if generator.attempts.get(index, 0) < top_up:
+                    generator.requeue(index)
+                elif progress_reporter is not None:
+                    progress_reporter.advance()
+                continue
+
+        await dataset_writer.asave_intermediate_result(item, index)
+
+        if progress_reporter is not None:
+            progress_reporter.advance()
@@ -0,0 +1,161 @@
+import random
+import itertools
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .base import OptionsCombinations
+
+SAMPLING_STRATEGIES = ["grid", "random", "stratified", "cover"]
+RANDOM_DRAWS = 100
+"""Number of random draws looking for a new combination before all of them are searched."""
+
+
+def decode_positions(number: int, radices: List[int]) -> Tuple[int, ...]:
+    """Convert a number to the value positions of options with the given numbers of values."""
+    positions = []
+    for radix in reversed(radices):
+        number, position = divmod(number, radix)
+        positions.append(position)
+
+    return tuple(reversed(positions))
+
+
+def count_combinations(radices: List[int]) -> int:
+    """Get the number of combinations of options with the given numbers of values."""
+    total = 1
+    for radix in radices:
+        total *= radix
+
+    return total
+
+
+def sample_random(radices: List[int], count: int, rng: random.Random) -> List[Tuple[int, ...]]:
+    """Draw distinct combinations uniformly at random."""
+    return [decode_positions(number, radices) for number in rng.sample(range(count_combinations(radices)), count)]
+
+
+def fill_random(selected: Dict[Tuple[int, ...], None], count: int, radices: List[int], rng: random.Random) -> None:
+    """Add random combinations that are not selected yet until there are `count` of them."""
+    while len(selected) < count:
+        selected.setdefault(tuple(rng.randrange(radix) for radix in radices))
+
+
+def sample_stratified(radices: List[int], count: int, rng: random.Random) -> List[Tuple[int, ...]]:
+    """Draw combinations with Latin hypercube sampling.
+
+    The values of each option are split into `count` strata, or repeated evenly if there are fewer values,
+    and the strata of the options are paired at random. Repeated combinations are replaced by random ones.
+    """
+    columns = []
+    for radix in radices:
+        column = []
+        for stratum in range(count):
+            low = stratum * radix // count
+            high = max(low + 1, (stratum + 1) * radix // count)
+            column.append(rng.randrange(low, high))
+
+        rng.shuffle(column)
+        columns.append(column)
+
+    selected = dict.fromkeys(zip(*columns))
+    fill_random(selected, count, radices, rng)
+    return list(selected)
+
+
+def find_uncovered(
+    radices: List[int],
+    position: int,
+    value: int,
+    selected: Dict[Tuple[int, ...], None],
+    rng: random.Random
+) -> Tuple[int, ...]:
+    """Find a combination that is not selected yet and contains a value of an option."""
+    for _ in range(RANDOM_DRAWS):
+        combination = tuple(value if other == position else rng.randrange(radix)
+                            for other, radix in enumerate(radices))
+        if combination not in selected:
+            return combination
+
+    ranges = [[value] if other == position else range(radix) for other, radix in enumerate(radices)]
+    return next(combination for combination in itertools.product(*ranges) if combination not in selected)
+
+
+def sample_cover(radices: List[int], cover_k: int, count: Optional[int], rng: random.Random) -> List[Tuple[int, ...]]:
+    """Greedily draw combinations until every value of every option appears at least `cover_k` times.
+
+    Each combination takes the least covered values of every option, so about `cover_k` times the largest
+    number of values of an option are needed. A value cannot appear more often than in all combinations
+    containing it, and at most `count` combinations are drawn.
+    """
+    total = count_combinations(radices)
+    targets = [min(cover_k, total // radix) for radix in radices]
+    coverage = [[0] * radix for radix in radices]
+    selected: Dict[Tuple[int, ...], None] = {}
+
+    while count is None or len(selected) < count:
+        uncovered = [(position, value)
+                     for position, target in enumerate(targets)
+                     for value, covered in enumerate(coverage[position])
+                     if covered < target]
+        if not uncovered:
+            break
+
+        combination = tuple(rng.choice([value for value, covered in enumerate(values) if covered == min(values)])
+                            for values in coverage)
+        if combination in selected:
+            combination = find_uncovered(radices, *rng.choice(uncovered), selected, rng)
+
+        selected[combination] = None
+        for position, value in enumerate(combination):
+            coverage[position][value] += 1
+
+    return list(selected)
+
+
+def sample_options(
+    combinations: "OptionsCombinations",
+    strategy: str = "grid",
+    sample_size: Optional[int] = None,
+    cover_k: int = 1,
+    seed: int = 0
+) -> Sequence[int]:
+    """Select the indices of the options combinations to generate.
+
+    Strategies other than "grid" draw `sample_size` combinations of the options other than the sample id,
+    reproducibly for a given seed, and every selected combination keeps all of its samples. The indices
+    are sorted, so that the order of the options, and batching of the samples of a prompt, is preserved.
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Unsupported sampling strategy: {strategy}.")
+    if strategy == "grid":
+        return range(len(combinations))
+    if strategy != "cover" and sample_size is None:
+        raise ValueError(f"The {strategy} sampling strategy requires a sample size.")
+    if sample_size is not None and sample_size < 1:
+        raise ValueError("The sample size must be positive.")
+    if cover_k < 1:
+        raise ValueError("The number of times each value is covered must be positive.")
+
+    sample_position = combinations.keys.index("sample_id")
+    positions = [position for position in range(len(combinations.keys)) if position != sample_position]
+    radices = [len(combinations.values[position]) for position in positions]
+    total = count_combinations(radices)
+    rng = random.Random(seed)
+
+    if strategy == "cover":
+        sampled = sample_cover(radices, cover_k, sample_size, rng)
+    elif sample_size >= total:
+        return range(len(combinations))
+    elif strategy == "random":
+        sampled = sample_random(radices, sample_size, rng)
+    else:
+        sampled = sample_stratified(radices, sample_size, rng)
+
+    strides = [combinations.strides[position] for position in positions]
+    sample_stride = combinations.strides[sample_position]
+    num_samples = len(combinations.values[sample_position])
+
+    return sorted(sum(value * stride for value, stride in zip(combination, strides)) + sample_id * sample_stride
+                  for combination in sampled
+                  for sample_id in range(num_samples))
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import subprocess
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .manifest import RunManifest
+from .columnar import COLUMNAR_FORMATS, read_columnar
+from .outputs import DatasetWriter, detect_output_options, open_reader
+
+
+def parse_shard(shard_str: str) -> Tuple[int, int]:
+    """Parse a shard given as "i/N", where i counts from 0."""
+    try:
+        shard_index, num_shards = (int(part) for part in shard_str.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard: {shard_str}. Use the \"i/N\" notation, for example \"0/4\".")
+
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError(f"Invalid shard: {shard_str}. The shard index must be between 0 and {num_shards - 1}.")
+
+    return shard_index, num_shards
+
+
+def get_shard_path(path: str, shard_index: int, num_shards: int) -> str:
+    """Get the output path of a shard by inserting its number before the extensions of the dataset path."""
+    directory, filename = os.path.split(path.rstrip(os.sep))
+    name, dot, extensions = filename.partition(".")
+    return os.path.join(directory, f"{name}-{shard_index:05d}-of-{num_shards:05d}{dot}{extensions}")
+
+
+def get_output_manifest(path: str) -> RunManifest:
+    """Load the manifest of a finished output."""
+    if os.path.isfile(f"{path}.part"):
+        raise ValueError(f"The output {path} is not finished. Complete its run with --resume before merging it.")
+    if not os.path.exists(path):
+        raise ValueError(f"The output {path} does not exist.")
+
+    single_file = os.path.isfile(path)
+    manifest_path = f"{path}.manifest" if single_file else os.path.join(path, ".manifest")
+    if not os.path.isfile(manifest_path):
+        raise ValueError(f"The output {path} has no manifest. It was not written with indexed items.")
+
+    return RunManifest(manifest_path, resume=True)
+
+
+def read_output(path: str, manifest: RunManifest) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Read the items of an output paired with the indices of their options combinations.
+
+    The k-th index of the manifest belongs to the k-th item written to a single file.
+    """
+    single_file, output_format, compression = detect_output_options(path)
+
+    if not single_file:
+        for index in manifest.indices:
+            with open(os.path.join(path, f"{index}.json"), "r") as input_file:
+                yield index, json.load(input_file)
+    elif output_format in COLUMNAR_FORMATS:
+        yield from zip(manifest.indices, read_columnar(path, output_format))
+    elif output_format == "json":
+        with open(path, "r") as input_file:
+            yield from zip(manifest.indices, json.load(input_file))
+    else:
+        with open_reader(path, compression) as reader:
+            yield from zip(manifest.indices, (json.loads(line) for line in reader))
+
+
+def merge_outputs(paths: List[str], dataset_writer: DatasetWriter) -> int:
+    """Combine the outputs of shards into one dataset ordered by options combination index.
+
+    Shards are expected to cover disjoint index ranges, so only the items of one shard are held in memory at a time.
+    """
+    manifests = {path: get_output_manifest(path) for path in paths}
+
+    fingerprints = {manifest.fingerprint for manifest in manifests.values()} - {None}
+    if len(fingerprints) > 1:
+        raise ValueError("Cannot merge outputs generated with different options.")
+    if fingerprints:
+        dataset_writer.manifest.set_fingerprint(fingerprints.pop())
+
+    ordered_paths = sorted((path for path in paths if manifests[path].indices),
+                           key=lambda path: min(manifests[path].indices))
+    for previous_path, path in zip(ordered_paths, ordered_paths[1:]):
+        if max(manifests[previous_path].indices) >= min(manifests[path].indices):
+            raise ValueError(f"The outputs {previous_path} and {path} have overlapping options combinations.")
+
+    count = 0
+    for path in ordered_paths:
+        for index, item in sorted(read_output(path, manifests[path]), key=lambda indexed_item: indexed_item[0]):
+            dataset_writer.save_intermediate_result(item, index)
+            count += 1
+
+    return count
+
+
+def launch_workers(
+    command: str,
+    arguments: List[str],
+    path: str,
+    num_workers: int,
+    api_keys: Optional[List[str]] = None
+) -> List[int]:
+    """Run one process per shard of a generation command on this machine and wait for all of them.
+
+    Each worker writes to its own shard path and receives the next of the given API keys through OPENAI_API_KEY.
+    Return the exit codes of the workers.
+    """
+    workers = []
+    for shard_index in range(num_workers):
+        env = dict(os.environ)
+        if api_keys:
+            env["OPENAI_API_KEY"] = api_keys[shard_index % len(api_keys)]
+
+        # Concurrent progress lines would overwrite each other, so they are off unless explicitly requested.
+        worker_command = [sys.executable, "-m", "datasetGPT", command, "--no-progress", *arguments,
+                          "--path", get_shard_path(path, shard_index, num_workers),
+                          "--shard", f"{shard_index}/{num_workers}"]
+        workers.append(subprocess.Popen(worker_command, env=env))
+
+    try:
+        return [worker.wait() for worker in workers]
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        raise
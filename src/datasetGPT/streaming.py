@@ -0,0 +1,53 @@
+import time
+
+from typing import Any, Optional
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+
+class EndPhraseReached(Exception):
+    """Raised from a streaming callback to stop a response once its end phrase has been generated."""
+
+    def __init__(self, text: str) -> None:
+        """Initialize EndPhraseReached."""
+        super().__init__("End phrase reached.")
+        self.text = text
+
+
+class StreamingHandler(BaseCallbackHandler):
+    """Callback handler collecting streamed tokens and stopping the stream at an end phrase.
+
+    The end phrase is searched incrementally, only in the text that could contain a new occurrence, so
+    phrases split across several tokens are found without rescanning the whole response.
+    """
+
+    raise_error: bool = True
+    """Propagate EndPhraseReached to the caller, which aborts the request."""
+    end_phrase: Optional[str] = None
+    """Phrase that ends the response. The whole response is streamed if unset."""
+    text: str
+    """Text streamed so far."""
+    first_token_seconds: Optional[float] = None
+    """Time between creating the handler and receiving the first token."""
+
+    def __init__(self, end_phrase: Optional[str] = None) -> None:
+        """Initialize StreamingHandler."""
+        self.end_phrase = end_phrase
+        self.text = ""
+        self.started = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """Append a token and stop the stream if the end phrase is complete."""
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+
+        if not self.end_phrase:
+            self.text += token
+            return
+
+        search_start = max(0, len(self.text) - len(self.end_phrase) + 1)
+        self.text += token
+
+        position = self.text.find(self.end_phrase, search_start)
+        if position != -1:
+            raise EndPhraseReached(self.text[:position + len(self.end_phrase)])
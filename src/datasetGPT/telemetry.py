@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+"""Upper bounds in seconds of the request latency histogram buckets."""
+
+
+@dataclass
+class LLMCallMetrics:
+    backend: str
+    """Backend that served the request."""
+    seconds: float
+    """Latency of the request including retries."""
+    prompt_tokens: int
+    """Number of prompt tokens."""
+    completion_tokens: int
+    """Number of completion tokens."""
+    retries: int = 0
+    """Number of times the request was retried."""
+    cost: Optional[float] = None
+    """Cost of the request in USD, or None if the price of its model is unknown."""
+
+
+@dataclass
+class ItemMetrics:
+    indices: List[int]
+    """Indices of the options combinations produced together."""
+    started: float
+    """Unix time when production started."""
+    seconds: float = 0.0
+    """Time spent producing the items."""
+    stages: Dict[str, float] = field(default_factory=lambda: {})
+    """Time spent in each stage of production, such as prompt formatting or chain construction."""
+    llm_calls: List[LLMCallMetrics] = field(default_factory=lambda: [])
+    """Requests sent to backends, one per conversation turn or completion request."""
+    first_token_seconds: List[float] = field(default_factory=lambda: [])
+    """Time to the first token of each streamed response."""
+    write_seconds: float = 0.0
+    """Time spent saving the items."""
+    dropped: List[int] = field(default_factory=lambda: [])
+    """Indices of the items dropped instead of being saved, for example as duplicates."""
+    error: Optional[str] = None
+    """Error that interrupted production."""
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(call.prompt_tokens for call in self.llm_calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(call.completion_tokens for call in self.llm_calls)
+
+    @property
+    def retries(self) -> int:
+        return sum(call.retries for call in self.llm_calls)
+
+    @property
+    def cost(self) -> Optional[float]:
+        if any(call.cost is None for call in self.llm_calls):
+            return None
+
+        return sum(call.cost for call in self.llm_calls)
+
+    @property
+    def usage(self) -> Dict[str, Any]:
+        """Tokens and cost of the requests, as saved with the items."""
+        return {"prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost": self.cost}
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus format."""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS) -> None:
+        """Initialize Histogram."""
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add an observation."""
+        self.count += 1
+        self.sum += value
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+
+    def format(self, name: str, labels: str = "") -> List[str]:
+        """Render the histogram as Prometheus text lines."""
+        separator = "," if labels else ""
+        lines = [f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}'
+                 for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Instrumentation:
+    """Per-item timing, token and error records with aggregated run metrics.
+
+    Records are attached to the item being produced through a context variable, so nested hot-path code
+    running in executor threads reports to the right item.
+    """
+
+    metrics_path: Optional[str] = None
+    """Path of the JSONL sidecar receiving a record per produced batch of items."""
+    prometheus_path: Optional[str] = None
+    """Path of a file periodically rewritten with the aggregated metrics in the Prometheus text format."""
+    track_writes: bool = False
+    """Whether the records of produced items wait for their writes, reported with `record_write`."""
+
+    def __init__(
+        self,
+        metrics_path: Optional[str] = None,
+        prometheus_path: Optional[str] = None,
+        prometheus_interval: float = 10.0
+    ) -> None:
+        """Initialize Instrumentation."""
+        self.metrics_path = metrics_path
+        self.prometheus_path = prometheus_path
+        self.prometheus_interval = prometheus_interval
+        self.prometheus_written = 0.0
+
+        self.current: contextvars.ContextVar[Optional[ItemMetrics]] = contextvars.ContextVar("item_metrics", default=None)
+        self.unwritten: Dict[int, ItemMetrics] = {}
+        self.lock = threading.Lock()
+        self.metrics_file: Optional[TextIO] = None
+        self.server: Optional[ThreadingHTTPServer] = None
+
+        self.started = time.time()
+        self.items = 0
+        self.dropped_items = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.write_seconds = Histogram()
+        self.stage_seconds: Dict[str, float] = {}
+        self.request_seconds: Dict[str, Histogram] = {}
+        self.first_token_seconds: Dict[str, Histogram] = {}
+
+    @contextmanager
+    def measure(self, indices: List[int]) -> Iterator[ItemMetrics]:
+        """Record the production of the items of a batch of options combinations."""
+        metrics = ItemMetrics(indices=list(indices), started=time.time())
+        token = self.current.set(metrics)
+        start = time.perf_counter()
+
+        try:
+            yield metrics
+        except Exception as error:
+            metrics.seconds = time.perf_counter() - start
+            metrics.error = repr(error)
+            with self.lock:
+                self.errors += 1
+            self.emit(metrics)
+            raise
+        finally:
+            self.current.reset(token)
+
+        metrics.seconds = time.perf_counter() - start
+        if not self.track_writes:
+            # Without a writer reporting back, the items count as done once produced.
+            with self.lock:
+                self.items += len(metrics.indices)
+            self.emit(metrics)
+            return
+
+        with self.lock:
+            for index in metrics.indices:
+                self.unwritten[index] = metrics
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time a stage of the production of the current item."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            metrics = self.current.get()
+            if metrics is not None:
+                metrics.stages[stage] = metrics.stages.get(stage, 0.0) + seconds
+            with self.lock:
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def record_llm_call(self, call: LLMCallMetrics) -> None:
+        """Record a request sent to a backend for the current item."""
+        metrics = self.current.get()
+        if metrics is not None:
+            metrics.llm_calls.append(call)
+
+        with self.lock:
+            self.retries += call.retries
+            self.prompt_tokens += call.prompt_tokens
+            self.completion_tokens += call.completion_tokens
+            self.cost += call.cost or 0.0
+            if call.backend not in self.request_seconds:
+                self.request_seconds[call.backend] = Histogram()
+            self.request_seconds[call.backend].observe(call.seconds)
+
+    def record_first_token(self, backend: str, seconds: float) -> None:
+        """Record the time to the first token of a streamed response for the current item."""
+        metrics = self.current.get()
+        if metrics is not None:
+            metrics.first_token_seconds.append(seconds)
+
+        with self.lock:
+            if backend not in self.first_token_seconds:
+                self.first_token_seconds[backend] = Histogram()
+            self.first_token_seconds[backend].observe(seconds)
+
+    def record_write(self, index: int, seconds: float) -> None:
+        """Record the time spent saving an item and emit its record once all items of its batch are saved."""
+        with self.lock:
+            self.items += 1
+            self.write_seconds.observe(seconds)
+            metrics = self.unwritten.pop(index, None)
+
+        if metrics is None:
+            return
+
+        metrics.write_seconds += seconds
+        if not any(other in self.unwritten for other in metrics.indices):
+            self.emit(metrics)
+
+    def record_drop(self, index: int) -> None:
+        """Record an item that was dropped and emit its record once all items of its batch are handled."""
+        with self.lock:
+            self.dropped_items += 1
+            metrics = self.unwritten.pop(index, None)
+
+        if metrics is None:
+            return
+
+        metrics.dropped.append(index)
+        if not any(other in self.unwritten for other in metrics.indices):
+            self.emit(metrics)
+
+    def emit(self, metrics: ItemMetrics) -> None:
+        """Append a record to the metrics sidecar and refresh the Prometheus file if it is due."""
+        if self.metrics_path is not None:
+            record = {**asdict(metrics),
+                      "prompt_tokens": metrics.prompt_tokens,
+                      "completion_tokens": metrics.completion_tokens,
+                      "retries": metrics.retries,
+                      "cost": metrics.cost}
+            with self.lock:
+                if self.metrics_file is None:
+                    self.metrics_file = open(self.metrics_path, "a")
+                self.metrics_file.write(json.dumps(record) + "\n")
+
+        if self.prometheus_path is not None and time.time() - self.prometheus_written >= self.prometheus_interval:
+            self.write_prometheus()
+
+    @property
+    def items_per_second(self) -> float:
+        """Average throughput of saved items since the instrumentation was created."""
+        elapsed = time.time() - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+    def format_prometheus(self) -> str:
+        """Render the aggregated metrics in the Prometheus text format."""
+        with self.lock:
+            lines = ["# TYPE datasetgpt_items_total counter",
+                     f"datasetgpt_items_total {self.items}",
+                     "# TYPE datasetgpt_dropped_items_total counter",
+                     f"datasetgpt_dropped_items_total {self.dropped_items}",
+                     "# TYPE datasetgpt_item_errors_total counter",
+                     f"datasetgpt_item_errors_total {self.errors}",
+                     "# TYPE datasetgpt_retries_total counter",
+                     f"datasetgpt_retries_total {self.retries}",
+                     "# TYPE datasetgpt_prompt_tokens_total counter",
+                     f"datasetgpt_prompt_tokens_total {self.prompt_tokens}",
+                     "# TYPE datasetgpt_completion_tokens_total counter",
+                     f"datasetgpt_completion_tokens_total {self.completion_tokens}",
+                     "# TYPE datasetgpt_cost_dollars_total counter",
+                     f"datasetgpt_cost_dollars_total {self.cost}",
+                     "# TYPE datasetgpt_items_per_second gauge",
+                     f"datasetgpt_items_per_second {self.items_per_second}",
+                     "# TYPE datasetgpt_stage_seconds_total counter"]
+            lines += [f'datasetgpt_stage_seconds_total{{stage="{stage}"}} {seconds}'
+                      for stage, seconds in self.stage_seconds.items()]
+            lines.append("# TYPE datasetgpt_request_seconds histogram")
+            for backend, histogram in self.request_seconds.items():
+                lines += histogram.format("datasetgpt_request_seconds", f'backend="{backend}"')
+            lines.append("# TYPE datasetgpt_first_token_seconds histogram")
+            for backend, histogram in self.first_token_seconds.items():
+                lines += histogram.format("datasetgpt_first_token_seconds", f'backend="{backend}"')
+            lines.append("# TYPE datasetgpt_write_seconds histogram")
+            lines += self.write_seconds.format("datasetgpt_write_seconds")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self) -> None:
+        """Atomically rewrite the Prometheus metrics file."""
+        self.prometheus_written = time.time()
+        temporary_path = f"{self.prometheus_path}.tmp"
+        with open(temporary_path, "w") as prometheus_file:
+            prometheus_file.write(self.format_prometheus())
+        os.replace(temporary_path, self.prometheus_path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        """Serve the aggregated metrics over HTTP from a background thread."""
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = instrumentation.format_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        """Flush the sidecar and the Prometheus file and stop the metrics server."""
+        with self.lock:
+            if self.metrics_file is not None:
+                self.metrics_file.close()
+                self.metrics_file = None
+
+        if self.prometheus_path is not None:
+            self.write_prometheus()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+
+class ProgressReporter:
+    """Live progress line with throughput and estimated time of arrival."""
+
+    def __init__(self, total: int, output: TextIO = sys.stderr, interval: float = 0.5) -> None:
+        """Initialize ProgressReporter."""
+        self.total = total
+        self.output = output
+        self.interval = interval
+        self.completed = 0
+        self.started = time.time()
+        self.updated = 0.0
+
+    def advance(self, count: int = 1) -> None:
+        """Count saved items and refresh the progress line at most once per interval."""
+        self.completed += count
+        now = time.time()
+        if now - self.updated >= self.interval or self.completed >= self.total:
+            self.updated = now
+            self.render(now)
+
+    def render(self, now: float) -> None:
+        """Print the progress line."""
+        elapsed = now - self.started
+        rate = self.completed / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.completed) / rate if rate > 0 else float("inf")
+        percentage = 100 * self.completed / self.total if self.total else 100.0
+        eta = "--:--" if remaining == float("inf") else time.strftime("%H:%M:%S", time.gmtime(remaining))
+
+        self.output.write(f"\r{self.completed}/{self.total} items ({percentage:.1f}%) | {rate:.2f} items/s | ETA {eta}")
+        self.output.flush()
+
+    def close(self) -> None:
+        """End the progress line."""
+        self.render(time.time())
+        self.output.write("\n")
+        self.output.flush()
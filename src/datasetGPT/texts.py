@@ -1,11 +1,13 @@
+from string import Formatter
 from dataclasses import dataclass, field
-from typing import List, Any, Dict, Tuple, Union
-
-from langchain.prompts import PromptTemplate
-from langchain.llms import BaseLLM
-from langchain.chains import LLMChain
+from typing import TYPE_CHECKING, List, Any, Dict, Tuple, Union, Optional
 
 from .base import DatasetGenerator
+from .backends import BackendRegistry, backend_registry
+from .tokens import count_tokens
+
+if TYPE_CHECKING:
+    from langchain.llms import BaseLLM
 
 OPTIONS_CONFIG_KEYS = ["backend", "max_length", "temperature"]
 GENERATOR_CONFIG_KEYS =  ["backends", "max_lengths", "temperatures"]
@@ -25,6 +27,35 @@ class TextsGeneratorConfig:
     """Possible temperatures for the backend LLM."""
     options: List[Tuple[str, str]] = field(default_factory=lambda: [])
     """Additional options defined in the system prompts with curly brackets."""
+    cache_path: Optional[str] = None
+    """Path of a persistent response cache. Responses are not cached if unset."""
+    cache_max_size: int = 1 << 30
+    """Maximum size of the response cache in bytes."""
+    requests_per_minute: Optional[float] = None
+    """Maximum number of requests per minute sent to each backend."""
+    tokens_per_minute: Optional[float] = None
+    """Maximum number of prompt and completion tokens per minute sent to each backend."""
+    max_retries: int = 6
+    """Maximum number of times a request failing with a transient error is retried."""
+    adaptive_concurrency: bool = True
+    """Whether to reduce the number of concurrent items when backends throttle requests."""
+    max_cost: Optional[float] = None
+    """Cost in USD after which no new items are started."""
+    max_tokens: Optional[int] = None
+    """Number of prompt and completion tokens after which no new items are started."""
+    batch_samples: bool = True
+    """Whether to request all samples of a prompt at once from backends that support it."""
+    sampling: str = "grid"
+    """Selection of the options combinations: all of them ("grid"), "random", Latin hypercube ("stratified")
+    or enough to "cover" every option value `cover_k` times."""
+    sample_size: Optional[int] = None
+    """Number of options combinations drawn by the sampling strategies, or the maximum for "cover"."""
+    cover_k: int = 1
+    """Number of times each option value appears with the "cover" sampling strategy."""
+    seed: int = 0
+    """Seed of the sampling strategies."""
+    endpoints: List[Tuple[str, str]] = field(default_factory=lambda: [])
+    """Interchangeable endpoints serving a logical backend name, as (name, "backend|model|key=value") pairs."""
 
 
 class TextsGenerator(DatasetGenerator):
@@ -32,10 +63,14 @@ class TextsGenerator(DatasetGenerator):
 
     config: TextsGeneratorConfig
     """Configuration for a TextsGenerator."""
+    input_variables: List[str]
+    """Placeholders of the prompt, parsed once."""
 
-    def __init__(self, config: TextsGeneratorConfig) -> None:
+    def __init__(self, config: TextsGeneratorConfig, backends: BackendRegistry = backend_registry) -> None:
         """Initialize TextsGenerator."""
-        super().__init__(config)
+        super().__init__(config, backends)
+        self.input_variables = sorted({name for _, name, _, _ in Formatter().parse(config.prompt) if name is not None})
+        self.validate_prompt()
 
     def initialize_options_configs(
         self,
@@ -45,58 +80,167 @@ class TextsGenerator(DatasetGenerator):
         """Prepare options combinations."""
         super().initialize_options_configs(options_config_keys, generator_config_keys)
 
-    def initialize_backend(self, text_config: Dict[str, Any]) -> BaseLLM:
-        """Initialize a specific LLM."""
-        backend_str = text_config["backend"]
-        temperature = text_config["temperature"]
-        max_length = text_config["max_length"]
-
-        backend, model = backend_str.split("|")
-
-        if backend.lower() == "openai":
-            from langchain.llms import OpenAI
-            llm = OpenAI(model_name=model,
-                         temperature=temperature,
-                         max_tokens=max_length)
-        elif backend.lower() == "cohere":
-            from langchain.llms import Cohere
-            llm = Cohere(model=model,
-                         temperature=temperature,
-                         max_tokens=max_length)
-        elif backend.lower() == "petals":
-            from langchain.llms import Petals
-            llm = Petals(model_name=model,
-                         temperature=temperature,
-                         max_new_tokens=max_length)
-        else:
-            raise ValueError("Cannot use the specified backend.")
-
-        return llm
-
-    def generate_item(self) -> Dict[str, Union[List[List[Any]], float, int]]:
-        """Produce text with a LLM Chain."""
-        if self.generator_index >= len(self.options_configs):
-            raise StopIteration()
-
-        text_config = self.options_configs[self.generator_index]
-        self.generator_index += 1
-
-        input_variables = text_config.keys() - ["sample_id",
-                                                "backend",
-                                                "temperature",
-                                                "max_length"]
-
-        prompt_template = PromptTemplate(template=self.config.prompt,
-                                         input_variables=input_variables)
-
-        llm = self.initialize_backend(text_config)
-
-        prompt_params = {k: text_config[k] for k in input_variables}
-        input_prompt = prompt_template.format(**prompt_params)
-
-        chain = LLMChain(prompt=prompt_template, llm=llm)
-        output = chain.predict(**prompt_params)
+    def initialize_backend(self, text_config: Dict[str, Any]) -> "BaseLLM":
+        """Get the LLM of a specific backend from the shared registry, which reuses it across items."""
+        return self.backends.get_llm(text_config["backend"],
+                                     text_config["temperature"],
+                                     text_config["max_length"])
+
+    def validate_prompt(self) -> None:
+        """Check that the prompt placeholders match the options before any request is sent."""
+        input_variables = set(self.input_variables)
+        option_names = set(self.options_configs.keys) - {"sample_id", *OPTIONS_CONFIG_KEYS}
+
+        missing_options = input_variables - option_names
+        if missing_options:
+            raise ValueError(f"The prompt uses placeholders without options: {', '.join(sorted(missing_options))}.")
+
+        unused_options = option_names - input_variables
+        if unused_options:
+            raise ValueError(f"Options not used in the prompt: {', '.join(sorted(unused_options))}.")
+
+    def format_prompt(self, text_config: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+        """Fill the prompt with the options of a combination."""
+        prompt_params = {key: text_config[key] for key in self.input_variables}
+        # The placeholders were validated up front, so plain string formatting is enough.
+        input_prompt = self.config.prompt.format(**prompt_params)
+
+        return prompt_params, input_prompt
+
+    def get_cache_key(self, text_config: Dict[str, Any], input_prompt: str) -> str:
+        """Get the response cache key of a text."""
+        attempt = [text_config["attempt"]] if "attempt" in text_config else []
+        return self.cache.make_key("texts",
+                                   text_config["backend"],
+                                   text_config["temperature"],
+                                   text_config["max_length"],
+                                   text_config["sample_id"],
+                                   input_prompt,
+                                   *attempt)
+
+    def generate_item_from_config(self, text_config: Dict[str, Any]) -> Dict[str, Union[List[List[Any]], float, int]]:
+        """Produce text with a LLM."""
+        with self.instrumentation.span("prompt_format"):
+            _, input_prompt = self.format_prompt(text_config)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.get_cache_key(text_config, input_prompt)
+            output = self.cache.get(cache_key)
+            if output is not None:
+                return {**text_config,
+                        "prompt": input_prompt,
+                        "output": output}
+
+        with self.instrumentation.span("chain_init"):
+            llm = self.initialize_backend(text_config)
+        # The prompt is already formatted, so the LLM is called directly instead of through an LLMChain.
+        # Unlike a plain call, `generate` returns the token usage reported by the backend.
+        result = self.call_backend(text_config["backend"],
+                                   count_tokens(input_prompt),
+                                   text_config["max_length"],
+                                   llm.generate,
+                                   [input_prompt])
+        output = result.generations[0][0].text
+
+        if cache_key is not None:
+            self.cache.set(cache_key, output)
 
         return {**text_config,
                 "prompt": input_prompt,
                 "output": output}
+
+    def estimate_item_usage(self, text_config: Dict[str, Any]) -> List[Tuple[str, float, float]]:
+        """Estimate the usage of a text from its formatted prompt and maximum length.
+
+        Samples requested together share one prompt, so each of them is charged a part of it.
+        """
+        _, input_prompt = self.format_prompt(text_config)
+        prompt_tokens = count_tokens(input_prompt)
+
+        if self.config.batch_samples and self.backends.supports_multiple_completions(text_config["backend"]):
+            prompt_tokens /= self.config.num_samples
+
+        return [(text_config["backend"], prompt_tokens, text_config["max_length"])]
+
+    def get_backends(self) -> List[str]:
+        """Get the backends receiving the requests of the generator."""
+        return list(self.config.backends)
+
+    def get_options_order(self, options_keys: List[str]) -> List[str]:
+        """Vary the sample id fastest so that the samples of a prompt are adjacent and can be batched.
+
+        The order is kept unless every backend of the run can batch samples.
+        """
+        if not self.config.batch_samples:
+            return options_keys
+        if not all(self.backends.supports_multiple_completions(backend) for backend in self.config.backends):
+            return options_keys
+
+        return [key for key in options_keys if key != "sample_id"] + ["sample_id"]
+
+    def next_batch(self) -> List[int]:
+        """Take the remaining samples of the next prompt if its backend can produce them with one request."""
+        index = self.next_index()
+        if index is None:
+            return []
+
+        batch = [index]
+        text_config = self.options_configs[index]
+        # Samples are only adjacent when the sample id varies fastest, which needs every backend to batch them.
+        if (not self.config.batch_samples
+                or self.options_configs.order[-1] != "sample_id"
+                or not self.backends.supports_multiple_completions(text_config["backend"])
+                or index in self.attempts):
+            return batch
+
+        prompt_config = {key: value for key, value in text_config.items() if key != "sample_id"}
+        while (self.generator_index < len(self.indices)
+               and all(self.options_configs[self.indices[self.generator_index]][key] == value
+                       for key, value in prompt_config.items())):
+            index = self.indices[self.generator_index]
+            self.generator_index += 1
+
+            if index not in self.completed_indices:
+                batch.append(index)
+
+        return batch
+
+    def generate_batch_from_configs(self, text_configs: List[Dict[str, Any]]) -> List[Dict[str, Union[List[List[Any]], float, int]]]:
+        """Produce several samples of the same prompt with a single completion request."""
+        text_config = text_configs[0]
+        with self.instrumentation.span("prompt_format"):
+            _, input_prompt = self.format_prompt(text_config)
+
+        outputs = {}
+        missing_configs = []
+        for sample_config in text_configs:
+            if self.cache is not None:
+                output = self.cache.get(self.get_cache_key(sample_config, input_prompt))
+                if output is not None:
+                    outputs[sample_config["sample_id"]] = output
+                    continue
+
+            missing_configs.append(sample_config)
+
+        if missing_configs:
+            with self.instrumentation.span("chain_init"):
+                llm = self.backends.get_llm(text_config["backend"],
+                                            text_config["temperature"],
+                                            text_config["max_length"],
+                                            n=len(missing_configs))
+            result = self.call_backend(text_config["backend"],
+                                       count_tokens(input_prompt),
+                                       len(missing_configs) * text_config["max_length"],
+                                       llm.generate,
+                                       [input_prompt])
+
+            for sample_config, generation in zip(missing_configs, result.generations[0]):
+                outputs[sample_config["sample_id"]] = generation.text
+                if self.cache is not None:
+                    self.cache.set(self.get_cache_key(sample_config, input_prompt), generation.text)
+
+        return [{**sample_config,
+                 "prompt": input_prompt,
+                 "output": outputs[sample_config["sample_id"]]}
+                for sample_config in text_configs]
@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+CHARACTERS_PER_TOKEN = 4
+"""Average number of characters per token used when no tokenizer is installed."""
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base"):
+    """Load a tiktoken encoding if the package is installed."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text with tiktoken or estimate them from its length."""
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+    return len(encoding.encode(text, disallowed_special=()))
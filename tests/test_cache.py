@@ -0,0 +1,67 @@
+import json
+import asyncio
+import itertools
+
+from datasetGPT import cache
+from datasetGPT.cache import ResponseCache
+from datasetGPT.outputs import DatasetWriter, open_reader
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def test_lookups_count_hits_and_misses(tmp_path):
+    response_cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    key = ResponseCache.make_key("texts", "Describe the color red.", 0)
+
+    assert response_cache.get(key) is None
+    response_cache.set(key, "Red is warm.")
+    assert response_cache.get(key) == "Red is warm."
+    assert (response_cache.hits, response_cache.misses) == (1, 1)
+    assert ResponseCache.make_key("texts", "Describe the color red.", 1) != key
+
+
+def test_cache_persists_across_connections(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    response_cache = ResponseCache(path)
+    response_cache.set("key", "value")
+    response_cache.close()
+
+    response_cache = ResponseCache(path)
+    assert response_cache.size == len("value")
+    assert response_cache.get("key") == "value"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(cache.time, "time", lambda: next(clock))
+    response_cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size=10)
+    response_cache.set("a", "aaaa")
+    response_cache.set("b", "bbbb")
+    response_cache.get("a")
+    response_cache.set("c", "cccc")
+
+    assert response_cache.get("b") is None
+    assert response_cache.get("a") == "aaaa"
+    assert response_cache.get("c") == "cccc"
+    assert response_cache.size == 8
+
+
+def test_repeated_run_is_answered_from_the_cache(tmp_path):
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=["mock|instant"],
+                                  num_samples=2,
+                                  options=[("color", "red"), ("color", "blue")],
+                                  cache_path=str(tmp_path / "cache.sqlite"))
+
+    outputs = []
+    for run in range(2):
+        generator = TextsGenerator(config)
+        dataset_writer = DatasetWriter(str(tmp_path / f"out{run}.jsonl"), output_format="jsonl")
+        prepare_dataset(generator, dataset_writer)
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=2))
+        dataset_writer.close()
+        with open_reader(dataset_writer.path) as reader:
+            outputs.append(sorted(json.loads(line)["output"] for line in reader))
+
+    assert (generator.cache.hits, generator.cache.misses) == (4, 0)
+    assert outputs[0] == outputs[1]
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from datasetGPT.outputs import DatasetWriter, detect_output_options
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+pa = pytest.importorskip("pyarrow")
+
+from datasetGPT.columnar import read_columnar
+
+CONVERSATION = {"temperature": 0.5,
+                "utterances": [["agent1", "Hello."], ["agent2", "Welcome to Rome."]],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 5, "cost": None}}
+
+
+@pytest.mark.parametrize("output_format,compression", [("parquet", "none"),
+                                                       ("parquet", "zstd"),
+                                                       ("arrow", "none"),
+                                                       ("arrow", "zstd")])
+def test_items_round_trip_in_row_groups(tmp_path, output_format, compression):
+    path = str(tmp_path / f"out.{output_format}")
+    items = [{**CONVERSATION, "sample_id": index} for index in range(5)]
+    with DatasetWriter(path, output_format=output_format, compression=compression, row_group_size=2) as dataset_writer:
+        for index, item in enumerate(items):
+            dataset_writer.save_intermediate_result(item, index)
+
+    assert detect_output_options(path) == (True, output_format, "none")
+    assert list(read_columnar(path, output_format)) == items
+    if output_format == "parquet":
+        assert pa.parquet.ParquetFile(path).metadata.num_row_groups == 3
+    else:
+        assert pa.ipc.open_file(path).num_record_batches == 3
+
+
+def test_option_columns_fit_values_of_later_row_groups(tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with DatasetWriter(path, output_format="parquet", row_group_size=1) as dataset_writer:
+        dataset_writer.set_option_values({"size": [1, 2.5]})
+        dataset_writer.save_intermediate_result({"size": 1}, 0)
+        dataset_writer.save_intermediate_result({"size": 2.5}, 1)
+
+    assert list(read_columnar(path, "parquet")) == [{"size": 1.0}, {"size": 2.5}]
+
+
+def test_generated_texts_are_written_to_parquet(tmp_path):
+    path = str(tmp_path / "colors.parquet")
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=["mock|instant"],
+                                  num_samples=2,
+                                  options=[("color", "red"), ("color", "blue")])
+    generator = TextsGenerator(config)
+    with DatasetWriter(path, output_format="parquet", row_group_size=3) as dataset_writer:
+        prepare_dataset(generator, dataset_writer)
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=2))
+
+    items = list(read_columnar(path, "parquet"))
+    assert sorted((item["color"], item["sample_id"]) for item in items) == [
+        ("blue", 0), ("blue", 1), ("red", 0), ("red", 1)]
+    assert all(isinstance(item["output"], str) for item in items)
+
+
+@pytest.mark.parametrize("output_format,compression", [("arrow", "gzip"), ("json", "zstd")])
+def test_unsupported_compression_is_rejected(tmp_path, output_format, compression):
+    with pytest.raises(ValueError, match="[Cc]ompression"):
+        DatasetWriter(str(tmp_path / "out"), output_format=output_format, compression=compression)
@@ -0,0 +1,46 @@
+import pytest
+
+from click.testing import CliRunner
+
+from datasetGPT.cli import datasetGPT
+from datasetGPT.conversations import ConversationsGenerator, ConversationsGeneratorConfig
+
+
+def make_config(**kwargs):
+    return ConversationsGeneratorConfig(**{"openai_api_key": "",
+                                           "agent1": "You are a {role}.",
+                                           "agent2": "You are a guide.",
+                                           "initial_utterances": ["Hello."],
+                                           "options": [("role", "tourist")],
+                                           "lengths": [2],
+                                           "model": "mock|latency=0,tokens=10",
+                                           "model_agent_one": None,
+                                           "model_agent_two": None,
+                                           **kwargs})
+
+
+def test_unsupported_chat_model_is_rejected():
+    with pytest.raises(ValueError, match="Unsupported chat model"):
+        ConversationsGenerator(make_config(model="cohere|command"))
+
+
+def test_cli_runs_conversations_with_a_mock_model(tmp_path):
+    path = tmp_path / "out.jsonl"
+    result = CliRunner().invoke(datasetGPT, ["conversations", "-a", "You are a tourist.", "-b", "You are a guide.",
+                                             "-u", "Hello.", "-l", "2", "-n", "3", "-m", "mock|latency=0",
+                                             "--format", "jsonl", "-f", str(path)])
+
+    assert result.exit_code == 0, result.output
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_cli_runs_conversations_with_a_routed_model(tmp_path):
+    path = tmp_path / "out.jsonl"
+    result = CliRunner().invoke(datasetGPT, ["conversations", "-a", "You are a tourist.", "-b", "You are a guide.",
+                                             "-u", "Hello.", "-l", "2", "-m", "conversation-pool",
+                                             "--endpoint", "conversation-pool", "mock|latency=0",
+                                             "--endpoint", "conversation-pool", "mock|latency=0,tokens=5",
+                                             "--format", "jsonl", "-f", str(path)])
+
+    assert result.exit_code == 0, result.output
+    assert "of conversation-pool" in result.output
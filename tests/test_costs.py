@@ -0,0 +1,66 @@
+import json
+import asyncio
+import dataclasses
+
+import pytest
+
+from datasetGPT import costs
+from datasetGPT.costs import Budget, get_cost, get_model_price, split_usage
+from datasetGPT.outputs import DatasetWriter, open_reader
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def test_model_prices():
+    assert get_model_price("gpt-4-0613") == costs.MODEL_PRICES["gpt-4"]
+    assert get_model_price("openai|gpt-3.5-turbo-16k") == costs.MODEL_PRICES["gpt-3.5-turbo-16k"]
+    assert get_model_price("mock|instant") == (0.0, 0.0)
+    assert get_model_price("cohere|command") is None
+    assert get_cost("gpt-4", 1000, 500) == pytest.approx(0.06)
+
+
+def test_child_budget_charges_its_parent():
+    parent = Budget(max_tokens=100)
+    child = Budget(max_cost=1.0, parent=parent)
+    child.charge("cohere|command", 60, 40)
+
+    assert child.cost == 0.0
+    assert parent.prompt_tokens + parent.completion_tokens == 100
+    assert not Budget(max_tokens=100).exhausted
+    assert child.exhausted
+
+
+def test_usage_is_split_into_whole_tokens():
+    assert split_usage({"prompt_tokens": 7, "cost": 0.3}, 2) == [{"prompt_tokens": 4, "cost": 0.15},
+                                                                 {"prompt_tokens": 3, "cost": 0.15}]
+
+
+def test_run_stops_scheduling_items_at_max_cost(tmp_path, monkeypatch):
+    # The mock backend is free, so its requests are priced at one dollar per token here.
+    monkeypatch.setattr(costs, "get_model_price", lambda backend_str: (1000.0, 1000.0))
+    path = str(tmp_path / "out.jsonl")
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=["mock|instant"],
+                                  num_samples=2,
+                                  options=[("color", "red"), ("color", "blue")],
+                                  batch_samples=False,
+                                  max_cost=1.0)
+
+    generator = TextsGenerator(config)
+    with DatasetWriter(path, output_format="jsonl") as dataset_writer:
+        prepare_dataset(generator, dataset_writer)
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=1))
+
+    with open_reader(path) as reader:
+        items = [json.loads(line) for line in reader]
+    assert generator.budget.exhausted
+    assert len(items) == 1
+    assert items[0]["usage"]["cost"] == generator.budget.cost >= 1.0
+
+    generator = TextsGenerator(dataclasses.replace(config, max_cost=None))
+    with DatasetWriter(path, output_format="jsonl", resume=True) as dataset_writer:
+        assert prepare_dataset(generator, dataset_writer) == 3
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=1))
+
+    with open_reader(path) as reader:
+        assert len(reader.readlines()) == 4
@@ -0,0 +1,53 @@
+from datasetGPT.dedup import Deduplicator, get_item_text
+
+TEXT = ("The quick brown fox jumps over the lazy dog while the farmer watches from the porch "
+        "and the cat sleeps in the warm afternoon sun next to the old red barn")
+
+
+def test_exact_duplicates_ignore_case_and_whitespace():
+    deduplicator = Deduplicator()
+
+    assert deduplicator.check(TEXT, "{}") is None
+    assert deduplicator.check("  " + TEXT.upper().replace(" ", "\n "), "{}") == "exact"
+
+
+def test_near_duplicates_are_found():
+    deduplicator = Deduplicator(threshold=0.7)
+    deduplicator.check(TEXT, "{}")
+
+    assert deduplicator.check(TEXT.replace("lazy", "sleepy"), "{}") == "near"
+    assert deduplicator.check("An entirely different sentence about databases, queries and indexes.", "{}") is None
+
+
+def test_threshold_of_one_keeps_near_duplicates():
+    deduplicator = Deduplicator(threshold=1.0)
+    deduplicator.check(TEXT, "{}")
+
+    assert deduplicator.check(TEXT.replace("lazy", "sleepy"), "{}") is None
+
+
+def test_oldest_entries_are_forgotten():
+    deduplicator = Deduplicator(max_entries=2)
+    for text in [TEXT, "first other text", "second other text"]:
+        deduplicator.check(text, "{}")
+
+    assert len(deduplicator.signatures) == 2
+    assert all(entry_id in deduplicator.signatures for bucket in deduplicator.buckets.values() for entry_id in bucket)
+    assert deduplicator.check(TEXT, "{}") is None
+
+
+def test_drop_rates_by_combination():
+    deduplicator = Deduplicator()
+    for _ in range(4):
+        deduplicator.check(TEXT, '{"color": "red"}')
+    deduplicator.check(TEXT + " again", '{"color": "blue"}')
+
+    report = {entry["combination"]["color"]: entry for entry in deduplicator.get_report()}
+    assert report["red"]["drop_rate"] == 0.75
+    assert report["blue"]["generated"] == 1
+    assert deduplicator.get_total_stats().exact_duplicates == 3
+
+
+def test_item_text():
+    assert get_item_text({"output": "text"}) == "text"
+    assert get_item_text({"utterances": [["agent1", "Hi"], ["agent2", "Hello"]]}) == "Hi\nHello"
@@ -0,0 +1,49 @@
+import sys
+import subprocess
+
+import pytest
+
+CHECK_LANGCHAIN = "import sys, {module}; print('langchain' in sys.modules)"
+
+
+@pytest.mark.parametrize("module", ["datasetGPT", "datasetGPT.cli", "datasetGPT.jobs"])
+def test_import_does_not_load_langchain(module):
+    result = subprocess.run([sys.executable, "-c", CHECK_LANGCHAIN.format(module=module)],
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_texts_generator_does_not_load_langchain():
+    code = "import sys; from datasetGPT.texts import TextsGenerator; print('langchain' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_public_names_are_imported_on_access():
+    import datasetGPT
+
+    assert "TextsGeneratorConfig" in dir(datasetGPT)
+    assert datasetGPT.OUTPUT_FORMATS[0] == "json"
+    with pytest.raises(AttributeError):
+        datasetGPT.missing_name
+
+
+def test_names_of_the_original_package_are_exported():
+    import datasetGPT
+    from datasetGPT import base, outputs, texts
+
+    assert datasetGPT.DatasetGenerator is base.DatasetGenerator
+    assert datasetGPT.GENERATOR_CONFIG_KEYS is texts.GENERATOR_CONFIG_KEYS
+    assert datasetGPT.json is outputs.json
+    assert datasetGPT.__all__ == list(datasetGPT.LAZY_ATTRIBUTES)
+
+
+def test_langchain_names_are_exported_on_access():
+    pytest.importorskip("langchain")
+    from datasetGPT import BaseLLM, ChatOpenAI, ConversationChain, LLMChain, PromptTemplate, SystemMessage
+    from langchain.chains import LLMChain as langchain_llm_chain
+
+    assert LLMChain is langchain_llm_chain
+    assert all([BaseLLM, ChatOpenAI, ConversationChain, PromptTemplate, SystemMessage])
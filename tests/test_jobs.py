@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from datasetGPT.jobs import load_jobs, run_jobs
+
+
+def write_jobs_file(tmp_path, **job_spec):
+    jobs_path = tmp_path / "jobs.json"
+    job = {"name": "colors",
+           "type": "texts",
+           "prompt": "Describe the color {color}.",
+           "backends": ["mock|fast"],
+           "options": [["color", "red"], ["color", "blue"]],
+           "path": str(tmp_path / "colors.jsonl"),
+           "format": "jsonl",
+           **job_spec}
+    jobs_path.write_text(json.dumps({"concurrency": 2, "jobs": [job]}))
+    return str(jobs_path)
+
+
+def test_jobs_file_disables_background_writes(tmp_path):
+    jobs = load_jobs(write_jobs_file(tmp_path, background_writes=False))
+
+    assert not jobs[0].dataset_writer.background
+    run_jobs(jobs)
+    assert jobs[0].dataset_writer.writer_thread is None
+    assert len((tmp_path / "colors.jsonl").read_text().splitlines()) == 2
+
+
+def test_jobs_file_rejects_unknown_keys(tmp_path):
+    with pytest.raises(ValueError, match="unknown keys background_write"):
+        load_jobs(write_jobs_file(tmp_path, background_write=False))
+
+
+def write_jobs(tmp_path, jobs, **settings):
+    jobs_path = tmp_path / "jobs.json"
+    jobs_path.write_text(json.dumps({"concurrency": 2, **settings, "jobs": [{"type": "texts",
+                                                                           "prompt": "Describe the color {color}.",
+                                                                           "backends": ["mock|fast"],
+                                                                           "options": [["color", "red"]],
+                                                                           "format": "jsonl",
+                                                                           "background_writes": False,
+                                                                           **job} for job in jobs]}))
+    return str(jobs_path)
+
+
+def test_invalid_job_leaves_the_outputs_of_other_jobs_untouched(tmp_path):
+    (tmp_path / "first.jsonl").write_text("{}\n")
+    jobs_path = write_jobs(tmp_path, [{"name": "first", "path": str(tmp_path / "first.jsonl"), "overwrite": True},
+                                      {"name": "second", "path": str(tmp_path / "second.jsonl"), "prompt": "{size}"}])
+
+    with pytest.raises(ValueError, match="Job second: The prompt uses placeholders without options: size"):
+        load_jobs(jobs_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["first.jsonl", "jobs.json"]
+    assert (tmp_path / "first.jsonl").read_text() == "{}\n"
+
+
+def test_existing_output_is_reported_before_any_output_is_opened(tmp_path):
+    (tmp_path / "second.jsonl").write_text("{}\n")
+    jobs_path = write_jobs(tmp_path, [{"name": "first", "path": str(tmp_path / "first.jsonl")},
+                                      {"name": "second", "path": str(tmp_path / "second.jsonl")}])
+
+    with pytest.raises(ValueError, match="Job second: The output .* already exists"):
+        load_jobs(jobs_path)
+    assert not (tmp_path / "first.jsonl.manifest").exists()
+
+
+def test_jobs_writing_to_the_same_path_are_rejected(tmp_path):
+    jobs_path = write_jobs(tmp_path, [{"name": "first", "path": str(tmp_path / "out.jsonl")},
+                                      {"name": "second", "path": str(tmp_path / "out.jsonl")}])
+
+    with pytest.raises(ValueError, match="Jobs first and second write to the same path"):
+        load_jobs(jobs_path)
+
+
+def test_conflicting_rate_limits_of_a_backend_are_rejected(tmp_path):
+    jobs = [{"name": "first", "path": str(tmp_path / "first.jsonl"), "requests_per_minute": 60},
+            {"name": "second", "path": str(tmp_path / "second.jsonl"), "requests_per_minute": 120}]
+
+    with pytest.raises(ValueError, match=r"different rate limits for the backend mock\|fast"):
+        load_jobs(write_jobs(tmp_path, jobs))
+
+    jobs[1]["backends"] = ["mock|instant"]
+    assert len(load_jobs(write_jobs(tmp_path, jobs))) == 2
+    assert len(load_jobs(write_jobs(tmp_path, [{"name": "first", "path": str(tmp_path / "third.jsonl")},
+                                               {"name": "second", "path": str(tmp_path / "fourth.jsonl")}],
+                                    requests_per_minute=60))) == 2
@@ -0,0 +1,69 @@
+import pytest
+
+from datasetGPT.local import LocalModel, get_common_prefix_length
+
+WORDS = ["<unk>", "</s>", "write", "a", "short", "poem", "story", "about", "the", "red", "blue", "green", "sea",
+         "sky", "forest", "in", "style", "of", "winter", "summer"]
+PROMPTS = ["write a short poem about the red sea in the style of winter",
+           "write a short poem about the blue sky",
+           "write a short poem about the green forest in summer"]
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    tokenizers = pytest.importorskip("tokenizers")
+
+    path = str(tmp_path_factory.mktemp("tiny-gpt2"))
+    vocabulary = {word: position for position, word in enumerate(WORDS)}
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocabulary, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    transformers.PreTrainedTokenizerFast(tokenizer_object=tokenizer,
+                                         unk_token="<unk>",
+                                         eos_token="</s>").save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = transformers.GPT2Config(vocab_size=len(WORDS), n_positions=64, n_embd=32, n_layer=2, n_head=2,
+                                     bos_token_id=1, eos_token_id=1)
+    transformers.GPT2LMHeadModel(config).save_pretrained(path)
+    return path
+
+
+def test_common_prefix_length():
+    assert get_common_prefix_length([[1, 2, 3], [1, 2, 4], [1, 2]]) == 2
+    assert get_common_prefix_length([[1, 2], [1, 2]]) == 2
+
+
+def test_local_model_requires_generate_batch():
+    with pytest.raises(TypeError):
+        LocalModel("model")
+
+
+def test_prefix_cache_matches_uncached_generation(model_path):
+    from datasetGPT.local import TransformersModel
+
+    model = TransformersModel(model_path, min_prefix_tokens=2)
+    cached = model.generate_batch(PROMPTS, 0, 8)
+    # The second batch reuses the cached prefix.
+    assert model.generate_batch(PROMPTS, 0, 8) == cached
+    assert model.prefix_cache_enabled and model.prefix_cache_hits == 1
+
+    model.prefix_cache_enabled = False
+    assert model.generate_batch(PROMPTS, 0, 8) == cached
+    # Padding between the prefix and the shorter suffixes does not change their completions.
+    assert [model.generate_batch([prompt], 0, 8)[0] for prompt in PROMPTS] == cached
+    assert [prompt_tokens for _, prompt_tokens, _ in cached] == [len(prompt.split()) for prompt in PROMPTS]
+
+
+def test_requests_of_several_threads_are_batched(model_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from datasetGPT.local import TransformersModel
+
+    model = TransformersModel(model_path, batch_wait=0.2)
+    with ThreadPoolExecutor(3) as executor:
+        completions = list(executor.map(lambda prompt: model.complete([prompt], 0, 4), PROMPTS))
+
+    assert [completion[0][1] for completion in completions] == [len(prompt.split()) for prompt in PROMPTS]
+    assert model.batches < 3 and model.prompts == 3
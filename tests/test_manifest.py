@@ -0,0 +1,47 @@
+import pytest
+
+from datasetGPT.manifest import RunManifest
+
+
+def test_indices_are_persisted_on_flush(tmp_path):
+    path = str(tmp_path / "run.manifest")
+    manifest = RunManifest(path)
+    manifest.set_fingerprint("abc")
+    manifest.mark(3)
+    manifest.mark(1)
+
+    assert RunManifest(path, resume=True).indices == []
+    manifest.flush()
+
+    resumed = RunManifest(path, resume=True)
+    assert resumed.indices == [3, 1]
+    assert 3 in resumed and 2 not in resumed
+    assert resumed.fingerprint == "abc"
+
+
+def test_interrupted_line_is_ignored(tmp_path):
+    path = tmp_path / "run.manifest"
+    path.write_text("#abc\n0\n1\n2")
+
+    assert RunManifest(str(path), resume=True).indices == [0, 1]
+
+
+def test_new_run_truncates_the_manifest(tmp_path):
+    path = tmp_path / "run.manifest"
+    path.write_text("#abc\n0\n")
+
+    assert len(RunManifest(str(path))) == 0
+    assert path.read_text() == ""
+
+
+def test_fingerprint_mismatch_is_rejected(tmp_path):
+    path = str(tmp_path / "run.manifest")
+    manifest = RunManifest(path)
+    manifest.set_fingerprint("abc")
+    manifest.mark(0)
+    manifest.flush()
+
+    resumed = RunManifest(path, resume=True)
+    resumed.set_fingerprint("abc")
+    with pytest.raises(ValueError, match="different options"):
+        RunManifest(path, resume=True).set_fingerprint("def")
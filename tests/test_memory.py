@@ -0,0 +1,84 @@
+import pytest
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+from datasetGPT.conversations import ConversationsGenerator, ConversationsGeneratorConfig
+from datasetGPT.memory import BoundedConversationMemory, truncate_messages
+
+
+def make_memory(exchanges, **kwargs):
+    memory = BoundedConversationMemory(return_messages=True, **kwargs)
+    for exchange in range(exchanges):
+        memory.save_context({"input": f"question {exchange}"}, {"response": f"answer {exchange}"})
+    return memory
+
+
+def test_buffer_sends_the_whole_history():
+    assert len(make_memory(6).buffer) == 12
+
+
+def test_window_sends_the_last_exchanges():
+    memory = make_memory(6, strategy="window", window=2)
+
+    assert [message.content for message in memory.buffer] == ["question 4", "answer 4", "question 5", "answer 5"]
+    assert len(memory.chat_memory.messages) == 12
+
+
+def test_max_tokens_drops_the_oldest_messages():
+    messages = [HumanMessage(content="a" * 40), AIMessage(content="b" * 8), HumanMessage(content="c" * 8)]
+
+    assert truncate_messages(messages, 5) == messages[1:]
+    assert truncate_messages(messages, 100) == messages
+    assert make_memory(6, max_tokens=1).buffer == []
+
+
+def test_summary_replaces_messages_that_left_the_window():
+    summaries = []
+
+    def summarize(summary, messages):
+        summaries.append([message.content for message in messages])
+        return f"{summary}+{len(messages)}"
+
+    memory = make_memory(5, strategy="summary", window=2, summarize=summarize)
+
+    # The summary is extended once 2 * window exchanges are pending, keeping the last window of them verbatim.
+    assert summaries == [["question 0", "answer 0", "question 1", "answer 1"]]
+    assert memory.summarized == 4
+    assert isinstance(memory.buffer[0], SystemMessage)
+    assert memory.buffer[0].content.endswith("+4")
+    assert [message.content for message in memory.buffer[1:3]] == ["question 2", "answer 2"]
+    assert len(memory.buffer) == 7
+
+
+def test_summary_memory_bounds_the_prompts_of_a_conversation():
+    config = ConversationsGeneratorConfig(openai_api_key="",
+                                          agent1="You are a tourist.",
+                                          agent2="You are a guide.",
+                                          initial_utterances=["Hello."],
+                                          lengths=[6],
+                                          model="mock|latency=0,tokens=10",
+                                          model_agent_one=None,
+                                          model_agent_two=None,
+                                          memory="summary",
+                                          memory_window=1)
+    generator = ConversationsGenerator(config)
+    conversation = generator.start_conversation(generator.options_configs[0])
+    while not conversation.finished:
+        generator.take_turn(conversation)
+
+    memory = conversation.chains["agent1"].memory
+    assert len(conversation.utterances) == 12
+    assert memory.summary
+    assert len(memory.buffer) <= 1 + 4 * memory.window
+
+
+def test_unsupported_memory_strategy():
+    with pytest.raises(ValueError, match="memory strategy"):
+        ConversationsGenerator(ConversationsGeneratorConfig(openai_api_key="",
+                                                            agent1="You are a tourist.",
+                                                            agent2="You are a guide.",
+                                                            initial_utterances=["Hello."],
+                                                            model="mock|instant",
+                                                            model_agent_one=None,
+                                                            model_agent_two=None,
+                                                            memory="everything"))
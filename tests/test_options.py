@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+
+from datasetGPT.base import OptionsCombinations
+
+
+def make_combinations(order=None):
+    return OptionsCombinations(["color", "size", "sample_id"], [["red", "blue"], ["S", "M", "L"], [0, 1]], order)
+
+
+def test_indexing_matches_product():
+    combinations = make_combinations()
+    expected = [dict(zip(combinations.keys, values)) for values in itertools.product(*combinations.values)]
+
+    assert len(combinations) == 12
+    assert [combinations[index] for index in range(len(combinations))] == expected
+    assert list(combinations) == expected
+    assert combinations[-1] == expected[-1]
+    assert combinations[2:5] == expected[2:5]
+    with pytest.raises(IndexError):
+        combinations[12]
+
+
+def test_order_sets_the_fastest_varying_option():
+    combinations = make_combinations(["sample_id", "color", "size"])
+
+    assert [combinations[index]["size"] for index in range(3)] == ["S", "M", "L"]
+    assert list(combinations) == [combinations[index] for index in range(len(combinations))]
+
+
+def test_large_grid_is_not_materialized():
+    combinations = OptionsCombinations(["a", "b", "c"], [range(1000), range(1000), range(1000)])
+
+    assert len(combinations) == 10 ** 9
+    assert combinations[10 ** 9 - 1] == {"a": 999, "b": 999, "c": 999}
+
+
+@pytest.mark.parametrize("num_shards", [1, 3, 5, 12, 13])
+def test_shards_partition_the_combinations(num_shards):
+    combinations = make_combinations()
+    shards = [combinations.shard(shard_index, num_shards) for shard_index in range(num_shards)]
+
+    assert [index for shard in shards for index in shard] == list(range(len(combinations)))
+    assert max(len(shard) for shard in shards) - min(len(shard) for shard in shards) <= 1
+
+
+def test_invalid_shard():
+    with pytest.raises(ValueError):
+        make_combinations().shard(3, 3)
+
+
+def test_fingerprint_depends_on_values_and_order():
+    fingerprint = make_combinations().fingerprint()
+
+    assert make_combinations().fingerprint() == fingerprint
+    assert make_combinations(["sample_id", "color", "size"]).fingerprint() != fingerprint
+    assert OptionsCombinations(["color"], [["red"]]).fingerprint() != fingerprint
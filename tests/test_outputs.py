@@ -0,0 +1,166 @@
+import json
+import asyncio
+
+import pytest
+
+from click.testing import CliRunner
+
+from datasetGPT.cli import datasetGPT
+from datasetGPT.outputs import DatasetWriter, detect_output_options, open_reader
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def read_lines(path, compression="none"):
+    with open_reader(str(path), compression) as reader:
+        return [json.loads(line) for line in reader]
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_stream_is_moved_to_its_path_on_close(tmp_path, background):
+    path = tmp_path / "out.jsonl"
+    with DatasetWriter(str(path), output_format="jsonl", background=background) as dataset_writer:
+        for index in range(5):
+            dataset_writer.save_intermediate_result({"output": str(index)}, index)
+        dataset_writer.stop_writer()
+        dataset_writer.flush()
+
+        assert not path.exists()
+        assert len(read_lines(tmp_path / "out.jsonl.part")) == 5
+
+    assert not (tmp_path / "out.jsonl.part").exists()
+    assert [item["output"] for item in read_lines(path)] == ["0", "1", "2", "3", "4"]
+    assert (tmp_path / "out.jsonl.manifest").read_text() == "0\n1\n2\n3\n4\n"
+
+
+def test_failed_run_keeps_its_partial_file(tmp_path):
+    path = tmp_path / "out.jsonl"
+    with pytest.raises(RuntimeError):
+        with DatasetWriter(str(path), output_format="jsonl") as dataset_writer:
+            dataset_writer.save_intermediate_result({"output": "0"}, 0)
+            raise RuntimeError()
+
+    assert not path.exists()
+    assert read_lines(tmp_path / "out.jsonl.part") == [{"output": "0"}]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_stream_is_detected(tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    path = tmp_path / "out.jsonl"
+    with DatasetWriter(str(path), output_format="jsonl", compression=compression) as dataset_writer:
+        dataset_writer.save_intermediate_result({"output": "0"}, 0)
+
+    assert detect_output_options(str(path)) == (True, "jsonl", compression)
+    assert read_lines(path, compression) == [{"output": "0"}]
+
+
+def test_items_are_saved_to_indexed_files(tmp_path):
+    dataset_writer = DatasetWriter(str(tmp_path / "items"))
+    dataset_writer.save_intermediate_result({"output": "7"}, 7)
+
+    assert json.loads((tmp_path / "items" / "7.json").read_text()) == {"output": "7"}
+
+
+def test_resume_drops_unrecorded_lines(tmp_path):
+    path = tmp_path / "out.jsonl.gz"
+    dataset_writer = DatasetWriter(str(path), output_format="jsonl", compression="gzip", fsync_interval=1)
+    for index in range(3):
+        dataset_writer.save_intermediate_result({"output": str(index)}, index)
+    dataset_writer.stream_file.close()
+    # The last item was written, but the run stopped before it was recorded.
+    (tmp_path / "out.jsonl.gz.manifest").write_text("0\n1\n")
+
+    with DatasetWriter(str(path), output_format="jsonl", compression="gzip", resume=True) as resumed_writer:
+        assert resumed_writer.manifest.completed == {0, 1}
+        resumed_writer.save_intermediate_result({"output": "2"}, 2)
+
+    assert [item["output"] for item in read_lines(path, "gzip")] == ["0", "1", "2"]
+
+
+def test_resumed_run_generates_only_missing_items(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=["mock|latency=0"],
+                                  num_samples=2,
+                                  options=[("color", "red"), ("color", "green"), ("color", "blue")])
+
+    dataset_writer = DatasetWriter(path, output_format="jsonl", fsync_interval=1)
+    generator = TextsGenerator(config)
+    prepare_dataset(generator, dataset_writer)
+    generator.indices = generator.indices[:4]
+    asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=2))
+    dataset_writer.flush()
+    dataset_writer.stream_file.close()
+
+    with DatasetWriter(path, output_format="jsonl", resume=True) as resumed_writer:
+        generator = TextsGenerator(config)
+        assert prepare_dataset(generator, resumed_writer) == 2
+        asyncio.run(agenerate_dataset(generator, resumed_writer, concurrency=2))
+
+    items = read_lines(path)
+    assert len(items) == 6
+    assert sorted((item["color"], item["sample_id"]) for item in items) == [
+        (color, sample_id) for color in ["blue", "green", "red"] for sample_id in range(2)]
+
+
+def test_writes_are_reported_from_the_writer_thread(tmp_path):
+    written = []
+    dataset_writer = DatasetWriter(str(tmp_path / "out.jsonl"), output_format="jsonl", background=True)
+    dataset_writer.on_write = lambda index, seconds: written.append(index)
+    for index in range(10):
+        dataset_writer.save_intermediate_result({"output": str(index)}, index)
+    dataset_writer.close()
+
+    assert sorted(written) == list(range(10))
+
+
+def test_writer_thread_error_is_raised(tmp_path):
+    dataset_writer = DatasetWriter(str(tmp_path / "out.jsonl"), output_format="jsonl", background=True)
+    dataset_writer.save_intermediate_result({"output": object()}, 0)
+
+    with pytest.raises(TypeError):
+        dataset_writer.close()
+
+
+@pytest.mark.parametrize("name,single_file", [("items", False), ("out.json", True), ("out.jsonl", True)])
+def test_previous_output_is_not_written_over(tmp_path, name, single_file):
+    path = str(tmp_path / name)
+    output_format = "jsonl" if name.endswith(".jsonl") else "json"
+    with DatasetWriter(path, single_file, output_format) as dataset_writer:
+        dataset_writer.save_intermediate_result({"output": "0"}, 0)
+
+    with pytest.raises(ValueError, match="already exists"):
+        DatasetWriter(path, single_file, output_format)
+
+    with DatasetWriter(path, single_file, output_format, overwrite=True) as dataset_writer:
+        dataset_writer.save_intermediate_result({"output": "1"}, 1)
+    assert DatasetWriter(path, single_file, output_format, resume=True).manifest.indices == [1]
+
+
+def test_overwrite_removes_the_items_of_the_previous_run(tmp_path):
+    (tmp_path / "items").mkdir()
+    (tmp_path / "items" / "notes.txt").write_text("")
+    with pytest.raises(ValueError, match="already exists"):
+        DatasetWriter(str(tmp_path / "items"))
+
+    dataset_writer = DatasetWriter(str(tmp_path / "items"), overwrite=True)
+    for index in range(3):
+        dataset_writer.save_intermediate_result({"output": str(index)}, index)
+    DatasetWriter(str(tmp_path / "items"), overwrite=True).save_intermediate_result({"output": "5"}, 5)
+
+    assert sorted(path.name for path in (tmp_path / "items").iterdir()) == [".manifest", "5.json", "notes.txt"]
+    with pytest.raises(ValueError):
+        DatasetWriter(str(tmp_path / "items"), resume=True, overwrite=True)
+
+
+def test_cli_refuses_to_write_over_a_previous_run(tmp_path):
+    arguments = ["texts", "-p", "Describe the color red.", "-b", "mock|instant", "--format", "jsonl",
+                 "-f", str(tmp_path / "out.jsonl")]
+    assert CliRunner().invoke(datasetGPT, arguments).exit_code == 0
+
+    result = CliRunner().invoke(datasetGPT, arguments)
+    assert result.exit_code == 1
+    assert "already exists" in result.output
+    assert CliRunner().invoke(datasetGPT, [*arguments, "--overwrite"]).exit_code == 0
@@ -0,0 +1,85 @@
+import pytest
+
+from datasetGPT.conversations import ConversationsGenerator, ConversationsGeneratorConfig
+from datasetGPT.prefixes import PrefixTracker, get_constant_prefix, get_placeholder_order, get_placeholder_template
+
+AGENT1 = "You are a {role} visiting {city}. Ask about {topic}."
+
+
+def make_generator(system_layout):
+    return ConversationsGenerator(ConversationsGeneratorConfig(openai_api_key="",
+                                                             agent1=AGENT1,
+                                                             agent2="You are a guide in {city}.",
+                                                             initial_utterances=["Hello."],
+                                                             lengths=[1],
+                                                             num_samples=2,
+                                                             options=[("role", "tourist"),
+                                                                      ("role", "student"),
+                                                                      ("city", "Rome"),
+                                                                      ("city", "Oslo"),
+                                                                      ("topic", "food")],
+                                                             model="mock|latency=0,tokens=5",
+                                                             model_agent_one=None,
+                                                             model_agent_two=None,
+                                                             system_layout=system_layout))
+
+
+def test_template_prefixes():
+    assert get_constant_prefix(AGENT1) == "You are a "
+    assert get_constant_prefix("No placeholders.") == "No placeholders."
+    assert get_placeholder_template(AGENT1) == "You are a <role> visiting <city>. Ask about <topic>."
+    assert get_placeholder_order([AGENT1, "In {city} on {day}."]) == ["role", "city", "topic", "day"]
+
+
+def test_prefix_layout_puts_option_values_after_a_constant_prefix():
+    generator = make_generator("prefix")
+    config = generator.options_configs[0]
+    system_message = generator.format_system_message("agent1", config)
+
+    assert system_message == (f"You are a <role> visiting <city>. Ask about <topic>.\n\n"
+                              f"city: {config['city']}\nrole: {config['role']}\ntopic: food")
+    assert generator.format_system_message("agent1", generator.options_configs[-1]).startswith(
+        generator.system_prefixes["agent1"])
+
+
+def test_inline_layout_formats_the_template():
+    generator = make_generator("inline")
+    config = generator.options_configs[0]
+
+    assert generator.format_system_message("agent1", config) == AGENT1.format(**config)
+    assert generator.system_prefixes["agent1"] == "You are a "
+
+
+def test_prefix_layout_orders_combinations_by_placeholders():
+    generator = make_generator("prefix")
+
+    assert generator.options_configs.order[-1] == "sample_id"
+    assert generator.options_configs.order.index("role") < generator.options_configs.order.index("city")
+    assert [generator.options_configs[index]["sample_id"] for index in range(2)] == [0, 1]
+
+
+def test_tracker_counts_requests_within_the_cache_time():
+    tracker = PrefixTracker(cache_seconds=60)
+
+    assert not tracker.record("You are a tourist.", "mock|instant")
+    assert tracker.record("You are a tourist.", "mock|instant")
+    assert not tracker.record("You are a tourist.", "mock|fast")
+    [report] = tracker.get_report()
+    assert (report["requests"], report["hits"]) == (3, 1)
+    assert report["reused_tokens"] == report["tokens"]
+    assert PrefixTracker(cache_seconds=0).record("A", "mock|instant") is False
+
+
+def test_prefix_layout_reuses_prefixes_across_conversations():
+    generator = make_generator("prefix")
+    for index in range(len(generator.options_configs)):
+        generator.generate_item_from_config(generator.options_configs[index])
+
+    stats = list(generator.prefix_tracker.stats.values())
+    assert len(stats) == 2
+    assert all(prefix_stats.requests == 8 and prefix_stats.hits == 7 for prefix_stats in stats)
+
+
+def test_unsupported_system_layout():
+    with pytest.raises(ValueError, match="system message layout"):
+        make_generator("suffix")
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from datasetGPT.mock import MockRateLimitError, MockServerError
+from datasetGPT.ratelimit import (AIMDController, PrioritySlotPool, RetryPolicy, TokenBucket, is_retryable,
+                                  is_throttling)
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(per_minute=60, burst_seconds=2)
+
+    assert bucket.reserve(1) == 0.0
+    assert bucket.reserve(1) == 0.0
+    assert bucket.get_delay(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(3) == pytest.approx(3.0, abs=0.05)
+
+
+def test_token_bucket_admits_requests_larger_than_its_capacity():
+    bucket = TokenBucket(per_minute=600, burst_seconds=1)
+
+    assert bucket.reserve(30) == pytest.approx(2.0, abs=0.05)
+
+
+def test_retry_delays_grow_and_are_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0)
+
+    for attempt in range(10):
+        assert 0 <= policy.get_delay(attempt) <= min(5.0, 2 ** attempt)
+
+
+def test_errors_are_classified():
+    assert is_throttling(MockRateLimitError()) and is_retryable(MockRateLimitError())
+    assert is_retryable(MockServerError()) and not is_throttling(MockServerError())
+    assert not is_retryable(ValueError())
+
+
+def test_aimd_halves_once_per_congestion_and_grows_additively():
+    controller = AIMDController(max_limit=16, cooldown=60)
+
+    controller.on_throttle()
+    controller.on_throttle()
+    assert controller.concurrency == 8
+
+    # About one more request per window of successful requests.
+    for _ in range(10):
+        controller.on_success()
+    assert controller.concurrency == 9
+
+    for _ in range(1000):
+        controller.on_success()
+    assert controller.concurrency == 16
+
+
+def test_aimd_never_drops_below_its_minimum():
+    controller = AIMDController(max_limit=4, min_limit=2, cooldown=0)
+    for _ in range(5):
+        controller.on_throttle()
+
+    assert controller.concurrency == 2
+
+
+def test_slots_go_to_the_highest_priority_waiter():
+    async def run():
+        pool = PrioritySlotPool(1)
+        order = []
+        await pool.acquire()
+
+        async def wait(name, priority):
+            await pool.acquire(priority)
+            order.append(name)
+            pool.release()
+
+        waiters = [asyncio.create_task(wait("low", 0)), asyncio.create_task(wait("high", 1))]
+        await asyncio.sleep(0)
+        pool.release()
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(run()) == ["high", "low"]
@@ -0,0 +1,161 @@
+import pytest
+
+from langchain.schema import AIMessage, ChatGeneration, ChatResult, HumanMessage
+
+from datasetGPT.mock import MockServerError
+from datasetGPT.routedchat import RoutedChatModel
+from datasetGPT.router import Endpoint, Router, parse_endpoint
+
+
+class InvalidRequestError(Exception):
+    status_code = 400
+
+
+class RevokedKeyError(Exception):
+    status_code = 401
+
+
+def router_error():
+    raise MockServerError("Mock server error.")
+
+
+def make_router(count=2, **kwargs):
+    return Router("pool", [Endpoint("mock", f"fast{position}") for position in range(count)], **kwargs)
+
+
+def test_parse_endpoint():
+    endpoint = parse_endpoint("openai|gpt-3.5-turbo|api_base=http://localhost:8000/v1|api_key=sk-abcd1234|rpm=60")
+
+    assert endpoint.backend_str == "openai|gpt-3.5-turbo"
+    assert endpoint.requests_per_minute == 60.0
+    assert endpoint.description == "openai|gpt-3.5-turbo at http://localhost:8000/v1 with key ...1234"
+    with pytest.raises(ValueError):
+        parse_endpoint("openai|gpt-3.5-turbo|region=eu")
+
+
+def test_failed_request_fails_over():
+    router = make_router()
+    models = []
+
+    def request(endpoint):
+        models.append(endpoint.model)
+        if endpoint.model == "fast0":
+            raise MockServerError("Mock server error.")
+        return endpoint.model
+
+    assert router.call(1, request) == "fast1"
+    assert models == ["fast0", "fast1"]
+    assert [report["errors"] for report in router.get_report()] == [1, 0]
+
+
+def test_last_error_is_raised_once_every_endpoint_failed():
+    router = make_router()
+
+    def request(endpoint):
+        raise MockServerError(endpoint.model)
+
+    with pytest.raises(MockServerError, match="fast1"):
+        router.call(1, request)
+
+
+def test_invalid_request_does_not_fail_over():
+    router = make_router()
+    models = []
+
+    def request(endpoint):
+        models.append(endpoint.model)
+        raise InvalidRequestError()
+
+    with pytest.raises(InvalidRequestError):
+        router.call(1, request)
+    assert len(models) == 1
+    assert all(report["errors"] == 0 for report in router.get_report())
+
+
+def test_circuit_opens_after_consecutive_failures():
+    router = make_router(failure_threshold=2, cooldown=60)
+    for _ in range(2):
+        router.call(1, lambda endpoint: None if endpoint.model == "fast1" else router_error())
+
+    assert [report["available"] for report in router.get_report()] == [False, True]
+    for _ in range(3):
+        assert router.call(1, lambda endpoint: endpoint.model) == "fast1"
+
+
+def test_endpoint_error_opens_circuit_at_once():
+    router = make_router(cooldown=60)
+
+    def request(endpoint):
+        if endpoint.model == "fast0":
+            raise RevokedKeyError()
+        return endpoint.model
+
+    assert router.call(1, request) == "fast1"
+    assert [report["available"] for report in router.get_report()] == [False, True]
+
+
+def test_success_closes_circuit():
+    router = make_router(count=1, failure_threshold=1, cooldown=0)
+    with pytest.raises(MockServerError):
+        router.call(1, lambda endpoint: router_error())
+
+    # The half-open endpoint is probed again once its cooldown ended.
+    assert router.call(1, lambda endpoint: endpoint.model) == "fast0"
+    assert router.stats[0].consecutive_failures == 0
+
+
+def test_request_is_not_failed_over_when_it_cannot_be_repeated():
+    router = make_router()
+    models = []
+
+    def request(endpoint):
+        models.append(endpoint.model)
+        raise MockServerError("Mock server error.")
+
+    with pytest.raises(MockServerError):
+        router.call(1, request, lambda: False)
+    assert len(models) == 1
+
+
+class StreamingModel:
+    def __init__(self, name, tokens_before_error):
+        self.name = name
+        self.tokens_before_error = tokens_before_error
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        for _ in range(self.tokens_before_error or 0):
+            run_manager.on_llm_new_token(self.name)
+        if self.tokens_before_error is not None:
+            raise MockServerError("Mock server error.")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.name))])
+
+
+class StreamingBackends:
+    def __init__(self, tokens_before_error):
+        self.tokens_before_error = tokens_before_error
+
+    def get_chat_model(self, model, temperature, api_key, streaming, api_base):
+        return StreamingModel(model, self.tokens_before_error if model == "mock|fast0" else None)
+
+
+class TokenCollector:
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.append(token)
+
+
+@pytest.mark.parametrize("tokens_before_error", [0, 2])
+def test_stream_fails_over_only_before_its_first_token(tokens_before_error):
+    model = RoutedChatModel(router=make_router(), backends=StreamingBackends(tokens_before_error), streaming=True)
+    collector = TokenCollector()
+
+    if tokens_before_error:
+        with pytest.raises(MockServerError):
+            model._generate([HumanMessage(content="Hi")], run_manager=collector)
+        assert collector.tokens == ["mock|fast0"] * tokens_before_error
+    else:
+        result = model._generate([HumanMessage(content="Hi")], run_manager=collector)
+        assert result.generations[0].message.content == "mock|fast1"
+        assert collector.tokens == []
@@ -0,0 +1,75 @@
+from collections import Counter
+
+import pytest
+
+from datasetGPT.base import OptionsCombinations
+from datasetGPT.sampling import sample_options
+
+
+def make_combinations(num_samples=2):
+    return OptionsCombinations(["tone", "topic", "length", "sample_id"],
+                               [["formal", "casual", "funny"], [f"topic{i}" for i in range(20)], [50, 100, 200, 400],
+                                list(range(num_samples))])
+
+
+def get_sampled_combinations(combinations, indices):
+    return {tuple(value for key, value in combinations[index].items() if key != "sample_id") for index in indices}
+
+
+def test_grid_selects_every_combination():
+    combinations = make_combinations()
+
+    assert sample_options(combinations) == range(len(combinations))
+
+
+@pytest.mark.parametrize("strategy", ["random", "stratified"])
+def test_sample_keeps_every_sample_of_its_combinations(strategy):
+    combinations = make_combinations()
+    indices = sample_options(combinations, strategy, sample_size=30, seed=1)
+
+    assert indices == sorted(indices)
+    assert len(indices) == len(set(indices)) == 60
+    assert len(get_sampled_combinations(combinations, indices)) == 30
+
+
+@pytest.mark.parametrize("strategy", ["random", "stratified", "cover"])
+def test_sample_is_reproducible(strategy):
+    combinations = make_combinations()
+
+    assert sample_options(combinations, strategy, 20, seed=3) == sample_options(combinations, strategy, 20, seed=3)
+    assert sample_options(combinations, strategy, 20, seed=3) != sample_options(combinations, strategy, 20, seed=4)
+
+
+def test_stratified_sample_spreads_every_option():
+    combinations = make_combinations(num_samples=1)
+    indices = sample_options(combinations, "stratified", sample_size=20)
+
+    assert len({combinations[index]["topic"] for index in indices}) == 20
+    assert max(Counter(combinations[index]["length"] for index in indices).values()) == 5
+
+
+@pytest.mark.parametrize("cover_k", [1, 2])
+def test_cover_sample_covers_every_value(cover_k):
+    combinations = make_combinations(num_samples=1)
+    indices = sample_options(combinations, "cover", cover_k=cover_k)
+
+    for key in ["tone", "topic", "length"]:
+        counts = Counter(combinations[index][key] for index in indices)
+        assert len(counts) == len(combinations.values[combinations.keys.index(key)])
+        assert min(counts.values()) >= cover_k
+    assert len(indices) <= 20 * cover_k + 1
+
+
+def test_sample_larger_than_the_grid_selects_everything():
+    combinations = make_combinations()
+
+    assert sample_options(combinations, "random", sample_size=1000) == range(len(combinations))
+
+
+def test_invalid_sampling():
+    combinations = make_combinations()
+
+    with pytest.raises(ValueError):
+        sample_options(combinations, "random")
+    with pytest.raises(ValueError):
+        sample_options(combinations, "halton", 10)
@@ -0,0 +1,71 @@
+import json
+import asyncio
+
+import pytest
+
+from datasetGPT.outputs import DatasetWriter, open_reader
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.shards import get_shard_path, merge_outputs, parse_shard
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+CONFIG = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                              backends=["mock|instant"],
+                              num_samples=2,
+                              options=[("color", "red"), ("color", "green"), ("color", "blue")])
+
+
+def generate(path, shard=None):
+    generator = TextsGenerator(CONFIG)
+    if shard is not None:
+        generator.select_shard(*shard)
+    with DatasetWriter(path, output_format="jsonl") as dataset_writer:
+        prepare_dataset(generator, dataset_writer)
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=2))
+
+
+def read_combinations(path):
+    with open_reader(path) as reader:
+        return [(item["color"], item["sample_id"]) for item in map(json.loads, reader)]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for shard_str in ["4/4", "-1/4", "0/0", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard_str)
+
+
+def test_shard_path_numbers_the_dataset_path():
+    assert get_shard_path("out/colors.jsonl.gz", 1, 4) == "out/colors-00001-of-00004.jsonl.gz"
+    assert get_shard_path("out/colors/", 0, 2) == "out/colors-00000-of-00002"
+
+
+def test_merged_shards_are_ordered_by_combination(tmp_path):
+    path = str(tmp_path / "colors.jsonl")
+    shard_paths = [get_shard_path(path, shard_index, 3) for shard_index in range(3)]
+    # Shards finish in any order, and the merge puts them back in order.
+    for shard_index in [2, 0, 1]:
+        generate(shard_paths[shard_index], (shard_index, 3))
+
+    with DatasetWriter(path, output_format="jsonl") as dataset_writer:
+        assert merge_outputs(shard_paths[::-1], dataset_writer) == 6
+
+    assert read_combinations(path) == [(color, sample_id) for color in ["red", "green", "blue"] for sample_id in range(2)]
+    assert (tmp_path / "colors.jsonl.manifest").read_text().splitlines()[1:] == [str(index) for index in range(6)]
+
+
+def test_overlapping_outputs_are_not_merged(tmp_path):
+    shard_path = str(tmp_path / "shard.jsonl")
+    generate(shard_path, (0, 2))
+
+    with pytest.raises(ValueError, match="overlapping"):
+        with DatasetWriter(str(tmp_path / "merged.jsonl"), output_format="jsonl") as dataset_writer:
+            merge_outputs([shard_path, shard_path], dataset_writer)
+
+
+def test_unfinished_output_is_not_merged(tmp_path):
+    shard_path = tmp_path / "shard.jsonl"
+    (tmp_path / "shard.jsonl.part").write_text("")
+
+    with pytest.raises(ValueError, match="not finished"):
+        merge_outputs([str(shard_path)], DatasetWriter(str(tmp_path / "merged.jsonl"), output_format="jsonl"))
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from datasetGPT.conversations import ConversationsGenerator, ConversationsGeneratorConfig
+from datasetGPT.streaming import EndPhraseReached, StreamingHandler
+
+
+def stream(handler, tokens):
+    for token in tokens:
+        handler.on_llm_new_token(token)
+
+
+def test_stream_stops_at_end_phrase_split_across_tokens():
+    handler = StreamingHandler("Goodbye!")
+
+    with pytest.raises(EndPhraseReached) as end:
+        stream(handler, ["It was nice. Go", "od", "by", "e! And then", " more"])
+    assert end.value.text == "It was nice. Goodbye!"
+    assert handler.first_token_seconds is not None
+
+
+def test_stream_without_end_phrase_is_collected():
+    handler = StreamingHandler()
+    stream(handler, ["Goodbye!", " Still", " talking"])
+
+    assert handler.text == "Goodbye! Still talking"
+
+
+def test_conversation_is_cut_off_at_end_phrase():
+    random.seed(0)
+    config = ConversationsGeneratorConfig(openai_api_key="",
+                                          agent1="You are a tourist.",
+                                          agent2="You are a guide.",
+                                          initial_utterances=["Hello."],
+                                          interruption="end_phrase",
+                                          end_phrase="lorem",
+                                          lengths=[20],
+                                          model="mock|latency=0,tokens=40",
+                                          model_agent_one=None,
+                                          model_agent_two=None,
+                                          streaming=True)
+
+    for item in ConversationsGenerator(config):
+        texts = [text for _, text in item["utterances"]]
+        assert texts[-1].endswith("lorem")
+        assert all("lorem" not in text for text in texts[:-1])
+        assert len(texts) < 40
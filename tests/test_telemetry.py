@@ -0,0 +1,62 @@
+import json
+import asyncio
+
+from datasetGPT.outputs import DatasetWriter
+from datasetGPT.runner import agenerate_dataset, prepare_dataset
+from datasetGPT.telemetry import Instrumentation
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def make_generator(instrumentation, num_samples=5):
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=["mock|latency=0"],
+                                  num_samples=num_samples,
+                                  options=[("color", "red"), ("color", "blue")])
+    generator = TextsGenerator(config)
+    generator.instrumentation = instrumentation
+    return generator
+
+
+def test_iteration_without_writer_keeps_no_records(tmp_path):
+    instrumentation = Instrumentation(str(tmp_path / "metrics.jsonl"))
+    items = list(make_generator(instrumentation, num_samples=50))
+    instrumentation.close()
+
+    assert len(items) == 100
+    assert instrumentation.unwritten == {}
+    assert instrumentation.items == 100
+    assert len((tmp_path / "metrics.jsonl").read_text().splitlines()) == 100
+
+
+def test_records_are_emitted_once_their_items_are_written(tmp_path):
+    instrumentation = Instrumentation(str(tmp_path / "metrics.jsonl"), str(tmp_path / "metrics.prom"))
+    generator = make_generator(instrumentation)
+    with DatasetWriter(str(tmp_path / "out.jsonl"), output_format="jsonl", background=True) as dataset_writer:
+        prepare_dataset(generator, dataset_writer)
+        asyncio.run(agenerate_dataset(generator, dataset_writer, concurrency=2))
+    instrumentation.close()
+
+    records = [json.loads(line) for line in (tmp_path / "metrics.jsonl").read_text().splitlines()]
+    # The samples of a prompt are produced by one request, which gets one record.
+    assert sorted(index for record in records for index in record["indices"]) == list(range(10))
+    assert all(record["completion_tokens"] > 0 and record["llm_calls"] for record in records)
+    assert instrumentation.unwritten == {}
+
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert "datasetgpt_items_total 10\n" in prometheus
+    assert "datasetgpt_write_seconds_count{} 10\n" in prometheus
+    assert 'datasetgpt_request_seconds_count{backend="mock|latency=0"} 2\n' in prometheus
+
+
+def test_failed_item_is_recorded(tmp_path):
+    instrumentation = Instrumentation(str(tmp_path / "metrics.jsonl"))
+    try:
+        with instrumentation.measure([0]):
+            raise ValueError("failed")
+    except ValueError:
+        pass
+    instrumentation.close()
+
+    record = json.loads((tmp_path / "metrics.jsonl").read_text())
+    assert record["indices"] == [0] and "failed" in record["error"]
+    assert instrumentation.errors == 1
@@ -0,0 +1,62 @@
+import pytest
+
+from click.testing import CliRunner
+
+from datasetGPT.cli import datasetGPT
+from datasetGPT.conversations import ConversationsGenerator, ConversationsGeneratorConfig
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def make_texts_generator(prompt, options):
+    return TextsGenerator(TextsGeneratorConfig(prompt=prompt, backends=["mock|instant"], options=options))
+
+
+def make_conversations_generator(agent1, options):
+    return ConversationsGenerator(ConversationsGeneratorConfig(openai_api_key="",
+                                                               agent1=agent1,
+                                                               agent2="You are a guide.",
+                                                               initial_utterances=["Hello."],
+                                                               options=options,
+                                                               model="mock|instant",
+                                                               model_agent_one=None,
+                                                               model_agent_two=None))
+
+
+def test_prompt_is_parsed_once_and_formatted():
+    generator = make_texts_generator("Describe {color} in {style}. Use {{braces}}.",
+                                     [("color", "red"), ("style", "verse")])
+    text_config = generator.options_configs[0]
+
+    assert generator.input_variables == ["color", "style"]
+    assert generator.format_prompt(text_config) == ({"color": "red", "style": "verse"},
+                                                    "Describe red in verse. Use {braces}.")
+
+
+def test_prompt_placeholder_without_option_is_rejected():
+    with pytest.raises(ValueError, match="placeholders without options: style"):
+        make_texts_generator("Describe {color} in {style}.", [("color", "red")])
+
+
+def test_option_unused_by_the_prompt_is_rejected():
+    with pytest.raises(ValueError, match="Options not used in the prompt: size"):
+        make_texts_generator("Describe {color}.", [("color", "red"), ("size", "S")])
+
+
+def test_system_prompt_placeholder_without_option_is_rejected():
+    with pytest.raises(ValueError, match="placeholders without options: role"):
+        make_conversations_generator("You are a {role}.", [])
+
+
+def test_option_unused_by_the_system_prompts_is_rejected():
+    with pytest.raises(ValueError, match="Options not used in the system prompts: city"):
+        make_conversations_generator("You are a {role}.", [("role", "tourist"), ("city", "Rome")])
+
+
+def test_cli_reports_invalid_placeholders_before_writing(tmp_path):
+    path = tmp_path / "out.jsonl"
+    result = CliRunner().invoke(datasetGPT, ["texts", "-p", "Describe {color} in {style}.", "-b", "mock|instant",
+                                             "-o", "color", "red", "-f", str(path)])
+
+    assert result.exit_code == 1
+    assert "placeholders without options: style" in result.output
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,53 @@
+from datasetGPT.texts import TextsGenerator, TextsGeneratorConfig
+
+
+def make_generator(backends, **kwargs):
+    config = TextsGeneratorConfig(prompt="Describe the color {color}.",
+                                  backends=backends,
+                                  num_samples=2,
+                                  temperatures=[0, 1],
+                                  options=[("color", "red"), ("color", "blue")],
+                                  **kwargs)
+    return TextsGenerator(config)
+
+
+def take_batches(generator):
+    batches = []
+    while True:
+        batch = generator.next_batch()
+        if not batch:
+            return batches
+        batches.append([generator.options_configs[index] for index in batch])
+
+
+def test_samples_of_a_prompt_are_batched():
+    batches = take_batches(make_generator(["mock|instant"]))
+
+    assert len(batches) == 4
+    for batch in batches:
+        assert [config["sample_id"] for config in batch] == [0, 1]
+        assert len({(config["temperature"], config["color"]) for config in batch}) == 1
+
+
+def test_mixed_backends_are_not_batched():
+    generator = make_generator(["mock|instant", "cohere|command"])
+    batches = take_batches(generator)
+
+    assert generator.options_configs.order[-1] != "sample_id"
+    assert all(len(batch) == 1 for batch in batches)
+    assert len(batches) == 16
+
+
+def test_batching_can_be_disabled():
+    batches = take_batches(make_generator(["mock|instant"], batch_samples=False))
+
+    assert all(len(batch) == 1 for batch in batches)
+
+
+def test_batched_items_keep_their_own_options():
+    generator = make_generator(["mock|latency=0"])
+    items = list(generator)
+
+    assert len(items) == 8
+    assert sorted((item["temperature"], item["color"], item["sample_id"]) for item in items) == sorted(
+        (config["temperature"], config["color"], config["sample_id"]) for config in generator.options_configs)